@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the per-file path building and classification hot path
+
+Usage:
+  python3 benchmarks/bench_paths.py run [--sizes 10000,100000] [--save NAME]
+  python3 benchmarks/bench_paths.py compare BASELINE [CURRENT] [--threshold 10]
+  python3 benchmarks/bench_paths.py list
+"""
+import argparse
+import datetime as dt
+import gc
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "scripts"))
+
+import ghuploader  # noqa: E402
+import ghu_library  # noqa: E402
+
+SYNTHETIC_ROOT = "/Volumes/Bench"
+GENRES = ["Metal", "Rock", "Jazz", "Electronic", "Hip-Hop", "Classical"]
+WORDS = ["Fragile", "Mind", "Deeper", "Into", "Greater", "Pain", "Trading", "Pieces", "Blasted", "Rotting",
+         "Off", "Represent", "Destination", "Extinction", "Night", "Black", "Iron", "Glass", "Echo", "Velvet"]
+TAGS = ["", "", "", " [Remastered]", " (Live)", " (feat. Someone)"]
+# Naming without content hashing or remote lookups (hashing has its own cache, see ghu_hashing)
+BENCH_CFG = {"dedup_strategy": "none", "organize_by_artist": False, "use_image_subfolders": True}
+
+def title(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+def music_paths(rng, count):
+    """Genre/Letter/Artist/YYYY - Album/NN. Track.ext plus cover.jpg per album and logo/artist images."""
+    paths = []
+    while len(paths) < count:
+        artist = title(rng, rng.randint(1, 3))
+        genre = rng.choice(GENRES)
+        artist_dir = f"{SYNTHETIC_ROOT}/Audio/{genre}/{artist[0]}/{artist}"
+        paths.append(f"{artist_dir}/logo.png")
+        paths.append(f"{artist_dir}/artist.jpg")
+        for _ in range(rng.randint(1, 6)):
+            album_dir = f"{artist_dir}/{rng.randint(1965, 2025)} - {title(rng, rng.randint(1, 4))}"
+            paths.append(f"{album_dir}/cover.jpg")
+            ext = rng.choice([".flac", ".flac", ".mp3", ".m4a"])
+            for track in range(1, rng.randint(6, 14)):
+                paths.append(f"{album_dir}/{track:02d}. {title(rng, rng.randint(1, 5))}{rng.choice(TAGS)}{ext}")
+    return paths[:count]
+
+def code_paths(rng, count):
+    """Nested Python packages (with __init__.py / pyproject.toml) and Go modules (go.mod)."""
+    paths = []
+    while len(paths) < count:
+        project = title(rng, 2).lower().replace(" ", "-")
+        if rng.random() < 0.6:
+            root = f"{SYNTHETIC_ROOT}/Code/{project}"
+            paths.append(f"{root}/pyproject.toml")
+            for pkg in range(rng.randint(1, 4)):
+                pkg_dir = f"{root}/src/{project.replace('-', '_')}/pkg{pkg}"
+                paths.append(f"{pkg_dir}/__init__.py")
+                for mod in range(rng.randint(2, 12)):
+                    paths.append(f"{pkg_dir}/{rng.choice(WORDS).lower()}_{mod}.py")
+        else:
+            root = f"{SYNTHETIC_ROOT}/Go/{project}"
+            paths.append(f"{root}/go.mod")
+            for pkg in range(rng.randint(1, 4)):
+                for f in range(rng.randint(1, 8)):
+                    paths.append(f"{root}/internal/pkg{pkg}/{rng.choice(WORDS).lower()}_{f}.go")
+    return paths[:count]
+
+def misc_paths(rng, count):
+    exts = [".pdf", ".md", ".txt", ".zip", ".json", ".png", ".mp4", ".sh", ".xyz", ""]
+    return [f"{SYNTHETIC_ROOT}/Misc/{title(rng, 2)}/{title(rng, rng.randint(1, 4))}{rng.choice(exts)}"
+            for _ in range(count)]
+
+def synthetic_paths(count, seed=1234):
+    """Deterministic mix modeled on real layouts: 70% music library, 25% source trees, 5% other."""
+    rng = random.Random(seed)
+    music = music_paths(rng, int(count * 0.70))
+    code = code_paths(rng, int(count * 0.25))
+    misc = misc_paths(rng, count - len(music) - len(code))
+    paths = music + code + misc
+    rng.shuffle(paths)
+    return paths
+
+def materialize(paths, root):
+    """Create (empty) files for the given synthetic paths under root; returns the on-disk paths."""
+    out = []
+    for p in paths:
+        local = root + p[len(SYNTHETIC_ROOT):]
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        if not os.path.exists(local):
+            with open(local, "wb") as f:
+                if not os.path.splitext(local)[1]:
+                    f.write(b"#!/bin/sh\n")
+        out.append(local)
+    return out
+
+def timed(fn, items, repeat):
+    """Run fn over every item `repeat` times; returns per-item nanoseconds for each round."""
+    rounds = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter_ns()
+            for item in items:
+                fn(item)
+            rounds.append((time.perf_counter_ns() - start) / max(1, len(items)))
+        finally:
+            gc.enable()
+    return rounds
+
+def benchmarks(paths, disk_paths):
+    """(name, function, inputs) for every benchmark."""
+    basenames = [os.path.basename(p) for p in paths]
+    stems = [os.path.splitext(b)[0] for b in basenames]
+    exts = [os.path.splitext(b)[1] for b in basenames]
+    scripts = [p for p in disk_paths if ghuploader.category_for_path(p) == "Scripts"]
+    return [
+        ("category_for_path", ghuploader.category_for_path, paths),
+        ("sanitize_filename", ghuploader.sanitize_filename, basenames),
+        ("sanitize_filename[spaces]", lambda n: ghuploader.sanitize_filename(n, preserve_spaces=True), basenames),
+        ("is_generic_filename", ghuploader.is_generic_filename, basenames),
+        ("remove_track_number", ghuploader.remove_track_number, stems),
+        ("get_script_language_subfolder", ghuploader.get_script_language_subfolder, exts),
+        ("extract_artist_from_path", ghuploader.extract_artist_from_path, paths),
+        ("extract_album_from_path", ghuploader.extract_album_from_path, paths),
+        ("detect_package_structure", ghuploader.detect_package_structure, scripts),
+        ("build_repo_path", lambda p: ghuploader.build_repo_path(BENCH_CFG, p), disk_paths),
+    ]
+
+def run(sizes, repeat, disk_files, only=None, verbose=True):
+    # Measure the path-regex code, not whatever library catalog this machine happens to have
+    ghu_library._catalog = {}
+    results = {}
+    tmp = tempfile.mkdtemp(prefix="ghu_bench_")
+    try:
+        for size in sizes:
+            paths = synthetic_paths(size)
+            disk_paths = materialize(paths[:min(size, disk_files)], tmp)
+            for name, fn, items in benchmarks(paths, disk_paths):
+                if only and name not in only:
+                    continue
+                rounds = timed(fn, items, repeat)
+                key = f"{name}@{size}"
+                results[key] = {"name": name, "size": size, "n": len(items),
+                                "best_ns": round(min(rounds), 1), "median_ns": round(statistics.median(rounds), 1)}
+                if verbose:
+                    r = results[key]
+                    print(f"{name:32} {size:>9} {r['n']:>9} {r['best_ns']:>12.1f} {r['median_ns']:>12.1f}", flush=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "created": dt.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": sizes,
+        "repeat": repeat,
+        "disk_files": disk_files,
+        "results": results,
+    }
+
+def baseline_path(name):
+    if os.path.sep in name or name.endswith(".json"):
+        return name
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+def load_run(name):
+    with open(baseline_path(name), "r") as f:
+        return json.load(f)
+
+def compare(base, new, threshold):
+    """Print per-benchmark speed ratios. Returns the number of regressions beyond threshold percent."""
+    regressions = 0
+    print(f"{'benchmark':42} {'base ns':>10} {'new ns':>10} {'change':>8}")
+    for key in sorted(base["results"], key=lambda k: (base["results"][k]["name"], base["results"][k]["size"])):
+        if key not in new["results"]:
+            continue
+        b = base["results"][key]["best_ns"]
+        n = new["results"][key]["best_ns"]
+        change = (n - b) / b * 100 if b else 0.0
+        mark = ""
+        if change > threshold:
+            mark = "  slower"
+            regressions += 1
+        elif change < -threshold:
+            mark = "  faster"
+        print(f"{key:42} {b:>10.1f} {n:>10.1f} {change:>+7.1f}%{mark}")
+    return regressions
+
+def header():
+    print(f"{'benchmark':32} {'paths':>9} {'calls':>9} {'best ns/op':>12} {'median ns/op':>12}")
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for path building and classification")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Run the benchmarks")
+    p_run.add_argument("--sizes", default="10000,100000", help="Comma-separated synthetic tree sizes (up to 1000000)")
+    p_run.add_argument("--repeat", type=int, default=5, help="Rounds per benchmark; the best round is reported")
+    p_run.add_argument("--disk-files", type=int, default=20000,
+                       help="Files created on disk for the benchmarks that touch the filesystem")
+    p_run.add_argument("--only", nargs="+", help="Only these benchmarks")
+    p_run.add_argument("--save", metavar="NAME", help="Save results as a baseline (benchmarks/baselines/NAME.json)")
+
+    p_cmp = sub.add_parser("compare", help="Compare a saved baseline with a new run (or another saved run)")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("current", nargs="?", help="Saved run to compare against (default: run now with the baseline's settings)")
+    p_cmp.add_argument("--threshold", type=float, default=10.0, help="Percent change reported as faster/slower")
+
+    sub.add_parser("list", help="List saved baselines")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name in sorted(os.listdir(BASELINE_DIR)) if os.path.isdir(BASELINE_DIR) else []:
+            if name.endswith(".json"):
+                data = load_run(os.path.join(BASELINE_DIR, name))
+                print(f"{name[:-5]:24} {data['created']}  Python {data['python']}  sizes {data['sizes']}")
+        return 0
+
+    if args.command == "run":
+        sizes = [int(s) for s in args.sizes.split(",") if s]
+        header()
+        result = run(sizes, args.repeat, args.disk_files, args.only)
+        if args.save:
+            os.makedirs(BASELINE_DIR, exist_ok=True)
+            with open(baseline_path(args.save), "w") as f:
+                json.dump(result, f, indent=2)
+                f.write("\n")
+            print(f"Saved {baseline_path(args.save)}", file=sys.stderr)
+        return 0
+
+    base = load_run(args.baseline)
+    if args.current:
+        new = load_run(args.current)
+    else:
+        names = sorted({r["name"] for r in base["results"].values()})
+        header()
+        new = run(base["sizes"], base.get("repeat", 5), base.get("disk_files", 20000), names)
+        print()
+    regressions = compare(base, new, args.threshold)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
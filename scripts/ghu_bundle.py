@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""Bundles - many small files packed into one uncompressed tar plus an offset index, read back with Range requests"""
+import argparse
+import datetime as dt
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from ghuploader import (
+    DATA_DIR, clipboard_set, eprint, get_token, git_blob_sha, load_config, log_upload, repo_folder_for, run_batches,
+    sanitize_filename, upload_git_data_files, upload_release_asset,
+)
+
+BUNDLES_FILE = os.path.join(DATA_DIR, "bundles.json")
+# Local copies of bundle indexes, by index URL (bundles are never rewritten, so they stay valid)
+BUNDLE_CACHE_DIR = os.path.join(DATA_DIR, "bundles")
+BUNDLE_CATEGORY = "Bundles"
+INDEX_SUFFIX = ".index.json"
+INDEX_VERSION = 1
+# The only hosts the GitHub token is ever sent to (`ghu get` takes arbitrary URLs)
+GITHUB_HOSTS = {"github.com", "api.github.com", "raw.githubusercontent.com"}
+
+def collect(paths):
+    """[(local path, member name)] for files and folders (folders keep their name as the top directory)."""
+    members = []
+    for path in paths:
+        path = os.path.abspath(os.path.expanduser(path))
+        if os.path.isdir(path):
+            parent = os.path.dirname(path.rstrip(os.sep))
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+                for name in sorted(filenames):
+                    if name.startswith("."):
+                        continue
+                    full = os.path.join(dirpath, name)
+                    members.append((full, os.path.relpath(full, parent).replace(os.sep, "/")))
+        elif os.path.isfile(path):
+            members.append((path, os.path.basename(path)))
+        else:
+            raise RuntimeError(f"Not a file or folder: {path}")
+    seen = {}
+    for local, name in members:
+        if name in seen:
+            raise RuntimeError(f"Two files would be stored as {name}: {seen[name]} and {local}")
+        seen[name] = local
+    return members
+
+def write_tar(members, tar_path):
+    """Pack members into an uncompressed tar.
+
+    Returns:
+        {member name: [data offset, size, sha256]}
+    """
+    from ghu_hashing import file_digests
+    with tarfile.open(tar_path, "w", format=tarfile.PAX_FORMAT) as tar:
+        for local, name in members:
+            info = tar.gettarinfo(local, arcname=name)
+            # Owner names of the uploading machine don't belong in a shared archive
+            info.uid = info.gid = 0
+            info.uname = info.gname = ""
+            with open(local, "rb") as f:
+                tar.addfile(info, f)
+    sums = {name: file_digests(local)["sha256"] for local, name in members}
+    index = {}
+    # Data offsets as the tar reader sees them (after any PAX headers for long names)
+    with tarfile.open(tar_path, "r:") as tar:
+        for info in tar:
+            if info.isfile():
+                index[info.name] = [info.offset_data, info.size, sums[info.name]]
+    return index
+
+def member_url(index_url, name):
+    """The URL of one bundle member: the index URL with the member path as fragment."""
+    return f"{index_url}#{urllib.parse.quote(name, safe='/')}"
+
+def load_bundles():
+    try:
+        with open(BUNDLES_FILE, "r") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def cache_path(index_url):
+    return os.path.join(BUNDLE_CACHE_DIR, hashlib.sha1(index_url.encode("utf-8")).hexdigest()[:16] + ".json")
+
+def save_index_copy(index_url, index):
+    try:
+        os.makedirs(BUNDLE_CACHE_DIR, exist_ok=True)
+        path = cache_path(index_url)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+    except OSError:
+        pass
+
+def record_bundle(name, index_url, count):
+    try:
+        bundles = load_bundles()
+        bundles[name] = {"index": index_url, "files": count, "created": dt.datetime.now().isoformat()}
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(f"{BUNDLES_FILE}.tmp", "w") as f:
+            json.dump(bundles, f, indent=2)
+        os.replace(f"{BUNDLES_FILE}.tmp", BUNDLES_FILE)
+    except OSError:
+        pass
+
+def upload_bundle(cfg, token, paths, name, verbose=False):
+    """Pack files/folders into one bundle and upload the archive and its index in one go.
+
+    The archive goes into the repo tree next to its index (one commit for both), or to the
+    release when it is larger than contents_max_mb.
+
+    Returns:
+        (index URL, number of files)
+    """
+    import ghu_metrics
+    members = collect(paths)
+    if not members:
+        raise RuntimeError("Nothing to bundle")
+    stem = sanitize_filename(name) or "bundle"
+    tmp_dir = tempfile.mkdtemp(prefix="gupload_bundle_")
+    try:
+        work_tar = os.path.join(tmp_dir, "bundle.tar")
+        index = write_tar(members, work_tar)
+        size = os.path.getsize(work_tar)
+        # Content-addressed names: a bundle is never overwritten, so cached indexes and offsets stay valid
+        stem = f"{stem}-{git_blob_sha(work_tar)[:8]}"
+        tar_path = os.path.join(tmp_dir, f"{stem}.tar")
+        os.rename(work_tar, tar_path)
+        if verbose:
+            eprint(f"Bundled {len(index)} file(s) into {stem}.tar ({size / (1024 * 1024):.1f} MB)")
+
+        folder = repo_folder_for(cfg, BUNDLE_CATEGORY)
+        index_remote = f"{folder}/{stem}{INDEX_SUFFIX}"
+        tar_remote = f"{folder}/{stem}.tar"
+        in_tree = size <= float(cfg.get("contents_max_mb", 95)) * 1024 * 1024
+        if in_tree:
+            # Relative to the index URL, so the pair can be served from any mirror
+            archive = f"{stem}.tar"
+        else:
+            if verbose:
+                eprint("  → Archive is above contents_max_mb; using a release asset")
+            archive = upload_release_asset(cfg, token, tar_path, BUNDLE_CATEGORY)
+            if not archive:
+                raise RuntimeError("No browser_download_url returned for release upload.")
+            ghu_metrics.uploaded("release", size)
+
+        index_doc = {"version": INDEX_VERSION, "archive": archive, "size": size, "members": index}
+        index_path = os.path.join(tmp_dir, f"{stem}{INDEX_SUFFIX}")
+        with open(index_path, "w") as f:
+            json.dump(index_doc, f, separators=(",", ":"), ensure_ascii=False)
+
+        pending = [(None, index_path, index_remote, BUNDLE_CATEGORY)]
+        if in_tree:
+            pending.insert(0, (None, tar_path, tar_remote, BUNDLE_CATEGORY))
+            if cfg.get("shards"):
+                import ghu_shards
+                ghu_shards.route_with(cfg, index_remote, tar_remote, tar_path)
+        started = time.perf_counter()
+        urls, errors = run_batches(cfg, token, upload_git_data_files, pending)
+        if errors:
+            raise RuntimeError("; ".join(f"{p}: {e}" for p, e in errors.items()))
+        import ghu_router
+        ghu_router.record(cfg, "gitdata", sum(os.path.getsize(p) for _, p, _, _ in pending),
+                          time.perf_counter() - started, requests=len(pending))
+        ghu_metrics.uploaded("gitdata", sum(os.path.getsize(p) for _, p, _, _ in pending))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    index_url = urls[index_remote]
+    save_index_copy(index_url, index_doc)
+    record_bundle(stem, index_url, len(index))
+    log_upload(os.path.commonpath([local for local, _ in members]), f"{stem}{INDEX_SUFFIX}", index_url,
+               BUNDLE_CATEGORY)
+    return index_url, len(index)
+
+def format_bundle(cfg, name, index_url, count):
+    mode = cfg.get("output_mode", "markdown")
+    lines = []
+    if mode in ("markdown", "both"):
+        lines.append(f"[{name} ({count} files)]({index_url})")
+    if mode in ("url", "both"):
+        lines.append(index_url)
+    return "\n".join(lines)
+
+def is_github_url(url):
+    return (urllib.parse.urlsplit(url).hostname or "").lower() in GITHUB_HOSTS
+
+def fetch(url, token, start=None, length=None):
+    """GET a URL (optionally one byte range). The token is only sent to GitHub hosts, never on redirects."""
+    req = urllib.request.Request(url, headers={"User-Agent": "ghuploader"})
+    if token and is_github_url(url):
+        req.add_unredirected_header("Authorization", f"Bearer {token}")
+    if start is not None:
+        req.add_header("Range", f"bytes={start}-{start + length - 1}")
+    try:
+        with urllib.request.urlopen(req) as resp:
+            if start is not None and resp.status != 206:
+                # Server ignored the range: skip to the member instead of failing
+                eprint(f"  … {urllib.parse.urlsplit(url).netloc} ignored the Range header; reading through")
+                remaining = start
+                while remaining:
+                    chunk = resp.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                return resp.read(length)
+            return resp.read()
+    except urllib.error.HTTPError as err:
+        raise RuntimeError(f"GET {url} -> {err.code}") from None
+
+def load_index(index_url, token):
+    """A bundle index, from the local copy when there is one."""
+    try:
+        with open(cache_path(index_url), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    index = json.loads(fetch(index_url, token).decode("utf-8"))
+    if index.get("version") != INDEX_VERSION:
+        raise RuntimeError(f"Unsupported bundle index version {index.get('version')!r}")
+    save_index_copy(index_url, index)
+    return index
+
+def resolve_ref(ref):
+    """(index URL, member name or None) for "URL#member", "URL", "name#member" or "name"."""
+    base, _, member = ref.partition("#")
+    if not base.startswith(("http://", "https://")):
+        bundles = load_bundles()
+        # Bundle names carry a content hash; the plain name means the newest bundle of that name
+        named = [b for n, b in bundles.items() if n.rsplit("-", 1)[0] == base]
+        hit = bundles.get(base) or max(named, key=lambda b: b.get("created", ""), default=None)
+        if not hit:
+            raise RuntimeError(f"Unknown bundle {base!r} (not in {BUNDLES_FILE}; use the index URL)")
+        base = hit["index"]
+    return base, urllib.parse.unquote(member) or None
+
+def archive_url(index_url, index):
+    """URL of a bundle's archive. The index is downloaded data, so an absolute archive URL must stay on
+    the index's host (or, for release-asset archives, go from one GitHub host to another)."""
+    url = urllib.parse.urljoin(index_url, index["archive"])
+    parts = urllib.parse.urlsplit(url)
+    same_host = parts.hostname == urllib.parse.urlsplit(index_url).hostname
+    if parts.scheme not in ("http", "https") or not (same_host or (is_github_url(index_url) and is_github_url(url))):
+        raise RuntimeError(f"Bundle index points its archive at another host ({parts.netloc or url}); refusing it")
+    return url
+
+def get_member(index_url, index, name, token):
+    """Bytes of one member, fetched with a single Range request and checked against the index."""
+    entry = index["members"].get(name)
+    if entry is None:
+        raise RuntimeError(f"{name} is not in the bundle")
+    offset, size, sha256 = entry
+    data = fetch(archive_url(index_url, index), token, offset, size) if size else b""
+    if len(data) != size or hashlib.sha256(data).hexdigest() != sha256:
+        raise RuntimeError(f"{name}: checksum mismatch (bundle changed or truncated response)")
+    return data
+
+def get_main(argv):
+    parser = argparse.ArgumentParser(prog="ghu get",
+                                     description="Fetch files from a bundle (INDEX_URL#member or NAME#member); "
+                                                 "without a member, list the bundle")
+    parser.add_argument("refs", nargs="+")
+    parser.add_argument("-o", "--output",
+                        help="Output file, '-' for stdout, or a folder (default: current folder, member file name)")
+    args = parser.parse_args(argv)
+    cfg = load_config()
+    token = get_token(cfg)
+    status = 0
+    for ref in args.refs:
+        try:
+            index_url, name = resolve_ref(ref)
+            index = load_index(index_url, token)
+            if name is None:
+                for member, (_, size, _) in sorted(index["members"].items()):
+                    print(f"{size:>10}  {member_url(index_url, member)}")
+                continue
+            data = get_member(index_url, index, name, token)
+        except (RuntimeError, OSError, ValueError) as e:
+            eprint(f"{ref}: {e}")
+            status = 1
+            continue
+        if args.output == "-":
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+            continue
+        dest = args.output or "."
+        if os.path.isdir(dest) or len(args.refs) > 1:
+            os.makedirs(dest, exist_ok=True)
+            dest = os.path.join(dest, os.path.basename(name))
+        with open(dest, "wb") as f:
+            f.write(data)
+        eprint(f"{name} -> {dest} ({len(data)} bytes)")
+    sys.exit(status)
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu bundle",
+                                     description="Upload many small files as one uncompressed tar with an offset index")
+    parser.add_argument("paths", nargs="*", help="Files and folders to pack")
+    parser.add_argument("-n", "--name", help="Bundle name (default: first file or folder name)")
+    parser.add_argument("-l", "--list", action="store_true", help="List bundles uploaded from this machine")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Verbose output")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, info in sorted(load_bundles().items()):
+            print(f"{name:40} {info.get('files', 0):>7} file(s)  {info['index']}")
+        return
+    if not args.paths:
+        parser.error("nothing to bundle")
+    cfg = load_config()
+    token = get_token(cfg)
+    verbose = args.verbose or bool(cfg.get("verbose", False))
+    name = args.name or os.path.basename(os.path.abspath(os.path.expanduser(args.paths[0])).rstrip(os.sep))
+    try:
+        index_url, count = upload_bundle(cfg, token, args.paths, name, verbose)
+    except Exception as e:
+        eprint(f"Bundle upload failed: {e}")
+        sys.exit(1)
+    out = format_bundle(cfg, name, index_url, count) + "\n"
+    print(out)
+    clipboard_set(out)
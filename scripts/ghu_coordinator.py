@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Commit coordinator - serializes branch updates across concurrent ghu runs and coalesces their files into shared commits"""
+import contextlib
+import datetime as dt
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from ghuploader import DATA_DIR, combine_merge_entries, commit_tree_entries, eprint
+
+LOCK_DIR = os.path.join(DATA_DIR, "locks")
+OUTBOX_DIR = os.path.join(DATA_DIR, "outbox")
+# Results nobody collected (their run died) are cleaned up after this long
+STALE_RESULT_SECONDS = 24 * 3600
+
+_locks = {}  # target -> {"rlock", "depth", "file"}
+_locks_guard = threading.Lock()
+
+def target_key(cfg):
+    return f"{cfg['owner']}/{cfg['repo']}@{cfg.get('branch', 'main')}"
+
+@contextlib.contextmanager
+def branch_lock(cfg):
+    """Exclusive lock on one branch's updates across processes (re-entrant within a process)."""
+    key = target_key(cfg)
+    with _locks_guard:
+        state = _locks.setdefault(key, {"rlock": threading.RLock(), "depth": 0, "file": None})
+    with state["rlock"]:
+        if state["depth"] == 0:
+            os.makedirs(LOCK_DIR, exist_ok=True)
+            state["file"] = open(os.path.join(LOCK_DIR, re.sub(r"[^A-Za-z0-9._-]", "_", key) + ".lock"), "w")
+            fcntl.flock(state["file"], fcntl.LOCK_EX)
+        state["depth"] += 1
+        try:
+            yield
+        finally:
+            state["depth"] -= 1
+            if state["depth"] == 0:
+                # Closing the file releases the flock
+                state["file"].close()
+                state["file"] = None
+
+def holds_lock():
+    """Whether this process currently holds any branch lock."""
+    with _locks_guard:
+        return any(state["depth"] for state in _locks.values())
+
+def write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def pending_requests(cfg):
+    """Outbox requests for this repo/branch, oldest first, as (request path, request)."""
+    key = target_key(cfg)
+    found = []
+    for name in os.listdir(OUTBOX_DIR):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(OUTBOX_DIR, name)
+        try:
+            with open(path, "r") as f:
+                req = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if req.get("target") == key:
+            found.append((req.get("queued", 0), path, req))
+    return [(path, req) for _, path, req in sorted(found, key=lambda t: t[0])]
+
+def commit_pending(cfg, token, verbose=False):
+    """Commit every pending outbox request for this branch in one commit (caller holds the lock)."""
+    wait_ms = int(cfg.get("commit_coalesce_ms", 0))
+    if wait_ms > 0:
+        # Give runs that are still uploading blobs a moment to join this commit
+        time.sleep(wait_ms / 1000)
+    requests = pending_requests(cfg)
+    if not requests:
+        return
+
+    # Later requests win if two runs wrote the same path; merge entries (shared indexes) are combined
+    merged = {}
+    for _, req in requests:
+        for entry in req["entries"]:
+            prev = merged.get(entry["path"])
+            if prev and prev.get("merge") and entry.get("merge"):
+                entry = combine_merge_entries(prev, entry)
+            merged[entry["path"]] = entry
+    files = sum(len(req["entries"]) for _, req in requests)
+    now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if len(requests) == 1:
+        message = requests[0][1]["message"]
+    else:
+        message = f"Upload {files} files from {len(requests)} runs @ {now}"
+    if verbose:
+        eprint(f"Committing {files} file(s) from {len(requests)} run(s)...")
+
+    result = {"commit": None, "error": None, "runs": len(requests)}
+    last_error = None
+    # The branch can still move outside our processes (web UI, other machines); rebuild once
+    for _ in range(2):
+        try:
+            result["commit"] = commit_tree_entries(cfg, token, list(merged.values()), message)
+            break
+        except Exception as e:
+            last_error = e
+    if not result["commit"]:
+        result["error"] = str(last_error)
+    for path, _ in requests:
+        write_json(path[:-len(".json")] + ".done", result)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def collect_result(request_id):
+    done = os.path.join(OUTBOX_DIR, f"{request_id}.done")
+    try:
+        with open(done, "r") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    os.remove(done)
+    return result
+
+def clean_stale_results():
+    cutoff = time.time() - STALE_RESULT_SECONDS
+    for name in os.listdir(OUTBOX_DIR):
+        path = os.path.join(OUTBOX_DIR, name)
+        try:
+            if name.endswith((".done", ".tmp")) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def submit(cfg, token, entries, message, verbose=False):
+    """Queue tree entries for the shared commit and return once they are on the branch.
+
+    Blobs are uploaded by each run on its own beforehand. Whoever holds the branch lock commits
+    everything waiting in the outbox, so runs queued behind it usually find their files committed.
+
+    Returns:
+        (commit SHA, number of runs that shared the commit)
+
+    Raises:
+        RuntimeError if the shared commit failed
+    """
+    os.makedirs(OUTBOX_DIR, exist_ok=True)
+    request_id = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+    write_json(os.path.join(OUTBOX_DIR, f"{request_id}.json"), {
+        "target": target_key(cfg),
+        "queued": time.time(),
+        "message": message,
+        "entries": entries,
+    })
+    with branch_lock(cfg):
+        result = collect_result(request_id)
+        if result is None:
+            # Nobody picked our request up yet: commit it together with whatever else is waiting
+            commit_pending(cfg, token, verbose)
+            result = collect_result(request_id)
+        clean_stale_results()
+    if result is None:
+        raise RuntimeError("Commit coordinator lost the request")
+    if result["error"]:
+        raise RuntimeError(f"Shared commit failed: {result['error']}")
+    if verbose and result["runs"] > 1:
+        eprint(f"  → Committed together with {result['runs'] - 1} other run(s)")
+    return result["commit"], result["runs"]
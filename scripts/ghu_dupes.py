@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""Near-duplicate images - perceptual hashes (dHash/pHash) of Uploads/Images with a multi-index hash lookup"""
+import argparse
+import array
+import hashlib
+import itertools
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ghuploader import (
+    DATA_DIR, IMAGE_EXT, eprint, get_blob, get_token, git_blob_sha, load_config, load_tree_index, raw_url_for,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PHASH_INDEX_FILE = os.path.join(DATA_DIR, "phash-index.json")
+# Lookup tables per repo and hash type, written with the index so a run can mmap them instead of parsing it
+PHASH_TABLES_DIR = os.path.join(DATA_DIR, "phash-tables")
+TABLES_MAGIC = b"GHUMIH01"
+# magic, byte order, index mtime_ns, index size, image count, path bytes
+TABLES_HEADER = struct.Struct("<8s8sqqQQ")
+HASH_ALGORITHMS = ("dhash", "phash")
+# Images are reduced to SIZE x SIZE grayscale before hashing (pHash's DCT input; dHash is resampled from it)
+SIZE = 32
+# Hashes are looked up by 4 chunks of 16 bits each (multi-index hashing)
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_SHIFTS = (48, 32, 16, 0)
+# Formats the hashers can't read meaningfully
+NO_HASH_EXT = {".svg", ".gif"}
+
+_index = None
+_tables = {}
+# Hashes of local files computed without loading the index: {blob sha: (dhash, phash)}
+_computed = {}
+# Tree listings checked during this run: {target: {repo path: blob sha}}
+_trees = {}
+_lock = threading.Lock()
+
+def read_bmp_gray(path):
+    """Grayscale rows of an uncompressed 24/32-bit BMP (what `sips` writes), top row first."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:2] != b"BM":
+        raise ValueError("not a BMP file")
+    offset = struct.unpack_from("<I", data, 10)[0]
+    width, height, _, bpp, compression = struct.unpack_from("<iiHHI", data, 18)
+    if bpp not in (24, 32) or compression not in (0, 3):
+        raise ValueError(f"unsupported BMP ({bpp} bpp, compression {compression})")
+    step = bpp // 8
+    stride = (width * step + 3) & ~3
+    rows = []
+    for y in range(abs(height)):
+        start = offset + y * stride
+        row = data[start:start + width * step]
+        rows.append([0.114 * row[i] + 0.587 * row[i + 1] + 0.299 * row[i + 2] for i in range(0, len(row), step)])
+    # Positive height means bottom-up rows
+    return rows[::-1] if height > 0 else rows
+
+def area_weights(src, dst):
+    """dst x src matrix that averages source pixels into dst equal-width bins."""
+    scale = src / dst
+    weights = []
+    for i in range(dst):
+        lo, hi = i * scale, (i + 1) * scale
+        row = [max(0.0, min(hi, j + 1) - max(lo, j)) / scale for j in range(src)]
+        weights.append(row)
+    return weights
+
+def matmul(a, b):
+    cols = list(zip(*b))
+    return [[sum(x * y for x, y in zip(row, col)) for col in cols] for row in a]
+
+def resize_gray(rows, width, height):
+    """Area-average a grayscale image (list of rows) to width x height."""
+    h, w = len(rows), len(rows[0])
+    wy, wx = area_weights(h, height), area_weights(w, width)
+    if np is not None:
+        return (np.array(wy) @ np.array(rows, dtype=float) @ np.array(wx).T).tolist()
+    return matmul(matmul(wy, rows), [list(c) for c in zip(*wx)])
+
+def load_gray(path):
+    """SIZE x SIZE grayscale pixels of an image, decoded by Pillow or (macOS) `sips`; None if impossible."""
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    try:
+        if Image is not None:
+            with Image.open(path) as im:
+                im.draft("L", (SIZE * 4, SIZE * 4))
+                small = im.convert("L").resize((SIZE, SIZE), Image.BOX)
+                data = list(small.getdata())
+            return [data[i * SIZE:(i + 1) * SIZE] for i in range(SIZE)]
+        if path.lower().endswith(".bmp"):
+            return resize_gray(read_bmp_gray(path), SIZE, SIZE)
+        if shutil.which("sips"):
+            fd, tmp = tempfile.mkstemp(suffix=".bmp", prefix="gupload_phash_")
+            os.close(fd)
+            try:
+                subprocess.run(["sips", "-s", "format", "bmp", "-z", str(SIZE * 2), str(SIZE * 2), path, "--out", tmp],
+                               check=True, capture_output=True)
+                return resize_gray(read_bmp_gray(tmp), SIZE, SIZE)
+            finally:
+                os.remove(tmp)
+    except Exception:
+        return None
+    return None
+
+def decoder_available():
+    try:
+        import PIL  # noqa: F401
+        return True
+    except ImportError:
+        return shutil.which("sips") is not None
+
+def dct_rows(n, keep):
+    """First `keep` rows of the orthonormal DCT-II matrix of size n."""
+    return [[math.sqrt((1 if k == 0 else 2) / n) * math.cos(math.pi * (2 * x + 1) * k / (2 * n)) for x in range(n)]
+            for k in range(keep)]
+
+DCT8 = dct_rows(SIZE, 8)
+DHASH_Y = area_weights(SIZE, 8)
+DHASH_X = area_weights(SIZE, 9)
+
+def bits_to_int(bits):
+    value = 0
+    for b in bits:
+        value = (value << 1) | int(b)
+    return value
+
+def hash_pixels(pixels):
+    """(dHash, pHash) as 64-bit ints for one SIZE x SIZE grayscale image."""
+    small = matmul(matmul(DHASH_Y, pixels), [list(c) for c in zip(*DHASH_X)])
+    dhash = bits_to_int(row[x + 1] > row[x] for row in small for x in range(8))
+    coeffs = matmul(matmul(DCT8, pixels), [list(c) for c in zip(*DCT8)])
+    flat = [c for row in coeffs for c in row]
+    # The DC term says nothing about structure; leave it out of the median
+    median = sorted(flat[1:])[31]
+    phash = bits_to_int(c > median for c in flat)
+    return dhash, phash
+
+def hash_batch(images):
+    """(dHash, pHash) for a list of SIZE x SIZE images; one vectorized pass when NumPy is installed."""
+    if np is None or not images:
+        return [hash_pixels(p) for p in images]
+    stack = np.asarray(images, dtype=float)
+    small = np.einsum("ij,njk,lk->nil", np.array(DHASH_Y), stack, np.array(DHASH_X))
+    dbits = (small[:, :, 1:] > small[:, :, :-1]).reshape(len(images), 64)
+    dct = np.array(DCT8)
+    coeffs = np.einsum("ij,njk,lk->nil", dct, stack, dct).reshape(len(images), 64)
+    median = np.median(coeffs[:, 1:], axis=1, keepdims=True)
+    pbits = coeffs > median
+    weights = 1 << np.arange(63, -1, -1, dtype=np.uint64)
+    dh = (dbits.astype(np.uint64) * weights).sum(axis=1, dtype=np.uint64)
+    ph = (pbits.astype(np.uint64) * weights).sum(axis=1, dtype=np.uint64)
+    return [(int(d), int(p)) for d, p in zip(dh, ph)]
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+def target_key(cfg):
+    return f"{cfg['owner']}/{cfg['repo']}@{cfg.get('branch', 'main')}"
+
+def load_index():
+    """{"hashes": {blob sha: [dhash, phash]}, "images": {target: {repo path: blob sha}}}"""
+    global _index
+    with _lock:
+        if _index is None:
+            try:
+                with open(PHASH_INDEX_FILE, "r") as f:
+                    _index = json.load(f)
+            except Exception:
+                _index = {}
+            _index.setdefault("hashes", {})
+            _index.setdefault("images", {})
+            for sha, hashes in _computed.items():
+                _index["hashes"].setdefault(sha, list(hashes))
+        return _index
+
+def index_stamp(path=PHASH_INDEX_FILE):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0, 0
+    return st.st_mtime_ns, st.st_size
+
+def save_index(cfg=None):
+    """Write the index, and the lookup tables of cfg's repo so the next run can use them right away."""
+    index = load_index()
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        tmp = f"{PHASH_INDEX_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        # Stamp taken from our own file: another run may replace the index right after us
+        stamp = index_stamp(tmp)
+        os.replace(tmp, PHASH_INDEX_FILE)
+    except Exception:
+        return
+    _tables.clear()
+    if cfg is not None:
+        algorithm, _ = settings(cfg)
+        try:
+            write_tables(cfg, algorithm, build_tables(image_values(cfg, algorithm), stamp))
+        except OSError:
+            pass
+
+def settings(cfg):
+    algorithm = cfg.get("near_duplicate_hash", "dhash")
+    return (algorithm if algorithm in HASH_ALGORITHMS else "dhash"), max(0, int(cfg.get("near_duplicate_distance", 6)))
+
+def flip_masks(bits, radius):
+    """Every mask of up to `radius` set bits within a chunk of `bits` bits (the probes for one chunk)."""
+    masks = [0]
+    for r in range(1, radius + 1):
+        masks.extend(sum(1 << b for b in combo) for combo in itertools.combinations(range(bits), r))
+    return masks
+
+def image_values(cfg, algorithm):
+    """{repo path: hash} of this repo's indexed images."""
+    index = load_index()
+    which = HASH_ALGORITHMS.index(algorithm)
+    hashes = index["hashes"]
+    return {path: hashes[sha][which] for path, sha in index["images"].get(target_key(cfg), {}).items()
+            if sha in hashes}
+
+def build_tables(values, stamp):
+    """Serialized multi-index tables for {path: hash}.
+
+    Layout after the header: the hashes (uint64 per image), then per 16-bit chunk a bucket offset
+    table (65537 x uint32) and the image ids sorted by that chunk's value, then path offsets and
+    the UTF-8 paths.
+    """
+    paths = sorted(values)
+    hashes = array.array("Q", (values[p] for p in paths))
+    parts = [hashes.tobytes()]
+    for shift in CHUNK_SHIFTS:
+        chunks = [(v >> shift) & CHUNK_MASK for v in hashes]
+        counts = [0] * (CHUNK_MASK + 2)
+        for c in chunks:
+            counts[c + 1] += 1
+        parts.append(array.array("I", itertools.accumulate(counts)).tobytes())
+        parts.append(array.array("I", sorted(range(len(paths)), key=chunks.__getitem__)).tobytes())
+    encoded = [p.encode("utf-8") for p in paths]
+    parts.append(array.array("I", itertools.accumulate([0] + [len(e) for e in encoded])).tobytes())
+    blob = b"".join(encoded)
+    header = TABLES_HEADER.pack(TABLES_MAGIC, sys.byteorder.encode("ascii").ljust(8), stamp[0], stamp[1],
+                                len(paths), len(blob))
+    return header + b"".join(parts) + blob
+
+def parse_tables(buf):
+    """Views into serialized tables (bytes or mmap), or None if they don't fit this index."""
+    if len(buf) < TABLES_HEADER.size:
+        return None
+    magic, order, mtime_ns, size, n, blob_len = TABLES_HEADER.unpack_from(buf, 0)
+    if magic != TABLES_MAGIC or order.rstrip() != sys.byteorder.encode("ascii"):
+        return None
+    view = memoryview(buf)
+    pos = TABLES_HEADER.size
+
+    def take(nbytes, fmt):
+        nonlocal pos
+        part = view[pos:pos + nbytes]
+        pos += nbytes
+        return part.cast(fmt) if fmt else part
+
+    tables = {"stamp": (mtime_ns, size), "hashes": take(8 * n, "Q"), "offsets": [], "ids": []}
+    for _ in CHUNK_SHIFTS:
+        tables["offsets"].append(take(4 * (CHUNK_MASK + 2), "I"))
+        tables["ids"].append(take(4 * n, "I"))
+    tables["path_offsets"] = take(4 * (n + 1), "I")
+    tables["paths"] = take(blob_len, None)
+    if pos != len(buf):
+        return None
+    return tables
+
+def tables_path(cfg, algorithm):
+    name = hashlib.sha1(f"{target_key(cfg)}|{algorithm}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(PHASH_TABLES_DIR, f"{name}.bin")
+
+def write_tables(cfg, algorithm, data):
+    os.makedirs(PHASH_TABLES_DIR, exist_ok=True)
+    path = tables_path(cfg, algorithm)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def tables_for(cfg):
+    """Lookup tables for this repo's images: the persisted ones when they match the index on disk,
+    otherwise built from the index (and persisted for the next run)."""
+    algorithm, _ = settings(cfg)
+    key = (target_key(cfg), algorithm)
+    if key in _tables:
+        return _tables[key]
+    stamp = index_stamp()
+    tables = None
+    if _index is None:
+        try:
+            with open(tables_path(cfg, algorithm), "rb") as f:
+                # Mapped for the life of the process; the views below keep it open
+                tables = parse_tables(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError):
+            tables = None
+        if tables and tables["stamp"] != stamp:
+            tables = None
+    if tables is None:
+        data = build_tables(image_values(cfg, algorithm), stamp)
+        tables = parse_tables(data)
+        if _index is not None and stamp != (0, 0):
+            try:
+                write_tables(cfg, algorithm, data)
+            except OSError:
+                pass
+    _tables[key] = tables
+    return tables
+
+def table_path(tables, i):
+    offsets = tables["path_offsets"]
+    return bytes(tables["paths"][offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+def near(cfg, value, exclude=()):
+    """[(distance, repo path)] of indexed images within near_duplicate_distance of a hash, closest first.
+
+    Multi-index hashing: if two hashes differ in at most d bits, one of their 4 chunks differs
+    in at most d // 4 bits, so probing each chunk's bucket within that radius finds every match.
+    The tables are persisted next to the index, so even a run's first lookup only touches a
+    few buckets instead of parsing the index.
+    """
+    _, max_distance = settings(cfg)
+    tables = tables_for(cfg)
+    hashes = tables["hashes"]
+    masks = flip_masks(CHUNK_BITS, max_distance // len(CHUNK_SHIFTS))
+    seen = set()
+    found = []
+    for shift, offsets, ids in zip(CHUNK_SHIFTS, tables["offsets"], tables["ids"]):
+        chunk = (value >> shift) & CHUNK_MASK
+        for mask in masks:
+            probe = chunk ^ mask
+            for i in ids[offsets[probe]:offsets[probe + 1]]:
+                if i in seen:
+                    continue
+                seen.add(i)
+                d = distance(value, hashes[i])
+                if d <= max_distance:
+                    path = table_path(tables, i)
+                    if path not in exclude:
+                        found.append((d, path))
+    return sorted(found)
+
+def hashes_for_file(path):
+    """(dHash, pHash) of a local image, cached by blob SHA. None if it can't be decoded.
+
+    The index isn't loaded just for this: until something else loads it, new hashes wait in _computed.
+    """
+    sha = git_blob_sha(path)
+    cached = _computed.get(sha) or (_index["hashes"].get(sha) if _index is not None else None)
+    if cached:
+        return sha, tuple(cached)
+    pixels = load_gray(path)
+    if pixels is None:
+        return sha, None
+    hashes = hash_batch([pixels])[0]
+    with _lock:
+        _computed[sha] = hashes
+        if _index is not None:
+            _index["hashes"][sha] = list(hashes)
+    return sha, hashes
+
+def in_tree(cfg, token, path):
+    """Whether an indexed image is still on the branch (its repo's listing is checked once per run)."""
+    target = cfg
+    if cfg.get("shards"):
+        import ghu_shards
+        target = ghu_shards.routed_cfg(cfg, path) or cfg
+    key = target_key(target)
+    if key not in _trees:
+        _trees[key] = load_tree_index(target, token)
+    return path in _trees[key]
+
+def forget(cfg, paths):
+    """Drop images that are no longer on the branch from the index."""
+    images = load_index()["images"].get(target_key(cfg), {})
+    dropped = [p for p in paths if images.pop(p, None) is not None]
+    if dropped:
+        save_index(cfg)
+    return dropped
+
+def find_near(cfg, local_path, token=None):
+    """Closest already-uploaded near-duplicate of a local image as (distance, repo path), or None.
+
+    With a token, matches are checked against the branch first: an image moved or deleted since it
+    was indexed is dropped from the index instead of being returned as a dead link.
+    """
+    if os.path.splitext(local_path)[1].lower() in NO_HASH_EXT:
+        return None
+    _, hashes = hashes_for_file(local_path)
+    if not hashes:
+        return None
+    algorithm, _ = settings(cfg)
+    matches = near(cfg, hashes[HASH_ALGORITHMS.index(algorithm)])
+    if token is None:
+        return matches[0] if matches else None
+    gone = []
+    found = None
+    for match in matches:
+        if in_tree(cfg, token, match[1]):
+            found = match
+            break
+        gone.append(match[1])
+    if gone:
+        forget(cfg, gone)
+    return found
+
+def move_images(cfg, moves):
+    """Follow moved images in the index (list of (old path, new path or None if removed, blob sha))."""
+    index = load_index()
+    images = index["images"].get(target_key(cfg))
+    if not images:
+        return 0
+    moved = 0
+    for old, new, _ in moves:
+        sha = images.pop(old, None)
+        if sha is None:
+            continue
+        if new:
+            images[new] = sha
+        moved += 1
+    if moved:
+        save_index(cfg)
+    return moved
+
+def add_uploaded(cfg, items):
+    """Index freshly uploaded images (list of (local path, repo path, category))."""
+    index = load_index()
+    images = index["images"].setdefault(target_key(cfg), {})
+    added = 0
+    for local_path, remote_path, cat in items:
+        if cat != "Images" or os.path.splitext(local_path)[1].lower() in NO_HASH_EXT:
+            continue
+        sha, hashes = hashes_for_file(local_path)
+        if hashes:
+            images[remote_path] = sha
+            added += 1
+    if added:
+        save_index(cfg)
+
+def images_prefix(cfg):
+    base = cfg.get("repo_path_prefix", "")
+    return f"{base}/Uploads/Images/" if base else "Uploads/Images/"
+
+def url_for(cfg, path):
+    if cfg.get("shards"):
+        import ghu_shards
+        cfg = ghu_shards.routed_cfg(cfg, path) or cfg
+    return raw_url_for(cfg, path)
+
+def refresh_index(cfg, token, workers=8, verbose=False):
+    """Bring the index in line with Uploads/Images on the branch, hashing only blobs not seen before.
+
+    Sources, cheapest first: the gallery's cached thumbnail, the original file from the upload
+    history, the blob itself.
+    """
+    from ghu_gallery import THUMB_DIR, local_sources
+    index = load_index()
+    prefix = images_prefix(cfg)
+    tree = {p: sha for p, sha in load_tree_index(cfg, token).items()
+            if p.startswith(prefix) and os.path.splitext(p)[1].lower() in IMAGE_EXT - NO_HASH_EXT}
+    images = dict(tree)
+    todo = sorted({sha: p for p, sha in tree.items() if sha not in index["hashes"]}.items())
+    by_url = local_sources(cfg)
+    tmp_dir = tempfile.mkdtemp(prefix="gupload_phash_")
+
+    def pixels_for(item):
+        sha, path = item
+        thumb = os.path.join(THUMB_DIR, f"{sha}.jpg")
+        candidates = [thumb] if os.path.exists(thumb) else []
+        local = by_url.get(raw_url_for(cfg, path))
+        try:
+            if local and os.path.isfile(local) and git_blob_sha(local) == sha:
+                candidates.append(local)
+        except OSError:
+            pass
+        for src in candidates:
+            pixels = load_gray(src)
+            if pixels is not None:
+                return pixels
+        try:
+            dst = os.path.join(tmp_dir, sha + os.path.splitext(path)[1])
+            with open(dst, "wb") as f:
+                f.write(get_blob(cfg, token, sha))
+            try:
+                return load_gray(dst)
+            finally:
+                os.remove(dst)
+        except Exception:
+            return None
+
+    hashed = 0
+    try:
+        batch = 256
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for start in range(0, len(todo), batch):
+                chunk = todo[start:start + batch]
+                pixels = list(pool.map(pixels_for, chunk))
+                ok = [(sha, px) for (sha, _), px in zip(chunk, pixels) if px is not None]
+                for (sha, _), hashes in zip(ok, hash_batch([px for _, px in ok])):
+                    index["hashes"][sha] = list(hashes)
+                hashed += len(ok)
+                if verbose:
+                    eprint(f"  hashed {hashed}/{len(todo)}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    index["images"][target_key(cfg)] = images
+    # Drop hashes no indexed image uses any more
+    used = {sha for imgs in index["images"].values() for sha in imgs.values()}
+    index["hashes"] = {sha: h for sha, h in index["hashes"].items() if sha in used}
+    save_index(cfg)
+    return len(images), hashed
+
+def clusters(cfg):
+    """Groups of indexed images that are within the distance of each other (connected components)."""
+    algorithm, _ = settings(cfg)
+    which = HASH_ALGORITHMS.index(algorithm)
+    index = load_index()
+    images = index["images"].get(target_key(cfg), {})
+    parent = {p: p for p in images}
+
+    def root(p):
+        while parent[p] != p:
+            parent[p] = parent[parent[p]]
+            p = parent[p]
+        return p
+
+    for path, sha in images.items():
+        hashes = index["hashes"].get(sha)
+        if not hashes:
+            continue
+        for _, other in near(cfg, hashes[which], exclude=(path,)):
+            parent[root(other)] = root(path)
+    groups = {}
+    for path in images:
+        groups.setdefault(root(path), []).append(path)
+    return [sorted(g) for g in groups.values() if len(g) > 1]
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu dupes", description="Perceptual near-duplicate detection for images")
+    parser.add_argument("command", choices=["index", "check", "list"])
+    parser.add_argument("files", nargs="*", help="Local images to check")
+    parser.add_argument("-d", "--distance", type=int, help="Max Hamming distance (default: near_duplicate_distance)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    cfg = load_config()
+    if args.distance is not None:
+        cfg["near_duplicate_distance"] = args.distance
+    if not decoder_available():
+        eprint("Note: no image decoder (Pillow or sips) found; only BMP files can be hashed")
+
+    if args.command == "index":
+        workers = max(1, int(cfg.get("near_duplicate_workers", 8)))
+        try:
+            total, hashed = refresh_index(cfg, get_token(cfg), workers, args.verbose)
+        except Exception as e:
+            eprint(f"Index failed: {e}")
+            sys.exit(1)
+        eprint(f"Indexed {total} image(s) ({hashed} newly hashed)")
+        return
+
+    if args.command == "list":
+        for group in clusters(cfg):
+            print("\n".join(group) + "\n")
+        return
+
+    if not args.files:
+        parser.error("check needs at least one file")
+    found = 0
+    for path in args.files:
+        path = os.path.expanduser(path)
+        _, hashes = hashes_for_file(path)
+        if not hashes:
+            eprint(f"Can't hash {path}")
+            continue
+        algorithm, _ = settings(cfg)
+        for d, remote in near(cfg, hashes[HASH_ALGORITHMS.index(algorithm)]):
+            print(f"{path}\t{d}\t{url_for(cfg, remote)}")
+            found += 1
+    save_index(cfg)
+    if found:
+        sys.exit(1)
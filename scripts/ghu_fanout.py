@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Fan-out layout - spreads large upload folders over prefix subfolders and keeps a name -> path index per prefix folder"""
+import argparse
+import datetime as dt
+import hashlib
+import json
+import os
+import sys
+
+from ghuploader import (
+    DATA_DIR, commit_tree_entries, eprint, get_token, load_config, load_tree_index, raw_url_for,
+)
+
+FANOUT_INDEX_FILE = os.path.join(DATA_DIR, "fanout-index.json")
+# Generated in every prefix folder: {"file name": "path relative to the fanned-out folder"}
+INDEX_NAME = "index.json"
+FANOUT_MODES = ("initial", "hash")
+
+def mode(cfg):
+    m = cfg.get("fanout", "")
+    return m if m in FANOUT_MODES else ""
+
+def depth(cfg):
+    return max(1, int(cfg.get("fanout_depth", 1)))
+
+def enabled(cfg, cat):
+    """Whether new uploads of this category go into prefix subfolders (never Scripts: packages keep their layout)."""
+    cats = cfg.get("fanout_categories")
+    return bool(mode(cfg)) and cat != "Scripts" and (not cats or cat in cats)
+
+def initial_key(name):
+    return "".join(c if c.isascii() and c.isalnum() else "_" for c in name.lower())
+
+def bucket_dirs(cfg, name):
+    """Prefix folders for a file: "initial" uses the name ("b/be" at depth 2), "hash" a SHA-1 of the name ("3f/a2").
+
+    Both depend on the name only, so a path can be checked without the content: the tree's blob SHA of
+    an LFS file is its pointer's, and a replaced file keeps its path.
+    """
+    if mode(cfg) == "hash":
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()
+        return [digest[2 * i:2 * i + 2] for i in range(depth(cfg))]
+    key = initial_key(os.path.splitext(name)[0]) or "_"
+    key = key.ljust(depth(cfg), "_")
+    return [key[:i + 1] for i in range(depth(cfg))]
+
+def place(cfg, folder, name, cat):
+    """Repo path for a file named `name` that build_repo_path files into `folder`."""
+    if not enabled(cfg, cat):
+        return f"{folder}/{name}"
+    return "/".join([folder] + bucket_dirs(cfg, name) + [name])
+
+def split(cfg, path):
+    """(folder, name) if path is a fanned-out path under the current settings, else None."""
+    if not mode(cfg):
+        return None
+    parts = path.split("/")
+    n = depth(cfg)
+    if len(parts) < n + 2:
+        return None
+    name = parts[-1]
+    if parts[-n - 1:-1] != bucket_dirs(cfg, name):
+        return None
+    return "/".join(parts[:-n - 1]), name
+
+def target_key(cfg):
+    return f"{cfg['owner']}/{cfg['repo']}@{cfg.get('branch', 'main')}"
+
+def load_local():
+    try:
+        with open(FANOUT_INDEX_FILE, "r") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_local(data):
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        tmp = f"{FANOUT_INDEX_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, FANOUT_INDEX_FILE)
+    except Exception:
+        pass
+
+def index_path(cfg, folder, name):
+    """Repo path of the index listing a file: one per prefix folder, so every index write stays small."""
+    return "/".join([folder] + bucket_dirs(cfg, name) + [INDEX_NAME])
+
+def index_entries(cfg, added, removed=()):
+    """Tree entries updating the indexes of the touched prefix folders, for the commit that moves the files.
+
+    They are merge entries (see commit_tree_entries): each index is read back from the commit they
+    are applied to, so runs committing at the same time keep each other's names.
+
+    Args:
+        added: list of (folder, name, path relative to folder)
+        removed: list of (folder, name)
+    """
+    changes = {}
+    local = load_local()
+    known = local.setdefault(target_key(cfg), {})
+    for folder, name in removed:
+        changes.setdefault(index_path(cfg, folder, name), {})[name] = None
+        known.get(folder, {}).pop(name, None)
+    for folder, name, rel in added:
+        changes.setdefault(index_path(cfg, folder, name), {})[name] = rel
+        known.setdefault(folder, {})[name] = rel
+    save_local(local)
+    return [{"path": path, "mode": "100644", "type": "blob", "merge": "json", "set": names}
+            for path, names in sorted(changes.items())]
+
+def entries_for_uploads(cfg, items):
+    """Index entries for files being uploaded into prefix folders, committed together with them.
+
+    Args:
+        items: list of (local_path, remote_path, category) tuples
+    """
+    added = []
+    for _, path, cat in items:
+        if not enabled(cfg, cat):
+            continue
+        hit = split(cfg, path)
+        if hit:
+            added.append((hit[0], hit[1], path[len(hit[0]) + 1:]))
+    return index_entries(cfg, added) if added else []
+
+def resolve(cfg, ref):
+    """Current repo path for a file name or a flat path like Uploads/Images/Covers/Name.jpg (local index)."""
+    folders = load_local().get(target_key(cfg), {})
+    folder, name = os.path.split(ref.strip("/"))
+    if folder:
+        rel = folders.get(folder, {}).get(name)
+        return f"{folder}/{rel}" if rel else None
+    for folder, index in sorted(folders.items()):
+        if name in index:
+            return f"{folder}/{index[name]}"
+    return None
+
+def rebuild(cfg, token, dry_run=False):
+    """Regenerate every prefix-folder index from the remote tree. Returns the number of indexed files."""
+    tree = load_tree_index(cfg, token)
+    folders = {}
+    for path in tree:
+        if os.path.basename(path) == INDEX_NAME:
+            continue
+        hit = split(cfg, path)
+        if hit:
+            folders.setdefault(hit[0], {})[hit[1]] = path[len(hit[0]) + 1:]
+    # Files still sitting directly in an indexed folder (uploaded before fan-out) are listed too
+    for path in tree:
+        folder, name = os.path.split(path)
+        if folder in folders and name != INDEX_NAME:
+            folders[folder].setdefault(name, name)
+    indexes = {}
+    for folder, names in folders.items():
+        for name, rel in names.items():
+            indexes.setdefault(index_path(cfg, folder, name), {})[name] = rel
+    if dry_run:
+        for path, index in sorted(indexes.items()):
+            print(f"{path}: {len(index)} file(s)")
+        return sum(len(i) for i in folders.values())
+    entries = [{"path": path, "mode": "100644", "type": "blob",
+                "content": json.dumps(dict(sorted(index.items())), indent=0, ensure_ascii=False) + "\n"}
+               for path, index in sorted(indexes.items())]
+    # Indexes nothing maps to any more, and folder-wide ones from before indexes were split per prefix folder
+    n = depth(cfg)
+    for path in tree:
+        parts = path.split("/")
+        if parts[-1] != INDEX_NAME or path in indexes:
+            continue
+        if "/".join(parts[:-1]) in folders or "/".join(parts[:-n - 1]) in folders:
+            entries.append({"path": path, "mode": "100644", "type": "blob", "sha": None})
+    if entries:
+        now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        commit_tree_entries(cfg, token, entries, f"Rebuild fan-out index ({len(indexes)} folder(s)) @ {now}")
+    local = load_local()
+    local[target_key(cfg)] = {folder: dict(sorted(index.items())) for folder, index in folders.items()}
+    save_local(local)
+    return sum(len(i) for i in folders.values())
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu fanout", description="Fan-out layout indexes")
+    parser.add_argument("command", choices=["resolve", "rebuild"])
+    parser.add_argument("names", nargs="*", help="File names or flat repo paths (resolve)")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what rebuild would index")
+    args = parser.parse_args(argv)
+
+    cfg = load_config()
+    if args.command == "rebuild":
+        if not mode(cfg):
+            eprint("Fan-out is off (set `fanout` to \"initial\" or \"hash\" in config.json)")
+            sys.exit(2)
+        try:
+            count = rebuild(cfg, get_token(cfg), args.dry_run)
+        except Exception as e:
+            eprint(f"Rebuild failed: {e}")
+            sys.exit(1)
+        eprint(f"Indexed {count} file(s)")
+        return
+    missing = 0
+    for ref in args.names:
+        path = resolve(cfg, ref)
+        if path:
+            print(raw_url_for(cfg, path))
+        else:
+            eprint(f"Not in index: {ref}")
+            missing += 1
+    if missing:
+        sys.exit(1)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Fast-start remux - moves an MP4/MOV `moov` atom in front of the media data so playback can start right away"""
+import argparse
+import atexit
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+from ghuploader import eprint
+
+FASTSTART_EXT = {".mp4", ".mov", ".m4v"}
+# Atoms on the path from moov to the chunk offset tables
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+COPY_CHUNK = 1024 * 1024
+
+_temp_dirs = []
+
+def read_atoms(f, size):
+    """Top-level atoms as (type, offset, total size). Raises ValueError on a malformed file."""
+    atoms = []
+    pos = 0
+    while pos < size:
+        f.seek(pos)
+        header = f.read(16)
+        if len(header) < 8:
+            raise ValueError(f"truncated atom header at {pos}")
+        length, kind = struct.unpack(">I4s", header[:8])
+        if length == 1:
+            if len(header) < 16:
+                raise ValueError(f"truncated 64-bit atom header at {pos}")
+            length = struct.unpack(">Q", header[8:16])[0]
+        elif length == 0:
+            # Runs to the end of the file
+            length = size - pos
+        if length < 8 or pos + length > size:
+            raise ValueError(f"bad atom size {length} for {kind!r} at {pos}")
+        atoms.append((kind, pos, length))
+        pos += length
+    return atoms
+
+def child_atoms(buf):
+    """(type, header bytes, payload) for each atom inside a container payload."""
+    out = []
+    pos = 0
+    while pos + 8 <= len(buf):
+        length, kind = struct.unpack_from(">I4s", buf, pos)
+        header_len = 8
+        if length == 1:
+            length = struct.unpack_from(">Q", buf, pos + 8)[0]
+            header_len = 16
+        elif length == 0:
+            length = len(buf) - pos
+        if length < header_len or pos + length > len(buf):
+            raise ValueError(f"bad child atom size {length} for {kind!r}")
+        out.append((kind, buf[pos:pos + header_len], buf[pos + header_len:pos + length]))
+        pos += length
+    return out
+
+def atom(kind, payload):
+    if len(payload) + 8 <= 0xFFFFFFFF:
+        return struct.pack(">I4s", len(payload) + 8, kind) + payload
+    return struct.pack(">I4sQ", 1, kind, len(payload) + 16) + payload
+
+def rebuild(buf, shift):
+    """Container payload with every stco/co64 offset passed through shift(); stco becomes co64 on overflow."""
+    out = []
+    for kind, header, payload in child_atoms(buf):
+        if kind in CONTAINERS:
+            out.append(atom(kind, rebuild(payload, shift)))
+        elif kind in (b"stco", b"co64"):
+            wide = kind == b"co64"
+            count = struct.unpack_from(">I", payload, 4)[0]
+            offsets = struct.unpack_from(f">{count}{'Q' if wide else 'I'}", payload, 8)
+            moved = [shift(o) for o in offsets]
+            if not wide and moved and max(moved) > 0xFFFFFFFF:
+                wide = True
+            table = struct.pack(f">{count}{'Q' if wide else 'I'}", *moved)
+            out.append(atom(b"co64" if wide else b"stco", payload[:8] + table))
+        else:
+            out.append(header + payload)
+    return b"".join(out)
+
+def needs_faststart(path):
+    """True if the file is a non-fragmented MP4/MOV whose moov comes after its mdat."""
+    with open(path, "rb") as f:
+        atoms = read_atoms(f, os.path.getsize(path))
+    kinds = [a[0] for a in atoms]
+    if b"moov" not in kinds or b"mdat" not in kinds or b"moof" in kinds:
+        return False
+    return kinds.index(b"moov") > kinds.index(b"mdat")
+
+def copy_range(src, dst, start, length):
+    src.seek(start)
+    while length > 0:
+        chunk = src.read(min(COPY_CHUNK, length))
+        if not chunk:
+            raise ValueError("file ended early")
+        dst.write(chunk)
+        length -= len(chunk)
+
+def remux(src_path, dst_path):
+    """Write a fast-start copy of src_path: moov moved in front of the first mdat, chunk offsets patched.
+
+    Only the moov atom is held in memory; media data is streamed through unchanged.
+
+    Returns:
+        False if the file was already fast-start (or fragmented) and nothing was written
+    """
+    size = os.path.getsize(src_path)
+    with open(src_path, "rb") as src:
+        atoms = read_atoms(src, size)
+        kinds = [a[0] for a in atoms]
+        if b"moov" not in kinds or b"mdat" not in kinds or b"moof" in kinds:
+            return False
+        m = kinds.index(b"moov")
+        k = kinds.index(b"mdat")
+        if m < k:
+            return False
+        _, moov_pos, moov_size = atoms[m]
+        insert_pos = atoms[k][1]
+        src.seek(moov_pos)
+        moov = src.read(moov_size)
+        header_len = 16 if struct.unpack_from(">I", moov)[0] == 1 else 8
+        payload = moov[header_len:]
+        if any(kind == b"cmov" for kind, _, _ in child_atoms(payload)):
+            raise ValueError("compressed moov atoms are not supported")
+
+        # Converting stco to co64 grows moov, which moves the data again: repeat until the size settles
+        new_size = moov_size
+        for _ in range(3):
+            def shift(offset, grow=new_size):
+                if insert_pos <= offset < moov_pos:
+                    return offset + grow
+                if offset >= moov_pos + moov_size:
+                    return offset + grow - moov_size
+                return offset
+            new_moov = atom(b"moov", rebuild(payload, shift))
+            if len(new_moov) == new_size:
+                break
+            new_size = len(new_moov)
+        else:
+            raise ValueError("moov size did not settle")
+
+        with open(dst_path, "wb") as dst:
+            copy_range(src, dst, 0, insert_pos)
+            dst.write(new_moov)
+            for i, (_, pos, length) in enumerate(atoms[k:], k):
+                if i != m:
+                    copy_range(src, dst, pos, length)
+    return True
+
+def cleanup():
+    for d in _temp_dirs:
+        shutil.rmtree(d, ignore_errors=True)
+
+def prepare(path, verbose=False):
+    """Fast-start copy of a video for upload, in a temp folder under the same name; None if not needed.
+
+    Problems with the file are reported and the original is uploaded as is.
+    """
+    if os.path.splitext(path)[1].lower() not in FASTSTART_EXT:
+        return None
+    try:
+        if not needs_faststart(path):
+            return None
+        tmp_dir = tempfile.mkdtemp(prefix="gupload_faststart_")
+        if not _temp_dirs:
+            atexit.register(cleanup)
+        _temp_dirs.append(tmp_dir)
+        out = os.path.join(tmp_dir, os.path.basename(path))
+        if verbose:
+            eprint("  → Moving moov atom to the front (fast start)...")
+        if not remux(path, out):
+            return None
+        return out
+    except (OSError, ValueError, struct.error) as e:
+        eprint(f"  → Fast start skipped for {os.path.basename(path)}: {e}")
+        return None
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu faststart",
+                                     description="Check MP4/MOV files for fast start, or write fast-start copies")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("-o", "--output-dir", help="Write fast-start copies here (default: only report)")
+    args = parser.parse_args(argv)
+    status = 0
+    for path in args.files:
+        try:
+            slow = needs_faststart(path)
+        except (OSError, ValueError) as e:
+            eprint(f"{path}: {e}")
+            status = 1
+            continue
+        if not slow or not args.output_dir:
+            print(f"{path}: {'moov after mdat (not fast start)' if slow else 'fast start'}")
+            continue
+        os.makedirs(args.output_dir, exist_ok=True)
+        out = os.path.join(args.output_dir, os.path.basename(path))
+        if os.path.abspath(out) == os.path.abspath(path):
+            eprint(f"{path}: output would overwrite the input")
+            status = 1
+            continue
+        remux(path, out)
+        print(f"{path}: wrote {out}")
+    sys.exit(status)
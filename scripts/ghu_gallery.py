@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""ghu gallery - build image galleries and audio playlists from the repo tree, incrementally"""
+import argparse
+import datetime as dt
+import hashlib
+import html
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import ghu_metrics
+from ghuploader import (
+    AUDIO_EXT, DATA_DIR, IMAGE_EXT, RECENT_FILE, commit_tree_entries, create_blob, eprint,
+    fetch_remote_tree, get_blob, get_token, git_blob_sha, load_config, raw_url_for, sanitize_filename,
+)
+
+GALLERY_STATE_FILE = os.path.join(DATA_DIR, "gallery-state.json")
+THUMB_DIR = os.path.join(DATA_DIR, "thumbs")
+# Bump when page markup changes so every page is regenerated once
+GALLERY_VERSION = 1
+# Formats browsers can't always thumbnail from; they link the original instead
+NO_THUMB_EXT = {".svg"}
+
+def uploads_root(cfg):
+    base = cfg.get("repo_path_prefix", "")
+    return f"{base}/Uploads" if base else "Uploads"
+
+def gallery_root(cfg):
+    base = cfg.get("repo_path_prefix", "")
+    path = cfg.get("gallery_path", "Uploads/Galleries").strip("/")
+    return f"{base}/{path}" if base else path
+
+def load_state():
+    try:
+        with open(GALLERY_STATE_FILE, "r") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_state(state):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(GALLERY_STATE_FILE, "w") as f:
+        json.dump(state, f, indent=2)
+
+def artist_for_remote_path(parts):
+    """Best-effort artist for a path relative to Uploads/ (e.g. ["Audio", "Artist", "x.mp3"])."""
+    if parts[0] == "Audio" and len(parts) > 2:
+        return parts[1]
+    name = os.path.splitext(parts[-1])[0]
+    if " - " in name:
+        return name.split(" - ")[0].strip()
+    return None
+
+def group_pages(cfg, blobs, root, by):
+    """Group media blobs into pages. Returns {page key: [(path, sha), ...]}."""
+    import ghu_fanout
+    pages = {}
+    for path, sha in blobs.items():
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in IMAGE_EXT and ext not in AUDIO_EXT:
+            continue
+        # Fan-out prefix folders don't make pages of their own
+        hit = ghu_fanout.split(cfg, path)
+        parts = (f"{hit[0]}/{hit[1]}" if hit else path)[len(root) + 1:].split("/")
+        if by == "artist":
+            key = artist_for_remote_path(parts)
+            if not key:
+                continue
+        else:
+            # Category plus first subfolder: Images/Covers, Audio/<Artist>, Images
+            key = "/".join(parts[:2]) if len(parts) > 2 else parts[0]
+        pages.setdefault(key, []).append((path, sha))
+    for items in pages.values():
+        items.sort(key=lambda item: os.path.basename(item[0]).lower())
+    return pages
+
+def page_slug(key):
+    return sanitize_filename(key.replace("/", " ")).lower()
+
+def page_signature(items, fmt):
+    """Changes whenever a page's inputs (paths, contents) or the markup version change."""
+    h = hashlib.sha1(json.dumps([GALLERY_VERSION, fmt, items]).encode("utf-8"))
+    return h.hexdigest()
+
+def thumbnailer_available():
+    try:
+        import PIL  # noqa: F401
+        return True
+    except ImportError:
+        return shutil.which("sips") is not None
+
+def make_thumbnail(src, dst, size):
+    """Write a JPEG thumbnail with Pillow, or macOS `sips` when Pillow isn't installed."""
+    tmp = f"{dst}.{os.getpid()}.part.jpg"
+    try:
+        try:
+            from PIL import Image
+        except ImportError:
+            Image = None
+        if Image is not None:
+            with Image.open(src) as im:
+                im.thumbnail((size, size))
+                if im.mode not in ("RGB", "L"):
+                    im = im.convert("RGB")
+                im.save(tmp, "JPEG", quality=80, optimize=True, progressive=True)
+        elif shutil.which("sips"):
+            subprocess.run(["sips", "-s", "format", "jpeg", "-Z", str(size), src, "--out", tmp],
+                           check=True, capture_output=True)
+        else:
+            return False
+        os.replace(tmp, dst)
+        return True
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return False
+
+def local_sources(cfg):
+    """Map uploaded URLs to local files from the upload history, so originals needn't be downloaded."""
+    try:
+        with open(RECENT_FILE, "r") as f:
+            recent = json.load(f)
+    except Exception:
+        return {}
+    by_url = {item.get("url"): item.get("filepath") for item in recent}
+    return by_url
+
+def ensure_thumbnails(cfg, token, images, size, workers):
+    """Make sure a cached thumbnail exists for each (path, sha). Returns the set of SHAs that have one."""
+    os.makedirs(THUMB_DIR, exist_ok=True)
+    ready = set()
+    todo = []
+    for path, sha in images:
+        cached = os.path.exists(os.path.join(THUMB_DIR, f"{sha}.jpg"))
+        ghu_metrics.cache_lookup("thumbnails", cached)
+        if cached:
+            ready.add(sha)
+        elif os.path.splitext(path)[1].lower() not in NO_THUMB_EXT:
+            todo.append((path, sha))
+    if not todo:
+        return ready
+
+    by_url = local_sources(cfg)
+    tmp_dir = tempfile.mkdtemp(prefix="gupload_thumbs_")
+
+    def source_for(item):
+        path, sha = item
+        local = by_url.get(raw_url_for(cfg, path))
+        try:
+            if local and os.path.isfile(local) and git_blob_sha(local) == sha:
+                return local
+        except OSError:
+            pass
+        # Not on disk (or changed since upload): fetch the exact blob
+        try:
+            dst = os.path.join(tmp_dir, sha + os.path.splitext(path)[1])
+            with open(dst, "wb") as f:
+                f.write(get_blob(cfg, token, sha))
+            return dst
+        except Exception:
+            return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sources = list(pool.map(source_for, todo))
+        jobs = [(src, os.path.join(THUMB_DIR, f"{sha}.jpg"), sha)
+                for src, (_, sha) in zip(sources, todo) if src]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(make_thumbnail, [j[0] for j in jobs], [j[1] for j in jobs], [size] * len(jobs))
+            for (_, _, sha), ok in zip(jobs, results):
+                if ok:
+                    ready.add(sha)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return ready
+
+def render_markdown(cfg, title, items, thumbs):
+    lines = [f"# {title}", ""]
+    images = [(p, s) for p, s in items if os.path.splitext(p)[1].lower() in IMAGE_EXT]
+    audio = [(p, s) for p, s in items if os.path.splitext(p)[1].lower() in AUDIO_EXT]
+    if images:
+        lines += ["## Images", ""]
+        for path, sha in images:
+            name = os.path.basename(path)
+            src = f"thumbs/{sha}.jpg" if sha in thumbs else raw_url_for(cfg, path)
+            lines.append(f'<a href="{raw_url_for(cfg, path)}"><img src="{src}" alt="{html.escape(name)}" '
+                         f'title="{html.escape(name)}" width="160" loading="lazy"></a>')
+        lines.append("")
+    if audio:
+        lines += ["## Playlist", ""]
+        for n, (path, _) in enumerate(audio, 1):
+            url = raw_url_for(cfg, path)
+            lines.append(f"{n}. [{os.path.basename(path)}]({url})")
+            lines.append(f'   <audio controls preload="none" src="{url}"></audio>')
+        lines.append("")
+    return "\n".join(lines)
+
+def render_html(cfg, title, items, thumbs):
+    t = html.escape(title)
+    out = [
+        "<!DOCTYPE html>",
+        '<html lang="en"><head><meta charset="utf-8">',
+        '<meta name="viewport" content="width=device-width, initial-scale=1">',
+        f"<title>{t}</title>",
+        "<style>body{font-family:-apple-system,sans-serif;margin:2rem;background:#111;color:#eee}"
+        "a{color:#9cf}.grid{display:grid;grid-template-columns:repeat(auto-fill,minmax(160px,1fr));gap:12px}"
+        ".grid figure{margin:0}.grid img{width:100%;aspect-ratio:1;object-fit:cover;background:#222}"
+        ".grid figcaption{font-size:12px;overflow:hidden;text-overflow:ellipsis;white-space:nowrap}"
+        "ol li{margin:.5rem 0}audio{display:block;width:100%;max-width:480px}</style>",
+        f"</head><body><h1>{t}</h1>",
+    ]
+    images = [(p, s) for p, s in items if os.path.splitext(p)[1].lower() in IMAGE_EXT]
+    audio = [(p, s) for p, s in items if os.path.splitext(p)[1].lower() in AUDIO_EXT]
+    if images:
+        out.append('<div class="grid">')
+        for path, sha in images:
+            name = html.escape(os.path.basename(path))
+            full = html.escape(raw_url_for(cfg, path))
+            src = f"thumbs/{sha}.jpg" if sha in thumbs else full
+            out.append(f'<figure><a href="{full}"><img src="{src}" alt="{name}" loading="lazy" decoding="async">'
+                       f"</a><figcaption>{name}</figcaption></figure>")
+        out.append("</div>")
+    if audio:
+        out.append("<h2>Playlist</h2><ol>")
+        for path, _ in audio:
+            url = html.escape(raw_url_for(cfg, path))
+            out.append(f'<li><a href="{url}">{html.escape(os.path.basename(path))}</a>'
+                       f'<audio controls preload="none" src="{url}"></audio></li>')
+        out.append("</ol>")
+    out.append("</body></html>")
+    return "\n".join(out) + "\n"
+
+def render_index(titles, fmt):
+    lines = ["# Galleries", ""]
+    for slug, title in sorted(titles.items(), key=lambda kv: kv[1].lower()):
+        link = f"{slug}.html" if fmt == "html" else f"{slug}.md"
+        lines.append(f"- [{title}]({link})")
+    return "\n".join(lines) + "\n"
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu gallery", description="Generate image galleries and audio playlists")
+    parser.add_argument("--by", choices=["category", "artist"], default="category", help="Page grouping (default: category)")
+    parser.add_argument("--format", choices=["md", "html", "both"], default=None, help="Page format (default: gallery_format or both)")
+    parser.add_argument("--force", action="store_true", help="Rewrite every page even if unchanged")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the pages that would be rewritten")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Verbose output")
+    args = parser.parse_args(argv)
+
+    cfg = load_config()
+    if cfg.get("shards"):
+        import ghu_shards
+        ghu_shards.refuse(cfg, "gallery")
+    token = get_token(cfg)
+    verbose = args.verbose or bool(cfg.get("verbose", False))
+    fmt = args.format or cfg.get("gallery_format", "both")
+    size = int(cfg.get("gallery_thumb_size", 320))
+    workers = max(1, int(cfg.get("gallery_workers", os.cpu_count() or 4)))
+    root = uploads_root(cfg)
+    out_root = f"{gallery_root(cfg)}/{args.by}"
+
+    if verbose:
+        eprint(f"Listing {root}/ ...")
+    blobs = fetch_remote_tree(cfg, token, root)
+    existing = {p: s for p, s in blobs.items() if p.startswith(gallery_root(cfg) + "/")}
+    inputs = {p: s for p, s in blobs.items() if p not in existing}
+    pages = group_pages(cfg, inputs, root, args.by)
+    titles = {page_slug(key): key for key in pages}
+
+    state = load_state()
+    page_state = state.setdefault(out_root, {})
+    exts = ["md", "html"] if fmt == "both" else [fmt]
+    changed = []
+    for key, items in pages.items():
+        slug = page_slug(key)
+        sig = page_signature(items, fmt)
+        prev = page_state.get(slug, {})
+        present = all(f"{out_root}/{slug}.{ext}" in existing for ext in exts)
+        if args.force or not present or prev.get("sig") != sig or not prev.get("thumbs_complete", False):
+            changed.append((key, slug, sig))
+
+    stale = sorted(p for p in existing if p.startswith(out_root + "/") and "/" not in p[len(out_root) + 1:]
+                   and p != f"{out_root}/README.md"
+                   and os.path.splitext(os.path.basename(p))[0] not in titles)
+    index_sig = page_signature(sorted(titles.items()), fmt)
+    index_changed = args.force or page_state.get("_index") != index_sig or f"{out_root}/README.md" not in existing
+
+    if not changed and not index_changed and not stale:
+        eprint(f"Galleries up to date ({len(pages)} page(s)).")
+        return
+    for _, slug, _ in changed:
+        print(f"~ {out_root}/{slug}.{'/'.join(exts)}")
+    for path in stale:
+        print(f"- {path}")
+    if args.dry_run:
+        eprint(f"Dry run: {len(changed)} of {len(pages)} page(s) would be rewritten")
+        return
+
+    images = sorted({(p, s) for key, _, _ in changed for p, s in pages[key]
+                     if os.path.splitext(p)[1].lower() in IMAGE_EXT}, key=lambda item: item[1])
+    # Thumbnails already in the repo are reused as-is
+    remote_thumbs = {s for _, s in images if f"{out_root}/thumbs/{s}.jpg" in existing}
+    missing = [(p, s) for p, s in images if s not in remote_thumbs]
+    if verbose:
+        eprint(f"Preparing thumbnails for {len(missing)} image(s)...")
+    new_thumbs = ensure_thumbnails(cfg, token, missing, size, workers)
+    thumbs = remote_thumbs | new_thumbs
+
+    # (repo path, bytes) to commit: new thumbnails, rewritten pages, index
+    files = []
+    for sha in sorted(new_thumbs & {s for _, s in missing}):
+        with open(os.path.join(THUMB_DIR, f"{sha}.jpg"), "rb") as f:
+            files.append((f"{out_root}/thumbs/{sha}.jpg", f.read()))
+    for key, slug, sig in changed:
+        items = pages[key]
+        if "md" in exts:
+            files.append((f"{out_root}/{slug}.md", render_markdown(cfg, key, items, thumbs).encode("utf-8")))
+        if "html" in exts:
+            files.append((f"{out_root}/{slug}.html", render_html(cfg, key, items, thumbs).encode("utf-8")))
+    if index_changed:
+        files.append((f"{out_root}/README.md", render_index(titles, fmt).encode("utf-8")))
+
+    with ThreadPoolExecutor(max_workers=min(8, workers)) as pool:
+        shas = list(pool.map(lambda f: create_blob(cfg, token, f[1]), files))
+    entries = [{"path": path, "mode": "100644", "type": "blob", "sha": sha} for (path, _), sha in zip(files, shas)]
+    # Drop pages whose group no longer has any media
+    for path in stale:
+        entries.append({"path": path, "mode": "100644", "type": "blob", "sha": None})
+    now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    commit_tree_entries(cfg, token, entries, f"Update galleries ({len(changed)} page(s)) @ {now}")
+
+    # Without Pillow or sips, pages link originals; don't retry them on every run
+    can_thumb = thumbnailer_available()
+    for key, slug, sig in changed:
+        needed = {s for p, s in pages[key] if os.path.splitext(p)[1].lower() in IMAGE_EXT
+                  and os.path.splitext(p)[1].lower() not in NO_THUMB_EXT}
+        page_state[slug] = {"sig": sig, "thumbs_complete": not can_thumb or needed <= thumbs}
+    page_state["_index"] = index_sig
+    for path in stale:
+        page_state.pop(os.path.splitext(os.path.basename(path))[0], None)
+    save_state(state)
+    eprint(f"Updated {len(changed)} gallery page(s) in {out_root}/")
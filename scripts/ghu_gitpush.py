@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Bulk git-push backend - writes uploads into a local bare clone with git fast-import and pushes one pack"""
+import base64
+import contextlib
+import datetime as dt
+import fcntl
+import os
+import re
+import subprocess
+import tempfile
+import time
+
+import ghu_metrics
+import ghu_sched
+from ghuploader import DATA_DIR, raw_url_for
+
+def remote_url(cfg):
+    """Return the git remote to push to. `git_remote_url` overrides GitHub (e.g. a local bare repo)."""
+    return cfg.get("git_remote_url") or f"https://github.com/{cfg['owner']}/{cfg['repo']}.git"
+
+def cache_dir(cfg):
+    """Location of the local bare clone used for imports."""
+    custom = cfg.get("git_cache_dir")
+    if custom:
+        return os.path.expanduser(custom)
+    name = re.sub(r"[^A-Za-z0-9._-]+", "-", f"{cfg['owner']}-{cfg['repo']}")
+    return os.path.join(DATA_DIR, "git", f"{name}.git")
+
+@contextlib.contextmanager
+def clone_lock(cfg):
+    """Hold the local clone for one fetch, import and push. The clone is shared by every branch and run
+    of a repo, and a concurrent import would move the branch ref this run is about to push."""
+    git_dir = cache_dir(cfg)
+    os.makedirs(os.path.dirname(git_dir), exist_ok=True)
+    with open(f"{git_dir}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+def git(cfg, token, args, git_dir=None, **kwargs):
+    """Run a git command, passing the token as an HTTP header when talking to GitHub."""
+    cmd = ["git"]
+    if token and remote_url(cfg).startswith("https://"):
+        creds = base64.b64encode(f"x-access-token:{token}".encode("utf-8")).decode("ascii")
+        cmd += ["-c", f"http.extraHeader=Authorization: Basic {creds}"]
+    if git_dir:
+        cmd += ["--git-dir", git_dir]
+    return subprocess.run(cmd + args, check=True, capture_output=True, **kwargs)
+
+def rev_parse(cfg, git_dir, ref):
+    try:
+        return git(cfg, None, ["rev-parse", "--verify", "--quiet", ref], git_dir=git_dir, text=True).stdout.strip()
+    except subprocess.CalledProcessError:
+        return None
+
+def sync_clone(cfg, token):
+    """Create or refresh the blobless, shallow bare clone. Returns (git_dir, head_sha or None)."""
+    branch = cfg.get("branch", "main")
+    git_dir = cache_dir(cfg)
+    ref = f"refs/heads/{branch}"
+    if not os.path.isdir(git_dir):
+        os.makedirs(os.path.dirname(git_dir), exist_ok=True)
+        git(cfg, token, ["init", "--bare", "--quiet", git_dir])
+        git(cfg, token, ["remote", "add", "origin", remote_url(cfg)], git_dir=git_dir)
+        # Trees are all fast-import needs from the remote; blobs are never downloaded
+        git(cfg, token, ["config", "remote.origin.promisor", "true"], git_dir=git_dir)
+        git(cfg, token, ["config", "remote.origin.partialclonefilter", "blob:none"], git_dir=git_dir)
+    try:
+        git(cfg, token, ["fetch", "--quiet", "--depth=1", "--filter=blob:none", "origin", f"+{ref}:{ref}"],
+            git_dir=git_dir)
+    except subprocess.CalledProcessError as e:
+        # An empty remote has no branch yet; the import then creates a root commit
+        if b"couldn't find remote ref" not in (e.stderr or b""):
+            raise RuntimeError(f"git fetch failed: {e.stderr.decode('utf-8', errors='replace').strip()}") from None
+    return git_dir, rev_parse(cfg, git_dir, ref)
+
+def quote_path(path):
+    """Quote a path for a fast-import filemodify line when it can't be written bare."""
+    if path.startswith('"') or "\n" in path or "\\" in path:
+        return '"' + path.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+    return path
+
+def merged_files(cfg, token, git_dir, parent, entries):
+    """[(repo path, bytes)] of merge entries (see commit_tree_entries) applied to the files in `parent`."""
+    from ghuploader import merged_content
+    files = []
+    for entry in entries:
+        sha = rev_parse(cfg, git_dir, f"{parent}:{entry['path']}") if parent else None
+        # Blobless clone: git fetches the one blob it is asked for
+        text = git(cfg, token, ["cat-file", "blob", sha], git_dir=git_dir).stdout.decode("utf-8") if sha else None
+        files.append((entry["path"], merged_content(entry, text).encode("utf-8")))
+    return files
+
+def fast_import(cfg, git_dir, parent, items, message, files=()):
+    """Stream blobs and a single commit into the bare repo. Returns the new commit SHA.
+
+    Args:
+        files: extra (repo path, bytes) written inline (generated files like fan-out indexes)
+    """
+    branch = cfg.get("branch", "main")
+    ref = f"refs/heads/{branch}"
+    name = cfg.get("git_author_name", "Gupload")
+    email = cfg.get("git_author_email", "gupload@users.noreply.github.com")
+    with tempfile.TemporaryFile() as err_file:
+        proc = subprocess.Popen(["git", "--git-dir", git_dir, "fast-import", "--quiet", "--force"],
+                                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=err_file)
+        out = proc.stdin
+        try:
+            for mark, (local_path, _remote_path, _category) in enumerate(items, 1):
+                size = os.path.getsize(local_path)
+                out.write(f"blob\nmark :{mark}\ndata {size}\n".encode("utf-8"))
+                with open(local_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        out.write(chunk)
+                out.write(b"\n")
+            msg = message.encode("utf-8")
+            out.write(f"commit {ref}\ncommitter {name} <{email}> {int(time.time())} +0000\n".encode("utf-8"))
+            out.write(f"data {len(msg)}\n".encode("utf-8") + msg + b"\n")
+            if parent:
+                out.write(f"from {parent}\n".encode("utf-8"))
+            for mark, (_local_path, remote_path, _category) in enumerate(items, 1):
+                out.write(f"M 100644 :{mark} {quote_path(remote_path)}\n".encode("utf-8"))
+            for remote_path, data in files:
+                out.write(f"M 100644 inline {quote_path(remote_path)}\ndata {len(data)}\n".encode("utf-8") + data + b"\n")
+            out.write(b"\ndone\n")
+            out.close()
+        except BrokenPipeError:
+            pass
+        proc.wait()
+        if proc.returncode != 0:
+            err_file.seek(0)
+            raise RuntimeError(f"git fast-import failed: {err_file.read().decode('utf-8', errors='replace').strip()}")
+    return rev_parse(cfg, git_dir, ref)
+
+def push_files(cfg, token, items):
+    """Import files into one commit at their repo paths and push it in a single pack.
+
+    Args:
+        items: list of (local_path, remote_path, category) tuples
+
+    Returns:
+        (urls, errors) dicts keyed by remote_path
+    """
+    branch = cfg.get("branch", "main")
+    now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if len(items) == 1:
+        message = f"Upload ({items[0][2]}) {os.path.basename(items[0][0])} @ {now}"
+    else:
+        message = f"Upload {len(items)} files via git push @ {now}"
+
+    # Fan-out indexes go into the same commit, merged into their state at the parent
+    index_entries = []
+    if cfg.get("fanout"):
+        import ghu_fanout
+        index_entries = ghu_fanout.entries_for_uploads(cfg, items)
+
+    last_error = None
+    # A concurrent upload can move the branch between fetch and push; rebuild on top once
+    for attempt in range(2):
+        if attempt:
+            ghu_metrics.retried("git-push", "push-rejected")
+        # git sends the pack at full speed, so at least don't start it during an interactive upload
+        # (waited for outside the clone lock: the run we yield to may need the same clone)
+        ghu_sched.wait_turn()
+        try:
+            with clone_lock(cfg):
+                git_dir, parent = sync_clone(cfg, token)
+                files = merged_files(cfg, token, git_dir, parent, index_entries)
+                fast_import(cfg, git_dir, parent, items, message, files)
+                started = time.perf_counter()
+                git(cfg, token, ["push", "--quiet", "origin", f"refs/heads/{branch}:refs/heads/{branch}"],
+                    git_dir=git_dir)
+            ghu_metrics.observe("ghu_api_request_duration_seconds", {"endpoint": "git-push"},
+                                time.perf_counter() - started)
+            return {remote_path: raw_url_for(cfg, remote_path) for _, remote_path, _ in items}, {}
+        except subprocess.CalledProcessError as e:
+            last_error = e.stderr.decode("utf-8", errors="replace").strip() if e.stderr else str(e)
+        except Exception as e:
+            last_error = str(e)
+    return {}, {remote_path: f"git push failed: {last_error}" for _, remote_path, _ in items}
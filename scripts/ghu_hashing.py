@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Hashing service - single-pass SHA-1 / git blob SHA / SHA-256 with a persistent stat-keyed cache"""
+import atexit
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ghu_metrics
+from ghuploader import DATA_DIR
+
+HASH_CACHE_FILE = os.path.join(DATA_DIR, "hash-cache.json")
+# Feed hashers in large slices so hashlib releases the GIL and threads run in parallel
+SLICE_SIZE = 8 * 1024 * 1024
+# Entries of deleted or changed files are swept out at most this often (a stat per entry)
+PRUNE_INTERVAL = 24 * 3600
+
+_cache = None
+# Entries this run added: merged into what other runs wrote meanwhile on save
+_added = {}
+_lock = threading.Lock()
+
+def cache_key(st):
+    """Files are considered unchanged while (device, inode, size, mtime_ns) stay the same."""
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+def load_hash_cache():
+    global _cache
+    with _lock:
+        if _cache is None:
+            try:
+                with open(HASH_CACHE_FILE, "r") as f:
+                    _cache = json.load(f)
+            except Exception:
+                _cache = {}
+            atexit.register(save_hash_cache)
+        return _cache
+
+def prune(cache, sweep=False):
+    """Drop stale entries: older states of an inode that has a newer one, and with sweep=True every
+    entry whose file is gone or has changed since (entries without a path can't be checked)."""
+    newest = {}
+    for key in cache:
+        dev, ino, _, mtime = key.split(":")
+        if int(mtime) > newest.get((dev, ino), (-1, None))[0]:
+            newest[(dev, ino)] = (int(mtime), key)
+    keep = {key for _, key in newest.values()}
+    pruned = {}
+    for key, digests in cache.items():
+        if key not in keep:
+            continue
+        if sweep:
+            try:
+                if cache_key(os.stat(digests["path"])) != key:
+                    continue
+            except (KeyError, OSError):
+                continue
+        pruned[key] = digests
+    return pruned
+
+def save_hash_cache():
+    """Merge this run's entries into the cache file under a lock shared with other runs, pruning stale ones."""
+    global _cache
+    with _lock:
+        if not _added:
+            return
+        added = dict(_added)
+        _added.clear()
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        # Opened for append so the lock file's mtime only changes on a sweep (it records the last one)
+        with open(f"{HASH_CACHE_FILE}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(HASH_CACHE_FILE, "r") as f:
+                    cache = json.load(f)
+            except Exception:
+                cache = {}
+            cache.update(added)
+            sweep = time.time() - os.fstat(lock.fileno()).st_mtime > PRUNE_INTERVAL
+            cache = prune(cache, sweep)
+            tmp = f"{HASH_CACHE_FILE}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(cache, f, separators=(",", ":"))
+            os.replace(tmp, HASH_CACHE_FILE)
+            if sweep:
+                os.utime(lock.fileno())
+        _cache = cache
+    except Exception:
+        # Don't fail uploads if the cache can't be written
+        pass
+
+def compute_digests(path, size):
+    """Read a file once (memory-mapped) and return its SHA-1, git blob SHA and SHA-256."""
+    sha1 = hashlib.sha1()
+    git = hashlib.sha1(b"blob %d\0" % size)
+    sha256 = hashlib.sha256()
+    if size:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for start in range(0, size, SLICE_SIZE):
+                    chunk = view[start:start + SLICE_SIZE]
+                    sha1.update(chunk)
+                    git.update(chunk)
+                    sha256.update(chunk)
+                    chunk.release()
+            finally:
+                view.release()
+    return {"sha1": sha1.hexdigest(), "git_sha": git.hexdigest(), "sha256": sha256.hexdigest(), "size": size}
+
+def file_digests(path):
+    """Return {"sha1", "git_sha", "sha256", "size"} for a file, re-reading it only if it changed."""
+    cache = load_hash_cache()
+    st = os.stat(path)
+    key = cache_key(st)
+    hit = cache.get(key)
+    ghu_metrics.cache_lookup("hash", bool(hit))
+    if hit:
+        return hit
+    digests = compute_digests(path, st.st_size)
+    digests["path"] = os.path.abspath(path)
+    with _lock:
+        cache[key] = digests
+        _added[key] = digests
+    return digests
+
+def hash_files(paths, workers=None):
+    """Hash many files in a thread pool. Returns a list of digest dicts in input order."""
+    paths = list(paths)
+    if workers is None:
+        workers = min(32, (os.cpu_count() or 4) + 4)
+    if len(paths) <= 1 or workers <= 1:
+        return [file_digests(p) for p in paths]
+    load_hash_cache()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(file_digests, paths))
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Git LFS transfer backend - uploads objects via the LFS batch API and commits pointer files"""
+import base64
+import datetime as dt
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import ghu_metrics
+import ghu_sched
+from ghu_hashing import file_digests
+from ghuploader import commit_tree_entries, encode_repo_path
+
+LFS_MEDIA_TYPE = "application/vnd.git-lfs+json"
+LFS_POINTER_VERSION = "https://git-lfs.github.com/spec/v1"
+# The batch API spec recommends at most 100 objects per request
+LFS_BATCH_SIZE = 100
+
+def lfs_endpoint(cfg):
+    """Return the LFS server URL. `lfs_url` overrides GitHub (e.g. a local stand-in server)."""
+    custom = cfg.get("lfs_url")
+    if custom:
+        return custom.rstrip("/")
+    return f"https://github.com/{cfg['owner']}/{cfg['repo']}.git/info/lfs"
+
+def lfs_auth_headers(cfg, token):
+    """GitHub's LFS endpoint takes HTTP Basic auth with the token as password."""
+    creds = base64.b64encode(f"{cfg['owner']}:{token}".encode("utf-8")).decode("ascii")
+    return {"Authorization": f"Basic {creds}"}
+
+def media_url_for(cfg, remote_path):
+    """Build the media.githubusercontent.com URL that serves LFS content for a path."""
+    owner = cfg["owner"]
+    repo = cfg["repo"]
+    branch = cfg.get("branch", "main")
+    return f"https://media.githubusercontent.com/media/{owner}/{repo}/{branch}/{encode_repo_path(remote_path)}"
+
+def sha256_file(path):
+    """Return (oid, size) for a file, where oid is the hex SHA-256 used by LFS."""
+    digests = file_digests(path)
+    return digests["sha256"], digests["size"]
+
+def pointer_text(oid, size):
+    """Build the contents of an LFS pointer file."""
+    return f"version {LFS_POINTER_VERSION}\noid sha256:{oid}\nsize {size}\n"
+
+def gitattributes_pattern(remote_path):
+    """Escape a repo path for use as a literal .gitattributes pattern."""
+    pattern = remote_path
+    for ch in ("\\", "*", "?", "["):
+        pattern = pattern.replace(ch, "\\" + ch)
+    # Patterns can't contain raw whitespace
+    return pattern.replace(" ", "[[:space:]]")
+
+def lfs_request(method, url, headers=None, data=None):
+    h = {"Accept": LFS_MEDIA_TYPE, "Content-Type": LFS_MEDIA_TYPE, "User-Agent": "ghuploader"}
+    if headers:
+        h.update(headers)
+    body = json.dumps(data).encode("utf-8") if data is not None else None
+    ghu_sched.wait_turn()
+    req = urllib.request.Request(url, data=body, headers=h, method=method)
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req) as resp:
+            raw = resp.read()
+            ghu_metrics.record_response(method, url, resp.status, time.perf_counter() - started, resp.headers)
+            return json.loads(raw.decode("utf-8")) if raw else None
+    except urllib.error.HTTPError as err:
+        msg = err.read().decode("utf-8", errors="replace")
+        ghu_metrics.record_response(method, url, err.code, time.perf_counter() - started, err.headers)
+        raise RuntimeError(f"{method} {url} -> {err.code}\n{msg}") from None
+
+def batch_upload_request(endpoint, headers, objects):
+    """Ask the LFS server where to upload objects. Returns the response object list."""
+    payload = {
+        "operation": "upload",
+        "transfers": ["basic"],
+        "objects": [{"oid": oid, "size": size} for oid, size in objects],
+    }
+    resp = lfs_request("POST", f"{endpoint}/objects/batch", headers=headers, data=payload)
+    return (resp or {}).get("objects", [])
+
+def transfer_object(obj, local_path):
+    """Upload one object according to its batch response entry (basic transfer adapter)."""
+    if obj.get("error"):
+        err = obj["error"]
+        raise RuntimeError(f"LFS server rejected object: {err.get('code')} {err.get('message')}")
+    actions = obj.get("actions") or {}
+    upload = actions.get("upload")
+    if not upload:
+        # No upload action means the server already has this object
+        return
+    h = dict(upload.get("header") or {})
+    h["Content-Type"] = "application/octet-stream"
+    h["Content-Length"] = str(obj["size"])
+    ghu_sched.wait_turn()
+    with open(local_path, "rb") as f:
+        # Streamed through this run's bandwidth bucket (slows to a trickle while an interactive run uploads)
+        req = urllib.request.Request(upload["href"], data=ghu_sched.stream(f, obj["size"]), headers=h, method="PUT")
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req) as resp:
+                resp.read()
+                ghu_metrics.record_response("PUT", upload["href"], resp.status, time.perf_counter() - started)
+        except urllib.error.HTTPError as err:
+            msg = err.read().decode("utf-8", errors="replace")
+            ghu_metrics.record_response("PUT", upload["href"], err.code, time.perf_counter() - started)
+            raise RuntimeError(f"PUT {upload['href']} -> {err.code}\n{msg}") from None
+    verify = actions.get("verify")
+    if verify:
+        lfs_request("POST", verify["href"], headers=verify.get("header"),
+                    data={"oid": obj["oid"], "size": obj["size"]})
+
+def upload_lfs_files(cfg, token, items):
+    """Upload files through Git LFS and commit their pointer files in one commit.
+
+    Args:
+        items: list of (local_path, remote_path, category) tuples
+
+    Returns:
+        (urls, errors) dicts keyed by remote_path
+    """
+    workers = max(1, int(cfg.get("lfs_workers", 4)))
+    endpoint = lfs_endpoint(cfg)
+    headers = lfs_auth_headers(cfg, token)
+    urls = {}
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hashes = list(pool.map(lambda item: sha256_file(item[0]), items))
+
+        # Identical content only needs to be transferred once
+        by_oid = {}
+        for item, (oid, size) in zip(items, hashes):
+            by_oid.setdefault(oid, (item[0], size))
+
+        failed_oids = {}
+        oids = list(by_oid.items())
+        for start in range(0, len(oids), LFS_BATCH_SIZE):
+            chunk = oids[start:start + LFS_BATCH_SIZE]
+            try:
+                objects = batch_upload_request(endpoint, headers, [(oid, size) for oid, (_, size) in chunk])
+            except Exception as e:
+                for oid, _ in chunk:
+                    failed_oids[oid] = str(e)
+                continue
+            futures = {}
+            for obj in objects:
+                local_path = by_oid.get(obj.get("oid"), (None,))[0]
+                if local_path:
+                    futures[obj["oid"]] = pool.submit(transfer_object, obj, local_path)
+            for oid, _ in chunk:
+                if oid not in futures:
+                    failed_oids[oid] = "LFS server returned no entry for object"
+            for oid, fut in futures.items():
+                try:
+                    fut.result()
+                except Exception as e:
+                    failed_oids[oid] = str(e)
+
+    entries = []
+    committed = []
+    for (local_path, remote_path, category), (oid, size) in zip(items, hashes):
+        if oid in failed_oids:
+            errors[remote_path] = failed_oids[oid]
+            continue
+        entries.append({"path": remote_path, "mode": "100644", "type": "blob",
+                        "content": pointer_text(oid, size)})
+        committed.append((local_path, remote_path, category))
+
+    if not entries:
+        return urls, errors
+
+    # Track the new paths in .gitattributes so clients and GitHub treat them as LFS pointers. A merge
+    # entry: the lines are added to .gitattributes as it is in the commit this one builds on, so a
+    # concurrent LFS run's lines survive.
+    base = cfg.get("repo_path_prefix", "")
+    attrs_path = f"{base}/.gitattributes" if base else ".gitattributes"
+    lines = []
+    for _, remote_path, _ in committed:
+        rel = remote_path[len(base) + 1:] if base else remote_path
+        lines.append(f"{gitattributes_pattern(rel)} filter=lfs diff=lfs merge=lfs -text")
+    entries.append({"path": attrs_path, "mode": "100644", "type": "blob", "merge": "lines", "lines": lines})
+    if cfg.get("fanout"):
+        import ghu_fanout
+        entries.extend(ghu_fanout.entries_for_uploads(cfg, committed))
+
+    now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if len(committed) == 1:
+        msg = f"Upload ({committed[0][2]}) {os.path.basename(committed[0][0])} via LFS @ {now}"
+    else:
+        msg = f"Upload {len(committed)} files via LFS @ {now}"
+    try:
+        commit_tree_entries(cfg, token, entries, msg)
+    except Exception as e:
+        for _, remote_path, _ in committed:
+            errors[remote_path] = f"Objects uploaded but pointer commit failed: {e}"
+        return urls, errors
+
+    for _, remote_path, _ in committed:
+        urls[remote_path] = media_url_for(cfg, remote_path)
+    return urls, errors
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""Local music-library catalog - artist -> albums -> tracks/covers/logos, rescanned incrementally by directory mtime"""
+import argparse
+import datetime as dt
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ghuploader import AUDIO_EXT, DATA_DIR, IMAGE_EXT, eprint, get_image_type, load_config
+
+LIBRARY_FILE = os.path.join(DATA_DIR, "library.json")
+ALBUM_DIR_RE = re.compile(r"^\d{4}\s*-\s*.+")
+
+_catalog = None
+_index = None
+_lock = threading.Lock()
+
+def library_root(cfg):
+    root = cfg.get("library_path", "")
+    return os.path.abspath(os.path.expanduser(root)) if root else ""
+
+def is_album_dir(name):
+    """Album folders are named "YYYY - Album"."""
+    return bool(ALBUM_DIR_RE.match(name))
+
+def scan_dir(path, cached):
+    """List one directory, reusing the cached listing while its mtime is unchanged."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    if cached and cached.get("mtime") == mtime:
+        return cached
+    dirs, files = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+                except OSError:
+                    pass
+    except OSError:
+        return None
+    return {"mtime": mtime, "dirs": sorted(dirs), "files": sorted(files)}
+
+def scan_tree(root, dirs, start="", workers=16):
+    """Refresh the listing of `start` (relative to root) and everything below it, one level at a time.
+
+    Only directories whose mtime changed are re-listed; the rest cost one stat.
+    Returns the number of directories that were re-listed.
+    """
+    prefix = f"{start}/" if start else ""
+    old = {rel: entry for rel, entry in dirs.items() if rel == start or rel.startswith(prefix) or not start}
+    for rel in old:
+        del dirs[rel]
+    rescanned = 0
+    level = [start]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while level:
+            paths = [os.path.join(root, rel) if rel else root for rel in level]
+            results = list(pool.map(scan_dir, paths, [old.get(rel) for rel in level]))
+            next_level = []
+            for rel, entry in zip(level, results):
+                if entry is None:
+                    continue
+                if entry is not old.get(rel):
+                    rescanned += 1
+                dirs[rel] = entry
+                next_level.extend(f"{rel}/{d}" if rel else d for d in entry["dirs"])
+            level = next_level
+    return rescanned
+
+def build_artists(dirs):
+    """Derive {artist: {"paths": [...], "albums": {album: rel}}} from directory listings.
+
+    An artist folder has audio files or "YYYY - Album" subfolders; single-letter index folders
+    and anything below an artist folder (albums, CD1/CD2, scans) are never artists themselves.
+    """
+    artists = {}
+    owned = []
+    for rel in sorted(dirs, key=lambda r: (r.count("/"), r)):
+        if any(rel.startswith(f"{o}/") for o in owned):
+            continue
+        name = os.path.basename(rel)
+        if not rel or len(name) <= 1 or is_album_dir(name):
+            continue
+        entry = dirs[rel]
+        albums = [d for d in entry["dirs"] if is_album_dir(d)]
+        has_audio = any(os.path.splitext(f)[1].lower() in AUDIO_EXT for f in entry["files"])
+        if not (albums or has_audio):
+            continue
+        owned.append(rel)
+        artist = artists.setdefault(name, {"paths": [], "albums": {}})
+        artist["paths"].append(rel)
+        for album in albums:
+            artist["albums"].setdefault(album, f"{rel}/{album}")
+    return artists
+
+def load_catalog():
+    global _catalog
+    with _lock:
+        if _catalog is None:
+            try:
+                with open(LIBRARY_FILE, "r") as f:
+                    _catalog = json.load(f)
+            except Exception:
+                _catalog = {}
+        return _catalog
+
+def save_catalog(catalog):
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        tmp = f"{LIBRARY_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(catalog, f, separators=(",", ":"))
+        os.replace(tmp, LIBRARY_FILE)
+    except Exception:
+        pass
+
+def update_catalog(cfg, start="", verbose=False):
+    """Scan the library (or just the `start` subtree) incrementally and save the catalog."""
+    global _index
+    root = library_root(cfg)
+    if not root or not os.path.isdir(root):
+        raise RuntimeError(f"Library not found: {root or '(library_path not set)'}")
+    catalog = load_catalog()
+    if catalog.get("root") != root:
+        catalog.clear()
+        catalog.update({"root": root, "dirs": {}})
+    workers = max(1, int(cfg.get("library_workers", 16)))
+    rescanned = scan_tree(root, catalog["dirs"], start, workers)
+    if rescanned or "artists" not in catalog:
+        catalog["artists"] = build_artists(catalog["dirs"])
+        catalog["scanned"] = dt.datetime.now().isoformat()
+        save_catalog(catalog)
+        _index = None
+    if verbose:
+        eprint(f"Catalog: {len(catalog['dirs'])} folders ({rescanned} re-listed), {len(catalog['artists'])} artists")
+    return catalog
+
+def dir_index(catalog):
+    """{relative dir: (artist, album or None)} for every folder at or below an artist folder."""
+    global _index
+    if _index is None:
+        index = {}
+        dirs = catalog.get("dirs", {})
+        for name, artist in catalog.get("artists", {}).items():
+            albums = {rel: album for album, rel in artist["albums"].items()}
+            for path in artist["paths"]:
+                stack = [(path, None)]
+                while stack:
+                    rel, album = stack.pop()
+                    album = albums.get(rel, album)
+                    index[rel] = (name, album)
+                    stack.extend((f"{rel}/{d}", album) for d in dirs.get(rel, {}).get("dirs", []))
+        _index = index
+    return _index
+
+def lookup(path):
+    """Return (artist, album or None) for a file inside the cataloged library, or None if not known."""
+    catalog = load_catalog()
+    root = catalog.get("root")
+    if not root:
+        return None
+    parent = os.path.dirname(os.path.abspath(os.path.expanduser(path)))
+    if parent != root and not parent.startswith(root + os.sep):
+        return None
+    return dir_index(catalog).get(os.path.relpath(parent, root).replace(os.sep, "/"))
+
+def artist_files(catalog, name, kinds=("audio", "images", "other")):
+    """Absolute paths of an artist's files (recursively), filtered by kind."""
+    artist = catalog.get("artists", {}).get(name)
+    if not artist:
+        return []
+    root = catalog["root"]
+    dirs = catalog["dirs"]
+    out = []
+    for path in artist["paths"]:
+        stack = [path]
+        while stack:
+            rel = stack.pop()
+            entry = dirs.get(rel)
+            if not entry:
+                continue
+            for f in entry["files"]:
+                ext = os.path.splitext(f)[1].lower()
+                kind = "audio" if ext in AUDIO_EXT else "images" if ext in IMAGE_EXT else "other"
+                if kind in kinds:
+                    out.append(os.path.join(root, rel, f))
+            stack.extend(f"{rel}/{d}" for d in reversed(entry["dirs"]))
+    return out
+
+def artist_assets(catalog, name):
+    """Cover/logo/artist images the asset uploader looks for: covers in albums, logo/artist at the top."""
+    assets = []
+    for p in artist_files(catalog, name, kinds=("images",)):
+        image_type = get_image_type(os.path.basename(p))
+        rel = os.path.relpath(os.path.dirname(p), catalog["root"]).replace(os.sep, "/")
+        at_top = rel in catalog["artists"][name]["paths"]
+        if image_type == "cover" or (image_type in ("logo", "artist") and at_top):
+            assets.append(p)
+    return assets
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu library", description="Catalog of the local music library")
+    parser.add_argument("command", nargs="?", default="scan",
+                        choices=["scan", "artists", "albums", "path", "tracks", "files", "assets"])
+    parser.add_argument("artist", nargs="?", help="Artist name (for albums/path/tracks/files/assets)")
+    parser.add_argument("-0", "--print0", action="store_true", help="Separate output with NUL instead of newline")
+    parser.add_argument("--refresh", action="store_true", help="Rescan before listing artists")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    cfg = load_config()
+    try:
+        if args.command == "scan":
+            update_catalog(cfg, verbose=True)
+            return
+        catalog = load_catalog()
+        if args.refresh or catalog.get("root") != library_root(cfg):
+            catalog = update_catalog(cfg, verbose=args.verbose)
+        if args.command != "artists":
+            if not args.artist:
+                parser.error(f"{args.command} needs an artist name")
+            artist = catalog.get("artists", {}).get(args.artist)
+            if not artist:
+                eprint(f"Artist not in catalog: {args.artist}")
+                sys.exit(1)
+            if args.command not in ("path", "albums"):
+                # Pick up files added since the last scan; only this artist's folders are stat'ed
+                for rel in artist["paths"]:
+                    catalog = update_catalog(cfg, start=rel, verbose=args.verbose)
+    except RuntimeError as e:
+        eprint(str(e))
+        sys.exit(1)
+
+    root = catalog["root"]
+    if args.command == "artists":
+        lines = sorted(catalog["artists"], key=str.lower)
+    elif args.command == "albums":
+        lines = sorted(catalog["artists"][args.artist]["albums"])
+    elif args.command == "path":
+        lines = [os.path.join(root, rel) for rel in catalog["artists"][args.artist]["paths"]]
+    elif args.command == "tracks":
+        lines = artist_files(catalog, args.artist, kinds=("audio",))
+    elif args.command == "files":
+        lines = artist_files(catalog, args.artist)
+    else:
+        lines = artist_assets(catalog, args.artist)
+    sep = "\0" if args.print0 else "\n"
+    if lines:
+        sys.stdout.write(sep.join(lines) + sep)
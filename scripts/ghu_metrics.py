@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Metrics - cumulative upload/API counters persisted across runs, exported as JSON and a Prometheus textfile"""
+import argparse
+import atexit
+import datetime as dt
+import fcntl
+import json
+import os
+import sys
+import threading
+import urllib.parse
+
+from ghuploader import CONFIG_PATH, DATA_DIR, eprint
+
+METRICS_FILE = os.path.join(DATA_DIR, "metrics.json")
+METRICS_TEXTFILE = os.path.join(DATA_DIR, "metrics.prom")
+# Request latency buckets (seconds); the last bucket is +Inf
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+METRIC_HELP = {
+    "ghu_uploaded_bytes_total": ("counter", "Bytes of file content uploaded, per backend"),
+    "ghu_uploaded_files_total": ("counter", "Files uploaded, per backend"),
+    "ghu_upload_errors_total": ("counter", "Files that failed to upload, per backend"),
+    "ghu_api_requests_total": ("counter", "HTTP requests to GitHub/LFS, per endpoint, method and status"),
+    "ghu_api_request_duration_seconds": ("histogram", "HTTP request latency per endpoint"),
+    "ghu_api_retries_total": ("counter", "Requests retried (git pushes rebuilt after a concurrent branch update)"),
+    "ghu_ratelimit_remaining": ("gauge", "Last X-RateLimit-Remaining seen, per rate-limit resource"),
+    "ghu_ratelimit_limit": ("gauge", "Last X-RateLimit-Limit seen, per rate-limit resource"),
+    "ghu_ratelimit_reset_timestamp": ("gauge", "Unix time the rate-limit window resets, per resource"),
+    "ghu_cache_hits_total": ("counter", "Lookups answered from a local cache"),
+    "ghu_cache_misses_total": ("counter", "Lookups that had to compute or fetch"),
+    "ghu_cache_hit_ratio": ("gauge", "hits / (hits + misses) per cache, over all runs"),
+}
+
+# Changes since the last flush: {"counters"|"gauges": {name: {label key: value}}, "histograms": ...}
+_pending = {"counters": {}, "gauges": {}, "histograms": {}}
+_registered = False
+_lock = threading.Lock()
+
+def label_key(labels):
+    """Stable string form of a label dict, e.g. 'backend="contents",method="PUT"'."""
+    return ",".join(f'{k}="{labels[k]}"' for k in sorted(labels or {}))
+
+def _touch():
+    global _registered
+    if not _registered:
+        _registered = True
+        atexit.register(flush)
+
+def inc(name, labels=None, value=1):
+    with _lock:
+        _touch()
+        series = _pending["counters"].setdefault(name, {})
+        key = label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+def set_gauge(name, labels, value):
+    with _lock:
+        _touch()
+        _pending["gauges"].setdefault(name, {})[label_key(labels)] = value
+
+def observe(name, labels, seconds):
+    with _lock:
+        _touch()
+        h = _pending["histograms"].setdefault(name, {}).setdefault(
+            label_key(labels), {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "sum": 0.0, "count": 0})
+        idx = next((i for i, b in enumerate(LATENCY_BUCKETS) if seconds <= b), len(LATENCY_BUCKETS))
+        h["buckets"][idx] += 1
+        h["sum"] += seconds
+        h["count"] += 1
+
+def cache_lookup(cache, hit):
+    inc("ghu_cache_hits_total" if hit else "ghu_cache_misses_total", {"cache": cache})
+
+def uploaded(backend, size):
+    inc("ghu_uploaded_files_total", {"backend": backend})
+    inc("ghu_uploaded_bytes_total", {"backend": backend}, size)
+
+def upload_failed(backend):
+    inc("ghu_upload_errors_total", {"backend": backend})
+
+def endpoint_for(url):
+    """Collapse a request URL to a low-cardinality endpoint name (contents, git/blobs, lfs/batch, ...)."""
+    parts = urllib.parse.urlsplit(url)
+    if parts.netloc == "uploads.github.com":
+        return "release-assets"
+    segs = [s for s in parts.path.split("/") if s]
+    if segs and segs[-1] == "batch" and "objects" in segs:
+        return "lfs/batch"
+    if segs and segs[-1] == "verify":
+        return "lfs/verify"
+    if parts.netloc != "api.github.com":
+        return "lfs/transfer"
+    if len(segs) >= 4 and segs[0] == "repos":
+        rest = segs[3:]
+        if rest[0] == "git" and len(rest) > 1:
+            return f"git/{rest[1]}"
+        return rest[0]
+    return segs[0] if segs else "root"
+
+def record_response(method, url, status, seconds, headers=None):
+    """Count one HTTP exchange, its latency and any rate-limit headers it carried."""
+    endpoint = endpoint_for(url)
+    inc("ghu_api_requests_total", {"endpoint": endpoint, "method": method, "status": str(status)})
+    observe("ghu_api_request_duration_seconds", {"endpoint": endpoint}, seconds)
+    if headers is not None and headers.get("X-RateLimit-Remaining") is not None:
+        labels = {"resource": headers.get("X-RateLimit-Resource") or "core"}
+        try:
+            set_gauge("ghu_ratelimit_remaining", labels, int(headers["X-RateLimit-Remaining"]))
+            set_gauge("ghu_ratelimit_limit", labels, int(headers.get("X-RateLimit-Limit") or 0))
+            set_gauge("ghu_ratelimit_reset_timestamp", labels, int(headers.get("X-RateLimit-Reset") or 0))
+        except ValueError:
+            pass
+
+def retried(endpoint, reason):
+    inc("ghu_api_retries_total", {"endpoint": endpoint, "reason": reason})
+
+def load_metrics():
+    try:
+        with open(METRICS_FILE, "r") as f:
+            data = json.load(f)
+    except Exception:
+        data = {}
+    for kind in ("counters", "gauges", "histograms"):
+        data.setdefault(kind, {})
+    return data
+
+def merge(data, pending):
+    for name, series in pending["counters"].items():
+        target = data["counters"].setdefault(name, {})
+        for key, value in series.items():
+            target[key] = target.get(key, 0) + value
+    for name, series in pending["gauges"].items():
+        data["gauges"].setdefault(name, {}).update(series)
+    for name, series in pending["histograms"].items():
+        target = data["histograms"].setdefault(name, {})
+        for key, h in series.items():
+            t = target.setdefault(key, {"buckets": [0] * len(h["buckets"]), "sum": 0.0, "count": 0})
+            t["buckets"] = [a + b for a, b in zip(t["buckets"], h["buckets"])]
+            t["sum"] += h["sum"]
+            t["count"] += h["count"]
+    return data
+
+def textfile_path():
+    """`metrics_textfile` in config (e.g. node_exporter's textfile directory), else DATA_DIR/metrics.prom."""
+    try:
+        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+            path = json.load(f).get("metrics_textfile")
+    except Exception:
+        path = None
+    return os.path.expanduser(path) if path else METRICS_TEXTFILE
+
+def write_atomic(path, text):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def flush():
+    """Merge this run's changes into metrics.json (under a lock shared with other runs) and re-export."""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {"counters": {}, "gauges": {}, "histograms": {}}
+    if not any(pending.values()):
+        return
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(f"{METRICS_FILE}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            data = merge(load_metrics(), pending)
+            data["updated"] = dt.datetime.now().isoformat()
+            write_atomic(METRICS_FILE, json.dumps(data, indent=2) + "\n")
+            write_atomic(textfile_path(), prometheus_text(data))
+    except Exception:
+        # Don't fail uploads if metrics can't be written
+        pass
+
+def hit_ratios(data):
+    hits = data["counters"].get("ghu_cache_hits_total", {})
+    misses = data["counters"].get("ghu_cache_misses_total", {})
+    ratios = {}
+    for key in set(hits) | set(misses):
+        total = hits.get(key, 0) + misses.get(key, 0)
+        if total:
+            ratios[key] = hits.get(key, 0) / total
+    return ratios
+
+def prometheus_text(data):
+    """Render metrics in the Prometheus text exposition format (node_exporter textfile collector)."""
+    series = dict(data["counters"])
+    series.update(data["gauges"])
+    series["ghu_cache_hit_ratio"] = hit_ratios(data)
+    series.update(data["histograms"])
+    lines = []
+    for name in sorted(series):
+        if not series[name]:
+            continue
+        kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key in sorted(series[name]):
+            value = series[name][key]
+            if kind != "histogram":
+                lines.append(f"{name}{{{key}}} {value}" if key else f"{name} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ["+Inf"], value["buckets"]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{{{key + ',' if key else ''}{le}}} {cumulative}")
+            lines.append(f"{name}_sum{{{key}}} {value['sum']:.6f}")
+            lines.append(f"{name}_count{{{key}}} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu metrics", description="Show cumulative upload and API metrics")
+    parser.add_argument("--format", choices=["prom", "json"], default="prom", help="Output format (default: prom)")
+    parser.add_argument("--reset", action="store_true", help="Clear all stored metrics")
+    args = parser.parse_args(argv)
+
+    if args.reset:
+        for path in (METRICS_FILE, textfile_path()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        eprint("Metrics cleared.")
+        return
+
+    data = load_metrics()
+    if args.format == "json":
+        data["cache_hit_ratio"] = hit_ratios(data)
+        json.dump(data, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        sys.stdout.write(prometheus_text(data))
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Waveform peaks - min/max peaks of audio uploads (audiowaveform JSON), cached by content hash"""
+import argparse
+import array
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import wave
+
+from ghuploader import DATA_DIR, eprint, load_config
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PEAKS_DIR = os.path.join(DATA_DIR, "peaks")
+PEAKS_SUFFIX = ".peaks.json"
+WAV_EXT = {".wav", ".wave"}
+# Frames per min/max pair on the first pass; pairs are merged down to `audio_peaks_bins` afterwards
+BLOCK_FRAMES = 256
+READ_FRAMES = BLOCK_FRAMES * 256
+# Mono 16-bit rate non-WAV files are decoded at (plenty for a waveform picture)
+DECODE_RATE = 11025
+DEFAULT_BINS = 2000
+
+def peaks_path(remote_path):
+    """Repo path of the peaks file that goes with an audio file: "Artist - Track.mp3" -> "Artist - Track.peaks.json"."""
+    return os.path.splitext(remote_path)[0] + PEAKS_SUFFIX
+
+def to_int16(data, width):
+    """Little-endian PCM samples of any width as 16-bit (the low bits don't matter for peaks)."""
+    if width == 2:
+        return data
+    out = bytearray(len(data) // width * 2)
+    if width == 1:
+        # 8-bit WAV is unsigned
+        out[1::2] = data.translate(bytes((b - 128) & 0xFF for b in range(256)))
+    else:
+        out[0::2] = data[width - 2::width]
+        out[1::2] = data[width - 1::width]
+    return bytes(out)
+
+def block_minmax(data, block, mins, maxs):
+    """Append min and max of each `block` samples of 16-bit little-endian data."""
+    if np is not None:
+        samples = np.frombuffer(data, dtype="<i2")
+        full = len(samples) - len(samples) % block
+        if full:
+            blocks = samples[:full].reshape(-1, block)
+            mins.extend(blocks.min(axis=1).tolist())
+            maxs.extend(blocks.max(axis=1).tolist())
+        if full < len(samples):
+            mins.append(int(samples[full:].min()))
+            maxs.append(int(samples[full:].max()))
+        return
+    samples = array.array("h", data)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    for i in range(0, len(samples), block):
+        part = samples[i:i + block]
+        mins.append(min(part))
+        maxs.append(max(part))
+
+def scan(read, channels):
+    """(mins, maxs) per BLOCK_FRAMES frames of a 16-bit PCM stream.
+
+    Args:
+        read: function returning up to n bytes (b"" at the end)
+        channels: interleaved channels (a block's min/max covers all of them)
+    """
+    step = BLOCK_FRAMES * channels * 2
+    mins, maxs = [], []
+    rest = b""
+    while True:
+        data = read(step * (READ_FRAMES // BLOCK_FRAMES))
+        if not data:
+            break
+        data = rest + data
+        usable = len(data) - len(data) % step
+        rest = data[usable:]
+        if usable:
+            block_minmax(data[:usable], step // 2, mins, maxs)
+    rest = rest[:len(rest) - len(rest) % 2]
+    if rest:
+        block_minmax(rest, len(rest) // 2, mins, maxs)
+    return mins, maxs
+
+def scan_wav(path):
+    """(mins, maxs, sample rate) of a PCM WAV file via the wave module. Raises wave.Error for other WAVs."""
+    with wave.open(path, "rb") as w:
+        width, channels, rate = w.getsampwidth(), w.getnchannels(), w.getframerate()
+        if width not in (1, 2, 3, 4):
+            raise wave.Error(f"unsupported sample width {width}")
+        mins, maxs = scan(lambda n: to_int16(w.readframes(n // (2 * channels)), width), channels)
+    return mins, maxs, rate
+
+def scan_decoded(path):
+    """(mins, maxs, sample rate) of any audio file decoded by ffmpeg or (macOS) afconvert; None if impossible."""
+    if shutil.which("ffmpeg"):
+        proc = subprocess.Popen(["ffmpeg", "-v", "error", "-i", path, "-f", "s16le", "-ac", "1",
+                                 "-ar", str(DECODE_RATE), "-"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            mins, maxs = scan(proc.stdout.read, 1)
+        finally:
+            proc.stdout.close()
+            status = proc.wait()
+        return (mins, maxs, DECODE_RATE) if status == 0 and mins else None
+    if shutil.which("afconvert"):
+        fd, tmp = tempfile.mkstemp(suffix=".wav", prefix="gupload_peaks_")
+        os.close(fd)
+        try:
+            subprocess.run(["afconvert", "-f", "WAVE", "-d", f"LEI16@{DECODE_RATE}", "-c", "1", path, tmp],
+                           check=True, capture_output=True)
+            return scan_wav(tmp)
+        finally:
+            os.remove(tmp)
+    return None
+
+def decoder_available(path):
+    if os.path.splitext(path)[1].lower() in WAV_EXT:
+        return True
+    return bool(shutil.which("ffmpeg") or shutil.which("afconvert"))
+
+def compute(path, bins=DEFAULT_BINS):
+    """Peaks of an audio file in audiowaveform's JSON layout (version 2, 8-bit); None if it can't be decoded."""
+    scanned = None
+    if os.path.splitext(path)[1].lower() in WAV_EXT:
+        try:
+            scanned = scan_wav(path)
+        except (wave.Error, EOFError):
+            # Float or WAVE_FORMAT_EXTENSIBLE files: leave them to the decoder
+            scanned = None
+    if scanned is None:
+        scanned = scan_decoded(path)
+    if not scanned:
+        return None
+    mins, maxs, rate = scanned
+    group = max(1, math.ceil(len(mins) / max(1, bins)))
+    data = []
+    for i in range(0, len(mins), group):
+        data.append(min(mins[i:i + group]) >> 8)
+        data.append(max(maxs[i:i + group]) >> 8)
+    return {"version": 2, "channels": 1, "sample_rate": rate, "samples_per_pixel": BLOCK_FRAMES * group,
+            "bits": 8, "length": len(data) // 2, "data": data}
+
+def cached_peaks_file(cfg, path):
+    """Local peaks JSON for an audio file, computed once per content hash. None if it can't be decoded."""
+    from ghu_hashing import file_digests
+    bins = int(cfg.get("audio_peaks_bins", DEFAULT_BINS))
+    out = os.path.join(PEAKS_DIR, f"{file_digests(path)['git_sha']}-{bins}.json")
+    if os.path.exists(out):
+        return out
+    peaks = compute(path, bins)
+    if peaks is None:
+        return None
+    os.makedirs(PEAKS_DIR, exist_ok=True)
+    tmp = f"{out}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(peaks, f, separators=(",", ":"))
+    os.replace(tmp, out)
+    return out
+
+def prepare(cfg, path, verbose=False):
+    """Peaks file to upload alongside an audio file, or None. Decode problems are reported, never raised."""
+    if not decoder_available(path):
+        if verbose:
+            eprint("  → No audio decoder for waveform peaks (install ffmpeg)")
+        return None
+    try:
+        out = cached_peaks_file(cfg, path)
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        eprint(f"  → Waveform peaks skipped for {os.path.basename(path)}: {e}")
+        return None
+    if out is None:
+        eprint(f"  → Waveform peaks skipped for {os.path.basename(path)}: could not decode")
+    elif verbose:
+        eprint(f"  → Waveform peaks: {os.path.getsize(out) / 1024:.1f} KB")
+    return out
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu peaks", description="Compute waveform peaks (audiowaveform JSON)")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("-o", "--output-dir", help="Write <name>.peaks.json files here (default: print a summary)")
+    args = parser.parse_args(argv)
+    cfg = load_config()
+    status = 0
+    for path in args.files:
+        out = prepare(cfg, path) if os.path.isfile(path) else None
+        if out is None:
+            eprint(f"{path}: no peaks")
+            status = 1
+            continue
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            dest = os.path.join(args.output_dir, peaks_path(os.path.basename(path)))
+            shutil.copyfile(out, dest)
+            print(f"{path}: wrote {dest}")
+        else:
+            with open(out, "r") as f:
+                peaks = json.load(f)
+            seconds = peaks["length"] * peaks["samples_per_pixel"] / peaks["sample_rate"]
+            print(f"{path}: {peaks['length']} peaks, {peaks['samples_per_pixel']} samples each ({seconds:.0f}s)")
+    sys.exit(status)
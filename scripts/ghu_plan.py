@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""ghu plan - compute remote paths for a whole batch up front and write a reviewable manifest"""
+import argparse
+import csv
+import datetime as dt
+import json
+import os
+import sys
+
+from ghu_hashing import file_digests, hash_files
+from ghuploader import build_repo_path, eprint, get_token, is_url, load_config, load_tree_index
+
+MANIFEST_VERSION = 1
+TSV_FIELDS = ["action", "local", "remote", "category", "size", "sha", "note"]
+
+def expand_inputs(paths):
+    """Expand directories (recursively, skipping dotfiles) into a flat list of files."""
+    files = []
+    for p in paths:
+        p = os.path.expanduser(p)
+        if os.path.isdir(p):
+            for dirpath, dirnames, filenames in os.walk(p):
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+                files.extend(os.path.join(dirpath, f) for f in sorted(filenames) if not f.startswith("."))
+        else:
+            files.append(p)
+    return files
+
+def next_free_path(path, taken, remote, counters):
+    """Sequential " (n)" suffix, as build_repo_path's sequential strategy would pick, resolved in memory."""
+    root, ext = os.path.splitext(path)
+    n = counters.get(path, 2)
+    while True:
+        candidate = f"{root} ({n}){ext}"
+        if candidate not in taken and candidate not in remote:
+            counters[path] = n + 1
+            return candidate
+        n += 1
+
+def plan_paths(cfg, inputs, remote, custom_names=None):
+    """Plan remote paths for every input, resolving collisions against the batch and the remote tree.
+
+    Args:
+        inputs: local file paths
+        remote: {repo path: blob SHA} of the current tree (see load_tree_index)
+        custom_names: optional list of custom names aligned with inputs
+
+    Returns:
+        list of manifest entries (dicts with TSV_FIELDS keys)
+    """
+    dedup = cfg.get("dedup_strategy", "hash")
+    if dedup == "hash" and cfg.get("append_short_hash", True):
+        # build_repo_path needs every file's hash; warm the cache in parallel first
+        hash_files([p for p in inputs if os.path.isfile(p)])
+
+    entries = []
+    taken = {}  # remote path -> index into entries
+    counters = {}
+    for i, p in enumerate(inputs):
+        if not os.path.isfile(p):
+            entries.append({"action": "skip", "local": p, "remote": "", "category": "", "size": 0,
+                            "sha": "", "note": "not a file"})
+            continue
+        custom_name = custom_names[i] if custom_names and i < len(custom_names) else None
+        # No token: collisions are resolved here in memory instead of with remote GETs
+        remote_path, cat = build_repo_path(cfg, p, None, custom_name=custom_name)
+        entry = {"action": "upload", "local": p, "remote": remote_path, "category": cat,
+                 "size": os.path.getsize(p), "sha": "", "note": ""}
+
+        clash = remote_path in taken or remote_path in remote
+        if clash:
+            git_sha = file_digests(p)["git_sha"]
+            if remote_path in taken and file_digests(entries[taken[remote_path]]["local"])["git_sha"] == git_sha:
+                entry.update(action="skip", note=f"duplicate of {entries[taken[remote_path]]['local']}")
+            elif remote_path not in taken and remote[remote_path] == git_sha:
+                entry.update(action="skip", note="already uploaded")
+            elif remote_path not in taken and dedup == "none":
+                # Keep the name and replace the remote file
+                entry.update(action="update", sha=remote[remote_path], note="replaces existing file")
+            else:
+                entry["remote"] = next_free_path(remote_path, taken, remote, counters)
+                entry["note"] = f"renamed from {os.path.basename(remote_path)}"
+
+        if entry["action"] != "skip":
+            taken[entry["remote"]] = len(entries)
+        entries.append(entry)
+    return entries
+
+def write_manifest(entries, out, fmt):
+    if fmt == "tsv":
+        writer = csv.DictWriter(out, fieldnames=TSV_FIELDS, delimiter="\t", lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(entries)
+    else:
+        json.dump({"version": MANIFEST_VERSION, "created": dt.datetime.now().isoformat(), "entries": entries},
+                  out, indent=2)
+        out.write("\n")
+
+def read_manifest(path):
+    """Load manifest entries from a JSON or TSV file written by `ghu plan`."""
+    with open(os.path.expanduser(path), "r", encoding="utf-8", newline="") as f:
+        if path.endswith(".tsv"):
+            entries = list(csv.DictReader(f, delimiter="\t"))
+        else:
+            entries = json.load(f)["entries"]
+    return entries
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu plan", description="Plan remote paths for a batch and write a manifest")
+    parser.add_argument("files", nargs="*", help="Files or folders to plan (default: paths from stdin)")
+    parser.add_argument("--names", nargs="+", dest="custom_names", help="Custom filenames (must match number of files)")
+    parser.add_argument("-o", "--output", help="Write the manifest to this file (.json or .tsv) instead of stdout")
+    parser.add_argument("--format", choices=["json", "tsv"], help="Manifest format (default: from --output extension, else json)")
+    parser.add_argument("--offline", action="store_true", help="Use the cached remote tree without contacting GitHub")
+    args = parser.parse_args(argv)
+
+    paths = args.files
+    if not paths and not sys.stdin.isatty():
+        paths = [line.strip() for line in sys.stdin if line.strip()]
+    urls = [p for p in paths if is_url(p)]
+    for u in urls:
+        eprint(f"Skip (URLs are planned at upload time): {u}")
+    inputs = expand_inputs([p for p in paths if not is_url(p)])
+    if not inputs:
+        eprint("Usage: ghu plan <file|folder> [...] [-o manifest.json]")
+        sys.exit(2)
+
+    cfg = load_config()
+    if cfg.get("shards"):
+        import ghu_shards
+        ghu_shards.refuse(cfg, "plan")
+    token = None if args.offline else get_token(cfg)
+    try:
+        remote = load_tree_index(cfg, token, refresh=not args.offline)
+    except Exception as e:
+        eprint(f"Could not load remote tree ({e}); planning against the batch only")
+        remote = {}
+    if remote is None:
+        eprint("No cached remote tree yet (run `ghu plan` once online); planning against the batch only")
+        remote = {}
+
+    entries = plan_paths(cfg, inputs, remote, args.custom_names)
+
+    fmt = args.format or ("tsv" if (args.output or "").endswith(".tsv") else "json")
+    if args.output:
+        with open(os.path.expanduser(args.output), "w", encoding="utf-8", newline="") as f:
+            write_manifest(entries, f, fmt)
+    else:
+        write_manifest(entries, sys.stdout, fmt)
+
+    counts = {}
+    for e in entries:
+        counts[e["action"]] = counts.get(e["action"], 0) + 1
+    renamed = sum(1 for e in entries if e["note"].startswith("renamed"))
+    summary = ", ".join(f"{n} {action}" for action, n in sorted(counts.items()))
+    eprint(f"Planned {len(entries)} file(s): {summary}; {renamed} renamed to avoid collisions")
+    if args.output:
+        eprint(f"Upload with: ghu --manifest {args.output}")
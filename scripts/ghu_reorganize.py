@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""ghu reorganize - move existing uploads to the current layout with a single tree rewrite"""
+import argparse
+import datetime as dt
+import json
+import os
+import re
+import sys
+
+import ghu_fanout
+from ghu_peaks import PEAKS_SUFFIX, peaks_path
+from ghu_plan import next_free_path
+from ghuploader import (
+    RECENT_FILE, category_for_path, commit_tree_entries, eprint, get_file_text, get_image_type,
+    get_token, load_config, load_tree_index, raw_url_for, repo_folder_for, sanitize_artist_name,
+)
+
+# Top-level Uploads/ folders whose layout build_repo_path owns (Scripts keep their package structure)
+MANAGED_CATEGORIES = {"Audio", "Images", "Video", "Documents", "Docs", "Data", "Archives", "Other"}
+IMAGE_SUBFOLDERS = {"Covers": "cover", "Logos": "logo", "Artists": "artist"}
+
+def strip_dedup_suffix(base):
+    """Drop the short-hash or sequential suffix dedup strategies add, e.g. "-1a2b3c4d" or " (2)"."""
+    base = re.sub(r"-[0-9a-f]{8}$", "", base)
+    return re.sub(r" \(\d+\)$", "", base)
+
+def infer_image_type(parts):
+    """Recover get_image_type's answer for an already-renamed image from its folder or name."""
+    if len(parts) == 3 and parts[0] == "Images" and parts[1] in IMAGE_SUBFOLDERS:
+        return IMAGE_SUBFOLDERS[parts[1]]
+    name = parts[-1]
+    plain = get_image_type(name)
+    if plain:
+        return plain
+    base = strip_dedup_suffix(os.path.splitext(name)[0])
+    low = base.lower()
+    for kind in ("cover", "logo", "artist"):
+        if low.endswith(f"-{kind}") or low.endswith(f" {kind}"):
+            return kind
+    # Album covers are named "Artist - YYYY - Album"
+    if re.match(r"^.+ - \d{4}\s*-\s*.+$", base):
+        return "cover"
+    return None
+
+def infer_artist(parts, artist_folders):
+    """Recover the artist an upload belongs to from its folder or its generated name."""
+    if len(parts) == 3 and parts[0] == "Audio":
+        return parts[1]
+    base = strip_dedup_suffix(os.path.splitext(parts[-1])[0])
+    if " - " in base:
+        return base.split(" - ")[0].strip()
+    m = re.match(r"^(.+?)[- ](logo|artist|cover)$", base, re.IGNORECASE)
+    if m:
+        # Compact names ("coldsteel-logo") only map back through an existing artist folder
+        return artist_folders.get(sanitize_artist_name(m.group(1))) or (
+            m.group(1) if " " in base else None)
+    return None
+
+def target_path(cfg, root, path, artist_folders):
+    """Where the current rules would put an existing upload (same filename), or None to leave it."""
+    if os.path.basename(path) == ghu_fanout.INDEX_NAME:
+        return None
+    if path.endswith(PEAKS_SUFFIX):
+        # Waveform peaks move with their track (plan_moves)
+        return None
+    # Judge fanned-out files by the folder they are filed under
+    hit = ghu_fanout.split(cfg, path)
+    if hit:
+        path = f"{hit[0]}/{hit[1]}"
+    parts = path[len(root) + 1:].split("/")
+    if parts[0] not in MANAGED_CATEGORIES:
+        return None
+    # Only the shapes build_repo_path produces: Cat/name, Images/<Sub>/name, Audio/<Artist>/name
+    if len(parts) == 3 and not (parts[0] == "Audio" or (parts[0] == "Images" and parts[1] in IMAGE_SUBFOLDERS)):
+        return None
+    if len(parts) > 3:
+        return None
+    name = parts[-1]
+    cat = category_for_path(name)
+    if cat == "Scripts":
+        return None
+    image_type = infer_image_type(parts) if cat == "Images" else None
+    artist_name = None
+    if cfg.get("organize_by_artist", False) and (cat == "Audio" or image_type in ("cover", "logo", "artist")):
+        artist_name = infer_artist(parts, artist_folders)
+    if len(parts) == 3 and parts[0] == "Audio" and artist_name != parts[1] and parts[1].lower() not in name.lower():
+        # Leaving the artist folder would lose the artist ("Audio/Deteriorate/logo.png" -> "Images/Logos/logo.png")
+        return None
+    folder = repo_folder_for(cfg, cat, image_type=image_type, artist_name=artist_name)
+    if artist_name:
+        return f"{folder}/{name}"
+    return ghu_fanout.place(cfg, folder, name, cat)
+
+def plan_moves(cfg, tree, root):
+    """Plan the moves that bring the tree to the current layout.
+
+    Returns:
+        (moves, kept, renamed): moves is [(old path, new path or None to drop as duplicate, blob sha)],
+        kept maps dropped paths to the identical file that stays, renamed maps paths that got a
+        free name because their target was taken to that target
+    """
+    artist_folders = {}
+    for path in tree:
+        parts = path[len(root) + 1:].split("/")
+        if len(parts) == 3 and parts[0] == "Audio":
+            artist_folders.setdefault(sanitize_artist_name(parts[1]), parts[1])
+
+    wanted = []
+    for path in sorted(tree):
+        new = target_path(cfg, root, path, artist_folders)
+        if new and new != path:
+            wanted.append((path, new, tree[path]))
+
+    moving = {old for old, _, _ in wanted}
+    occupied = {p: sha for p, sha in tree.items() if p not in moving}
+    counters = {}
+    moves = []
+    dest = {}
+    kept = {}
+    renamed = {}
+    for old, new, sha in wanted:
+        if new in occupied:
+            if occupied[new] == sha:
+                # Identical file already at the destination
+                moves.append((old, None, sha))
+                dest[old] = kept[old] = new
+                continue
+            renamed[old] = new
+            new = next_free_path(new, occupied, {}, counters)
+        occupied[new] = sha
+        moves.append((old, new, sha))
+        dest[old] = new
+
+    for old, new in dest.items():
+        companion = peaks_path(old)
+        if category_for_path(old) != "Audio" or companion not in tree:
+            continue
+        sha = tree[companion]
+        if peaks_path(new) in occupied:
+            # The track at the destination already has its peaks
+            moves.append((companion, None, sha))
+            kept[companion] = peaks_path(new)
+        else:
+            occupied[peaks_path(new)] = sha
+            moves.append((companion, peaks_path(new), sha))
+    return moves, kept, renamed
+
+def rewrite_gitattributes(cfg, token, moves):
+    """Point LFS patterns at moved pointer files. Returns a tree entry or None."""
+    from ghu_lfs import gitattributes_pattern
+    base = cfg.get("repo_path_prefix", "")
+    attrs_path = f"{base}/.gitattributes" if base else ".gitattributes"
+    text = get_file_text(cfg, token, attrs_path)
+    if not text or "filter=lfs" not in text:
+        return None
+    rel = (lambda p: p[len(base) + 1:]) if base else (lambda p: p)
+    renames = {gitattributes_pattern(rel(old)): gitattributes_pattern(rel(new)) for old, new, _ in moves if new}
+    changed = False
+    lines = []
+    for line in text.splitlines():
+        pattern, _, rest = line.partition(" ")
+        if pattern in renames and "filter=lfs" in rest:
+            line = f"{renames[pattern]} {rest}"
+            changed = True
+        lines.append(line)
+    if not changed:
+        return None
+    return {"path": attrs_path, "mode": "100644", "type": "blob", "content": "\n".join(lines) + "\n"}
+
+def update_history(cfg, moves, kept):
+    """Rewrite URLs in the upload history for moved files (raw and LFS media URLs).
+
+    Entries of files dropped as duplicates point at the identical file that stays. Release asset
+    URLs don't depend on the tree and need no change.
+    """
+    from ghu_lfs import media_url_for
+    url_map = {}
+    for old, new, _ in moves:
+        new = new or kept[old]
+        url_map[raw_url_for(cfg, old)] = (raw_url_for(cfg, new), new)
+        url_map[media_url_for(cfg, old)] = (media_url_for(cfg, new), new)
+    try:
+        with open(RECENT_FILE, "r") as f:
+            recent = json.load(f)
+    except Exception:
+        return 0
+    updated = 0
+    for item in recent:
+        hit = url_map.get(item.get("url"))
+        if hit:
+            item["url"] = hit[0]
+            item["filename"] = os.path.basename(hit[1])
+            updated += 1
+    if updated:
+        with open(RECENT_FILE, "w") as f:
+            json.dump(recent, f, indent=2)
+    return updated
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu reorganize",
+                                     description="Move existing uploads to the layout the current config produces")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the moves")
+    args = parser.parse_args(argv)
+
+    cfg = load_config()
+    if cfg.get("shards"):
+        import ghu_shards
+        ghu_shards.refuse(cfg, "reorganize")
+    token = get_token(cfg)
+    base = cfg.get("repo_path_prefix", "")
+    root = f"{base}/Uploads" if base else "Uploads"
+
+    tree = load_tree_index(cfg, token)
+    moves, kept, renamed = plan_moves(cfg, tree, root)
+    if not moves:
+        eprint("Nothing to reorganize.")
+        return
+
+    for old, new, _ in moves:
+        if not new:
+            print(f"{old} -> (duplicate of {kept[old]}, removed)")
+        elif old in renamed:
+            print(f"{old} -> {new}  (renamed: {renamed[old]} is taken)")
+        else:
+            print(f"{old} -> {new}")
+    if args.dry_run:
+        note = f", {len(renamed)} renamed to avoid a collision" if renamed else ""
+        eprint(f"Dry run: {len(moves)} file(s) would move{note}")
+        return
+
+    # Same blob SHAs at new paths: no file content is uploaded
+    entries = []
+    for old, new, sha in moves:
+        if new:
+            entries.append({"path": new, "mode": "100644", "type": "blob", "sha": sha})
+        entries.append({"path": old, "mode": "100644", "type": "blob", "sha": None})
+    attrs = rewrite_gitattributes(cfg, token, moves)
+    if attrs:
+        entries.append(attrs)
+    # Keep the fan-out indexes in step with the moves, in the same commit
+    added, removed = [], []
+    for old, new, sha in moves:
+        was = ghu_fanout.split(cfg, old)
+        if was:
+            removed.append(was)
+        now_at = ghu_fanout.split(cfg, new) if new else None
+        if now_at:
+            added.append((now_at[0], now_at[1], new[len(now_at[0]) + 1:]))
+    if added or removed:
+        entries.extend(ghu_fanout.index_entries(cfg, added, removed))
+
+    now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        commit_tree_entries(cfg, token, entries, f"Reorganize {len(moves)} upload(s) @ {now}")
+    except Exception as e:
+        eprint(f"Reorganize failed: {e}")
+        sys.exit(1)
+    updated = update_history(cfg, moves, kept)
+    if cfg.get("near_duplicates", "off") != "off":
+        import ghu_dupes
+        ghu_dupes.move_images(cfg, moves)
+    eprint(f"Moved {len(moves)} file(s) in one commit; updated {updated} history entr{'y' if updated == 1 else 'ies'}")
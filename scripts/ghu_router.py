@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Upload backend router - estimates per-file cost for each backend from measured throughput/latency"""
+import datetime as dt
+import json
+import os
+import threading
+
+from ghuploader import DATA_DIR, eprint
+
+ROUTER_STATS_FILE = os.path.join(DATA_DIR, "router-stats.json")
+ROUTER_LOG_FILE = os.path.join(DATA_DIR, "router.log")
+
+# Starting points until real measurements exist (seconds, bytes/second)
+DEFAULT_STATS = {
+    "contents": {"latency": 1.2, "throughput": 2_000_000},
+    "gitdata": {"latency": 0.8, "throughput": 2_000_000},
+    "release": {"latency": 1.5, "throughput": 4_000_000},
+    "lfs": {"latency": 1.0, "throughput": 4_000_000},
+}
+# Requests to turn uploaded blobs into a commit: head ref, head commit, tree, commit, ref update
+COMMIT_REQUESTS = 5
+# Round trips a batch pays once, not per file: the commit, plus the LFS batch call and .gitattributes read
+SHARED_REQUESTS = {"gitdata": COMMIT_REQUESTS, "lfs": COMMIT_REQUESTS + 2}
+# Uploads smaller than this are dominated by latency; larger ones measure throughput
+LATENCY_SAMPLE_BYTES = 256 * 1024
+EWMA_ALPHA = 0.2
+
+_lock = threading.Lock()
+
+def load_stats():
+    stats = {name: dict(values) for name, values in DEFAULT_STATS.items()}
+    try:
+        with open(ROUTER_STATS_FILE, "r") as f:
+            for name, values in json.load(f).items():
+                stats.setdefault(name, {}).update(values)
+    except Exception:
+        pass
+    return stats
+
+def save_stats(stats):
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(ROUTER_STATS_FILE, "w") as f:
+            json.dump(stats, f, indent=2)
+    except Exception:
+        pass
+
+def wire_bytes(backend, size):
+    """Bytes actually sent: the JSON APIs carry base64 (4/3 inflation), the others raw bytes."""
+    if backend in ("contents", "gitdata"):
+        return (size + 2) // 3 * 4
+    return size
+
+def parallelism(cfg, backend, requests):
+    """Transfers of a batch that run at the same time (estimate() divides by the same number)."""
+    workers = {"gitdata": "gitdata_workers", "lfs": "lfs_workers"}.get(backend)
+    if not workers:
+        return 1
+    default = 8 if backend == "gitdata" else 4
+    return max(1, min(requests, int(cfg.get(workers, default))))
+
+def record(cfg, backend, size, seconds, requests=1):
+    """Fold a measured upload (or batch of `requests` uploads) into the moving averages.
+
+    Stats are per request and per transfer stream, the inverse of estimate(): a batch's wall time is
+    `requests * latency / parallel` for the transfers plus `SHARED_REQUESTS * latency` for the commit
+    round trips, so neither the parallelism nor the commit is counted twice. Nothing is written
+    unless `router_enabled` is set.
+    """
+    if not cfg.get("router_enabled", False) or seconds <= 0 or requests <= 0:
+        return
+    parallel = parallelism(cfg, backend, requests)
+    shared = SHARED_REQUESTS.get(backend, 0)
+    with _lock:
+        stats = load_stats()
+        s = stats.setdefault(backend, dict(DEFAULT_STATS.get(backend, DEFAULT_STATS["contents"])))
+        sent = wire_bytes(backend, size)
+        if sent / requests < LATENCY_SAMPLE_BYTES:
+            latency = seconds / (requests / parallel + shared)
+            s["latency"] = (1 - EWMA_ALPHA) * s["latency"] + EWMA_ALPHA * latency
+        else:
+            transfer_time = (seconds - shared * s["latency"]) * parallel - requests * s["latency"]
+            if transfer_time <= 0:
+                # Faster than the latency estimate allows: not a usable throughput sample
+                return
+            s["throughput"] = (1 - EWMA_ALPHA) * s["throughput"] + EWMA_ALPHA * (sent / transfer_time)
+        s["samples"] = s.get("samples", 0) + 1
+        save_stats(stats)
+
+def available_backends(cfg, size):
+    """Backends that can take a file of this size with the current config."""
+    limit = float(cfg.get("contents_max_mb", 95)) * 1024 * 1024
+    allowed = cfg.get("router_backends", ["contents", "gitdata", "release"])
+    names = []
+    for name in allowed:
+        if name in ("contents", "gitdata") and size > limit:
+            continue
+        if name == "lfs" and not cfg.get("lfs_enabled", False):
+            continue
+        if size > 2 * 1024 * 1024 * 1024:
+            continue
+        names.append(name)
+    return names
+
+def estimate(cfg, backend, size, batch, stats):
+    """Estimated seconds this file costs on a backend when `batch` files go the same way."""
+    s = stats[backend]
+    transfer = s["latency"] + wire_bytes(backend, size) / s["throughput"]
+    batch = max(1, batch)
+    if backend == "contents":
+        # One PUT per file, each its own commit; requests are sequential
+        return transfer
+    if backend == "gitdata":
+        parallel = parallelism(cfg, backend, batch)
+        return transfer / parallel + SHARED_REQUESTS[backend] * s["latency"] / batch
+    if backend == "lfs":
+        parallel = parallelism(cfg, backend, batch)
+        # Batch API call plus the pointer commit (and .gitattributes read) are shared
+        return transfer / parallel + SHARED_REQUESTS[backend] * s["latency"] / batch
+    if backend == "release":
+        # Release lookup is repeated for each file today
+        return transfer + s["latency"]
+    return float("inf")
+
+def choose_backend(cfg, local_path, size, batch, stats=None, verbose=False):
+    """Pick the cheapest available backend for a file and append the decision to the router log."""
+    stats = stats or load_stats()
+    costs = {name: estimate(cfg, name, size, batch, stats) for name in available_backends(cfg, size)}
+    if not costs:
+        return None, costs
+    chosen = min(costs, key=costs.get)
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(ROUTER_LOG_FILE, "a") as f:
+            f.write(json.dumps({
+                "timestamp": dt.datetime.now().isoformat(),
+                "file": local_path,
+                "size": size,
+                "batch": batch,
+                "costs": {k: round(v, 4) for k, v in costs.items()},
+                "chosen": chosen,
+            }) + "\n")
+    except Exception:
+        pass
+    if verbose:
+        detail = ", ".join(f"{k}={v:.2f}s" for k, v in sorted(costs.items(), key=lambda kv: kv[1]))
+        eprint(f"  → Router: {chosen} ({detail})")
+    return chosen, costs
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Upload scheduler - priority classes across concurrent ghu runs, per-class bandwidth buckets and a shared API budget"""
+import argparse
+import atexit
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+from ghuploader import CONFIG_PATH, DATA_DIR, eprint
+
+SCHED_DIR = os.path.join(DATA_DIR, "sched")
+BUDGET_FILE = os.path.join(SCHED_DIR, "budget.json")
+# Highest priority first
+PRIORITIES = ("interactive", "queue", "background")
+# Requests to leave in the hourly API budget for higher classes (interactive may spend it all)
+DEFAULT_RESERVE = {"interactive": 0, "queue": 300, "background": 1000}
+# Rate (KB/s) lower classes drop to mid-transfer while a higher class is uploading
+DEFAULT_YIELD_KBPS = 64
+POLL_SECONDS = 0.1
+# Bodies at least this big are streamed through the bandwidth bucket instead of sent at once
+STREAM_MIN_BYTES = 256 * 1024
+CHUNK = 64 * 1024
+
+_state = {"priority": None, "registered": False, "settings": None, "tokens": 0.0, "last": None, "runs": None}
+_lock = threading.Lock()
+
+def settings():
+    """Scheduler keys from config.json (read directly: api_request has no cfg)."""
+    if _state["settings"] is None:
+        try:
+            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                cfg = json.load(f)
+        except Exception:
+            cfg = {}
+        _state["settings"] = {
+            "enabled": bool(cfg.get("scheduler_enabled", True)),
+            "bandwidth": {k: float(v) for k, v in (cfg.get("sched_bandwidth_kbps") or {}).items()},
+            "reserve": {**DEFAULT_RESERVE, **(cfg.get("sched_reserve_requests") or {})},
+            "yield_kbps": float(cfg.get("sched_yield_kbps", DEFAULT_YIELD_KBPS)),
+        }
+    return _state["settings"]
+
+def set_priority(priority):
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority {priority!r} (expected one of {', '.join(PRIORITIES)})")
+    _state["priority"] = priority
+    if _state["registered"]:
+        register()
+
+def priority():
+    """This run's class: set_priority(), else $GHU_PRIORITY, else interactive."""
+    if _state["priority"] is None:
+        env = os.environ.get("GHU_PRIORITY", "interactive")
+        _state["priority"] = env if env in PRIORITIES else "interactive"
+    return _state["priority"]
+
+def rank(p):
+    return PRIORITIES.index(p)
+
+def register():
+    """Announce this run (pid + class) to the other ghu processes."""
+    try:
+        os.makedirs(SCHED_DIR, exist_ok=True)
+        path = os.path.join(SCHED_DIR, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"priority": priority(), "started": time.time()}, f)
+        os.replace(f"{path}.tmp", path)
+    except OSError:
+        return
+    if not _state["registered"]:
+        _state["registered"] = True
+        atexit.register(unregister)
+
+def unregister():
+    try:
+        os.remove(os.path.join(SCHED_DIR, f"{os.getpid()}.json"))
+    except OSError:
+        pass
+
+def active_runs():
+    """{pid: priority} of live ghu runs (cached for one poll interval)."""
+    now = time.monotonic()
+    cached = _state["runs"]
+    if cached and now - cached[0] < POLL_SECONDS:
+        return cached[1]
+    runs = {}
+    try:
+        names = os.listdir(SCHED_DIR)
+    except OSError:
+        names = []
+    for name in names:
+        if not name.endswith(".json") or not name[:-5].isdigit():
+            continue
+        pid = int(name[:-5])
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            # Run died without cleaning up
+            try:
+                os.remove(os.path.join(SCHED_DIR, name))
+            except OSError:
+                pass
+            continue
+        except PermissionError:
+            pass
+        try:
+            with open(os.path.join(SCHED_DIR, name), "r") as f:
+                runs[pid] = json.load(f).get("priority", "interactive")
+        except (OSError, ValueError):
+            continue
+    _state["runs"] = (now, runs)
+    return runs
+
+def outranked():
+    """True while a run of a higher class than ours is active."""
+    mine = rank(priority())
+    if mine == 0:
+        return False
+    me = os.getpid()
+    return any(pid != me and p in PRIORITIES and rank(p) < mine for pid, p in active_runs().items())
+
+def holding_branch_lock():
+    # Waiting while holding a branch lock would stall the very run we are yielding to
+    coordinator = sys.modules.get("ghu_coordinator")
+    return bool(coordinator and coordinator.holds_lock())
+
+def class_rate():
+    """Bytes/s this run may use right now (0 = unlimited). A class's bandwidth is split between its runs."""
+    s = settings()
+    if outranked() and s["yield_kbps"] > 0:
+        return s["yield_kbps"] * 1024
+    kbps = s["bandwidth"].get(priority(), 0)
+    if kbps <= 0:
+        return 0
+    peers = sum(1 for p in active_runs().values() if p == priority()) or 1
+    return kbps * 1024 / peers
+
+def throttle(nbytes):
+    """Token bucket: sleep as long as sending nbytes more takes at this run's current rate."""
+    rate = class_rate()
+    with _lock:
+        now = time.monotonic()
+        if not rate:
+            _state["last"] = now
+            return
+        last = _state["last"] if _state["last"] is not None else now
+        # Up to one second of unused bandwidth can be saved up for a burst
+        _state["tokens"] = min(rate, _state["tokens"] + (now - last) * rate) - nbytes
+        _state["last"] = now
+        delay = -_state["tokens"] / rate if _state["tokens"] < 0 else 0
+    if delay > 0:
+        time.sleep(delay)
+
+def read_budget():
+    try:
+        with open(BUDGET_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def note_rate_limit(headers):
+    """Share the core API budget from a response's rate-limit headers with the other runs."""
+    if headers is None or headers.get("X-RateLimit-Remaining") is None:
+        return
+    if (headers.get("X-RateLimit-Resource") or "core") != "core":
+        return
+    try:
+        budget = {"remaining": int(headers["X-RateLimit-Remaining"]),
+                  "reset": int(headers.get("X-RateLimit-Reset") or 0), "updated": time.time()}
+        os.makedirs(SCHED_DIR, exist_ok=True)
+        tmp = f"{BUDGET_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(budget, f)
+        os.replace(tmp, BUDGET_FILE)
+    except (OSError, ValueError):
+        pass
+
+def wait_turn(nbytes=0):
+    """Call before each upload request: waits while outranked or while the API budget is down to our reserve."""
+    s = settings()
+    if not s["enabled"]:
+        return
+    if not _state["registered"]:
+        register()
+    if rank(priority()) > 0 and not holding_branch_lock():
+        announced = False
+        while outranked():
+            if not announced:
+                eprint(f"  … {priority()} upload waiting for a higher-priority run")
+                announced = True
+            time.sleep(POLL_SECONDS)
+        reserve = int(s["reserve"].get(priority(), 0))
+        budget = read_budget()
+        if reserve and budget.get("remaining", reserve + 1) <= reserve and budget.get("reset", 0) > time.time():
+            wait = budget["reset"] - time.time() + 1
+            eprint(f"  … API budget down to {budget['remaining']} requests (reserve {reserve} for higher "
+                   f"priorities); {priority()} run waiting {wait:.0f}s for the reset")
+            time.sleep(wait)
+    if nbytes and nbytes < STREAM_MIN_BYTES:
+        throttle(nbytes)
+
+class ThrottledReader(io.RawIOBase):
+    """File-like request body that passes every chunk through the bandwidth bucket."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def readable(self):
+        return True
+
+    def read(self, n=CHUNK):
+        data = self.f.read(min(n if n and n > 0 else CHUNK, CHUNK))
+        if data:
+            throttle(len(data))
+        return data
+
+def body(data):
+    """Request body for urllib: large bodies are streamed through the bucket when a limit can apply.
+
+    Returns:
+        (data, headers to add)
+    """
+    s = settings()
+    limited = s["enabled"] and (s["bandwidth"].get(priority(), 0) > 0 or rank(priority()) > 0)
+    if data is None or not limited or len(data) < STREAM_MIN_BYTES:
+        return data, {}
+    return ThrottledReader(io.BytesIO(data)), {"Content-Length": str(len(data))}
+
+def stream(f, size):
+    """Wrap an open file for upload the same way as body()."""
+    s = settings()
+    limited = s["enabled"] and (s["bandwidth"].get(priority(), 0) > 0 or rank(priority()) > 0)
+    if not limited or size < STREAM_MIN_BYTES:
+        return f
+    return ThrottledReader(f)
+
+def curl_limit_args():
+    """`--limit-rate` for curl uploads of a rate-limited class (curl can't follow changes mid-transfer)."""
+    rate = class_rate()
+    return ["--limit-rate", f"{int(rate)}"] if rate else []
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu sched", description="Show active ghu runs and the shared API budget")
+    parser.parse_args(argv)
+    runs = active_runs()
+    if not runs:
+        print("No active runs")
+    for pid, p in sorted(runs.items(), key=lambda item: (rank(item[1]) if item[1] in PRIORITIES else 9, item[0])):
+        print(f"{pid:>8}  {p}")
+    budget = read_budget()
+    if budget:
+        reset = max(0, budget.get("reset", 0) - time.time())
+        print(f"API budget: {budget.get('remaining')} requests left, resets in {reset / 60:.0f} min")
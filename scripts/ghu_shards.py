@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Shard router - spreads repo uploads over several repos/branches by consistent hashing, with a local routing manifest"""
+import argparse
+import atexit
+import bisect
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ghuploader import DATA_DIR, eprint, load_config
+
+SHARD_ROUTES_FILE = os.path.join(DATA_DIR, "shard-routes.json")
+# Points per shard on the hash ring; more points spread keys more evenly
+VNODES = 64
+# Keys in shard entries that describe the shard rather than override config
+SHARD_META_KEYS = {"name", "weight"}
+
+_routes = None
+_new_routes = {}
+_lock = threading.Lock()
+
+def shard_id(cfg, shard):
+    return shard.get("name") or f"{shard.get('owner', cfg['owner'])}/{shard.get('repo', cfg['repo'])}@{shard.get('branch', cfg.get('branch', 'main'))}"
+
+def shard_cfg(cfg, shard):
+    """Config for uploading to one shard: the base config with the shard's keys (owner/repo/branch/...) on top."""
+    out = {k: v for k, v in cfg.items() if k != "shards"}
+    out.update({k: v for k, v in shard.items() if k not in SHARD_META_KEYS})
+    return out
+
+def hash_point(key):
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:16], 16)
+
+def build_ring(cfg):
+    """Sorted (point, shard id) list. Adding a shard only moves the keys that land on its points."""
+    ring = []
+    for shard in cfg.get("shards", []):
+        sid = shard_id(cfg, shard)
+        for i in range(int(VNODES * float(shard.get("weight", 1)))):
+            ring.append((hash_point(f"{sid}#{i}"), sid))
+    ring.sort()
+    return ring
+
+def pick_shard(ring, key):
+    idx = bisect.bisect(ring, (hash_point(key), "")) % len(ring)
+    return ring[idx][1]
+
+def load_routes():
+    global _routes
+    with _lock:
+        if _routes is None:
+            try:
+                with open(SHARD_ROUTES_FILE, "r") as f:
+                    _routes = json.load(f)
+            except Exception:
+                _routes = {}
+            _routes.setdefault("routes", {})
+            _routes.setdefault("shards", {})
+            atexit.register(save_routes)
+        return _routes
+
+def save_routes():
+    """Merge routes added by this run into the manifest (routes already there always win)."""
+    with _lock:
+        if not _new_routes:
+            return
+        try:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            with open(f"{SHARD_ROUTES_FILE}.lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    with open(SHARD_ROUTES_FILE, "r") as f:
+                        data = json.load(f)
+                except Exception:
+                    data = {}
+                routes = data.setdefault("routes", {})
+                shards = data.setdefault("shards", {})
+                for path, (sid, coords) in _new_routes.items():
+                    routes.setdefault(path, sid)
+                    shards.setdefault(sid, coords)
+                tmp = f"{SHARD_ROUTES_FILE}.{os.getpid()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump(data, f, separators=(",", ":"))
+                os.replace(tmp, SHARD_ROUTES_FILE)
+            _new_routes.clear()
+        except Exception:
+            # Don't fail uploads if the manifest can't be written
+            pass
+
+def routed_cfg(cfg, remote_path):
+    """Config of the shard a repo path was routed to, or None if it was never routed."""
+    shards = {shard_id(cfg, s): s for s in cfg.get("shards", [])}
+    routes = load_routes()
+    with _lock:
+        sid = routes["routes"].get(remote_path)
+        # Shards removed from the config keep resolving through the coordinates in the manifest
+        shard = shards.get(sid) or routes["shards"].get(sid) if sid else None
+    return shard_cfg(cfg, shard) if shard else None
+
+def refuse(cfg, command):
+    """Exit for commands that only see the main repo, so they never act on part of a sharded library."""
+    eprint(f"ghu {command} doesn't work with shards yet: it would only see {cfg['owner']}/{cfg['repo']}, "
+           f"not the files routed to the {len(cfg['shards'])} shard(s)")
+    sys.exit(2)
+
+def cfg_for(cfg, remote_path, local_path=None):
+    """Config of the shard a repo path lives on. A path keeps its shard once routed, so links stay stable.
+
+    New paths are placed by `shard_by`: "path" hashes the repo path, "content" (default) the file's
+    git blob SHA so identical files land on the same shard.
+    """
+    target = routed_cfg(cfg, remote_path)
+    if target:
+        return target
+    shards = {shard_id(cfg, s): s for s in cfg.get("shards", [])}
+    if not shards:
+        return cfg
+
+    key = remote_path
+    if cfg.get("shard_by", "content") == "content" and local_path and os.path.isfile(local_path):
+        from ghu_hashing import file_digests
+        key = file_digests(local_path)["git_sha"]
+    sid = pick_shard(build_ring(cfg), key)
+    target = shard_cfg(cfg, shards[sid])
+    coords = {"owner": target["owner"], "repo": target["repo"], "branch": target.get("branch", "main")}
+    routes = load_routes()
+    with _lock:
+        routes["routes"][remote_path] = sid
+        routes["shards"].setdefault(sid, coords)
+        _new_routes[remote_path] = (sid, coords)
+    return target
+
+def route_with(cfg, remote_path, leader_path, leader_local=None):
+    """Route remote_path to the shard of leader_path, so a companion file lands in the same commit."""
+    cfg_for(cfg, leader_path, leader_local)
+    routes = load_routes()
+    with _lock:
+        sid = routes["routes"][leader_path]
+        if routes["routes"].setdefault(remote_path, sid) == sid:
+            _new_routes.setdefault(remote_path, (sid, routes["shards"][sid]))
+
+def run_sharded(cfg, token, upload_fn, items):
+    """Run a batching backend once per shard, in parallel, and merge the results.
+
+    Args:
+        upload_fn: backend function taking (cfg, token, items) and returning (urls, errors)
+        items: list of (local_path, remote_path, category) tuples
+
+    Returns:
+        (urls, errors) dicts keyed by remote_path
+    """
+    groups = {}
+    for item in items:
+        target = cfg_for(cfg, item[1], item[0])
+        key = (target["owner"], target["repo"], target.get("branch", "main"))
+        groups.setdefault(key, (target, []))[1].append(item)
+    urls, errors = {}, {}
+    workers = max(1, min(len(groups), int(cfg.get("shard_workers", 4))))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [(batch, pool.submit(upload_fn, target, token, batch)) for target, batch in groups.values()]
+        for batch, fut in futures:
+            try:
+                u, e = fut.result()
+            except Exception as exc:
+                u, e = {}, {rp: str(exc) for _, rp, _ in batch}
+            urls.update(u)
+            errors.update(e)
+    return urls, errors
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu shards", description="Show configured shards and routed files")
+    parser.parse_args(argv)
+    cfg = load_config()
+    routes = load_routes()
+    counts = {}
+    for sid in routes["routes"].values():
+        counts[sid] = counts.get(sid, 0) + 1
+    configured = [shard_id(cfg, s) for s in cfg.get("shards", [])]
+    if not configured:
+        eprint("No shards configured (see `shards` in config.json); uploads go to "
+               f"{cfg['owner']}/{cfg['repo']}@{cfg.get('branch', 'main')}")
+    for sid in configured + sorted(set(counts) - set(configured)):
+        note = "" if sid in configured else "  (no longer configured; routed files still resolve)"
+        print(f"{sid:48} {counts.get(sid, 0):>8} file(s){note}")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""ghu sync - mirror a local folder into the repo, uploading only new or changed files"""
+import argparse
+import datetime as dt
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import ghu_metrics
+from ghuploader import (
+    category_for_path, commit_tree_entries, create_blob, eprint, fetch_remote_tree,
+    get_token, load_config, log_upload, raw_url_for,
+)
+from ghu_hashing import hash_files
+
+def default_remote_prefix(cfg, local_dir):
+    """Mirror into Uploads/<folder name> unless a prefix is given."""
+    base = cfg.get("repo_path_prefix", "")
+    name = os.path.basename(os.path.abspath(local_dir))
+    return f"{base}/Uploads/{name}" if base else f"Uploads/{name}"
+
+def list_local_files(local_dir):
+    """Walk a folder, skipping dotfiles/dot-directories. Returns {relative posix path: absolute path}."""
+    files = {}
+    root = os.path.abspath(local_dir)
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in filenames:
+            if name.startswith("."):
+                continue
+            full = os.path.join(dirpath, name)
+            if os.path.isfile(full):
+                files[os.path.relpath(full, root).replace(os.sep, "/")] = full
+    return files
+
+def hash_local_files(files, workers):
+    """Compute git blob SHAs in parallel (cached across runs). Returns {relative path: sha}."""
+    return {rel: d["git_sha"] for rel, d in zip(files, hash_files(files.values(), workers))}
+
+def diff_trees(local_hashes, remote_blobs, prefix):
+    """Compare local and remote state. Returns (added, changed, removed) lists of relative paths."""
+    remote = {path[len(prefix) + 1:]: sha for path, sha in remote_blobs.items()}
+    # Dotfiles are never listed locally, so they are left alone remotely too (.gitattributes, .gitkeep, ...)
+    remote = {p: sha for p, sha in remote.items() if not any(part.startswith(".") for part in p.split("/"))}
+    added = sorted(p for p in local_hashes if p not in remote)
+    changed = sorted(p for p in local_hashes if p in remote and remote[p] != local_hashes[p])
+    removed = sorted(p for p in remote if p not in local_hashes)
+    return added, changed, removed
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="ghu sync", description="Mirror a local folder into the repo (rsync-style)")
+    parser.add_argument("local_dir", help="Local folder to mirror")
+    parser.add_argument("remote_prefix", nargs="?", help="Repo folder to mirror into (default: Uploads/<folder name>)")
+    parser.add_argument("--delete", action="store_true", help="Delete remote files that no longer exist locally")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would change")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Verbose output")
+    parser.add_argument("--priority", choices=["interactive", "queue", "background"],
+                        help="Scheduling class (default: $GHU_PRIORITY or background)")
+    args = parser.parse_args(argv)
+    import ghu_sched
+    ghu_sched.set_priority(args.priority or os.environ.get("GHU_PRIORITY") or "background")
+
+    local_dir = os.path.expanduser(args.local_dir)
+    if not os.path.isdir(local_dir):
+        eprint(f"Not a directory: {local_dir}")
+        sys.exit(2)
+
+    cfg = load_config()
+    if cfg.get("shards"):
+        import ghu_shards
+        ghu_shards.refuse(cfg, "sync")
+    token = get_token(cfg)
+    verbose = args.verbose or bool(cfg.get("verbose", False))
+    workers = max(1, int(cfg.get("sync_workers", 8)))
+    max_bytes = float(cfg.get("contents_max_mb", 95)) * 1024 * 1024
+    prefix = (args.remote_prefix or default_remote_prefix(cfg, local_dir)).strip("/")
+    if not prefix:
+        # Mirroring into the repo root would treat every other file in the repo as part of the folder
+        eprint("The remote prefix can't be the repo root; name a folder to mirror into")
+        sys.exit(2)
+
+    files = list_local_files(local_dir)
+    too_large = sorted(p for p, full in files.items() if os.path.getsize(full) > max_bytes)
+    for rel in too_large:
+        eprint(f"Skip (larger than contents_max_mb): {rel}")
+        del files[rel]
+
+    if verbose:
+        eprint(f"Hashing {len(files)} local file(s)...")
+    local_hashes = hash_local_files(files, workers)
+    if verbose:
+        eprint(f"Listing remote {prefix}/ ...")
+    remote_blobs = fetch_remote_tree(cfg, token, prefix)
+
+    added, changed, removed = diff_trees(local_hashes, remote_blobs, prefix)
+    if args.delete:
+        # Skipped large files still exist locally, so their remote copies stay
+        removed = [rel for rel in removed if rel not in too_large]
+    else:
+        removed = []
+
+    for rel in added:
+        print(f"+ {prefix}/{rel}")
+    for rel in changed:
+        print(f"~ {prefix}/{rel}")
+    for rel in removed:
+        print(f"- {prefix}/{rel}")
+
+    if not (added or changed or removed):
+        eprint("Already in sync.")
+        return
+    if args.dry_run:
+        eprint(f"Dry run: {len(added)} new, {len(changed)} changed, {len(removed)} deleted")
+        return
+
+    upload = added + changed
+    if verbose:
+        eprint(f"Creating {len(upload)} blob(s)...")
+
+    def make_blob(rel):
+        with open(files[rel], "rb") as f:
+            return create_blob(cfg, token, f.read())
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        blob_shas = list(pool.map(make_blob, upload))
+
+    entries = [{"path": f"{prefix}/{rel}", "mode": "100644", "type": "blob", "sha": sha}
+               for rel, sha in zip(upload, blob_shas)]
+    entries += [{"path": f"{prefix}/{rel}", "mode": "100644", "type": "blob", "sha": None} for rel in removed]
+
+    now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    msg = (f"Sync {prefix}: {len(added)} new, {len(changed)} changed, "
+           f"{len(removed)} deleted @ {now}")
+    commit_tree_entries(cfg, token, entries, msg)
+
+    for rel in upload:
+        remote_path = f"{prefix}/{rel}"
+        ghu_metrics.uploaded("gitdata", os.path.getsize(files[rel]))
+        log_upload(files[rel], os.path.basename(rel), raw_url_for(cfg, remote_path), category_for_path(files[rel]))
+    eprint(f"Synced {prefix}: {len(added)} new, {len(changed)} changed, {len(removed)} deleted")
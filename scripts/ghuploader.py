@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 import argparse
 import base64
+import contextlib
 import datetime as dt
-import hashlib
 import json
 import mimetypes
 import os
@@ -18,6 +18,7 @@ import urllib.error
 CONFIG_PATH = os.path.expanduser("~/.config/ghuploader/config.json")
 DATA_DIR = os.path.expanduser("~/.config/ghuploader/data")
 RECENT_FILE = os.path.join(DATA_DIR, "recent.json")
+TREE_INDEX_FILE = os.path.join(DATA_DIR, "tree-index.json")
 
 AUDIO_EXT = {".mp3",".m4a",".aac",".wav",".flac",".ogg",".opus",".aiff",".alac",".wma"}
 IMAGE_EXT = {".png",".jpg",".jpeg",".webp",".gif",".tif",".tiff",".bmp",".svg",".heic",".avif"}
@@ -127,15 +128,25 @@ def api_request(method, url, token, data=None, headers=None):
     if data is not None:
         body = json.dumps(data).encode("utf-8")
         h["Content-Type"] = "application/json"
-    req = urllib.request.Request(url, data=body, headers=h, method=method)
+    import ghu_metrics
+    import ghu_sched
+    # Lower-priority runs wait here while an interactive upload is going
+    ghu_sched.wait_turn(len(body) if body else 0)
+    data_out, extra = ghu_sched.body(body)
+    req = urllib.request.Request(url, data=data_out, headers={**h, **extra}, method=method)
+    started = time.perf_counter()
     try:
         with urllib.request.urlopen(req) as resp:
             raw = resp.read()
+            ghu_metrics.record_response(method, url, resp.status, time.perf_counter() - started, resp.headers)
+            ghu_sched.note_rate_limit(resp.headers)
             if raw:
                 return json.loads(raw.decode("utf-8"))
             return None
     except urllib.error.HTTPError as err:
         msg = err.read().decode("utf-8", errors="replace")
+        ghu_metrics.record_response(method, url, err.code, time.perf_counter() - started, err.headers)
+        ghu_sched.note_rate_limit(err.headers)
         raise RuntimeError(f"{method} {url} -> {err.code}\n{msg}") from None
 
 def sanitize_filename(name: str, preserve_spaces: bool = False) -> str:
@@ -161,11 +172,14 @@ def sanitize_filename(name: str, preserve_spaces: bool = False) -> str:
     return name or "file"
 
 def sha1_file(path):
-    h = hashlib.sha1()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    # Served from the persistent hash cache; unchanged files are never re-read
+    from ghu_hashing import file_digests
+    return file_digests(path)["sha1"]
+
+def git_blob_sha(path):
+    """Return the git blob SHA of a file (what git and the GitHub tree API report for it)."""
+    from ghu_hashing import file_digests
+    return file_digests(path)["git_sha"]
 
 def is_generic_filename(filename):
     """Check if filename is a generic/common name that might conflict."""
@@ -186,6 +200,11 @@ def get_image_type(filename):
 
 def extract_album_from_path(path):
     """Extract album name from file path. Returns album directory name or None."""
+    from ghu_library import lookup
+    known = lookup(path)
+    if known:
+        return known[1]
+
     parent_dir = os.path.dirname(path)
     if not parent_dir or parent_dir == "/":
         return None
@@ -207,6 +226,13 @@ def extract_artist_from_path(path, skip_album_dirs=True):
         skip_album_dirs: If True, skip directories that look like album folders
                         (e.g., "1993 - Represent", "2025 - Destination Extinction")
     """
+    # Files inside the cataloged library (see ghu_library) are resolved from the catalog
+    if skip_album_dirs:
+        from ghu_library import lookup
+        known = lookup(path)
+        if known:
+            return known[0]
+
     # Get the parent directory (the directory containing the file)
     parent_dir = os.path.dirname(path)
     if not parent_dir or parent_dir == "/":
@@ -258,6 +284,9 @@ def clipboard_set(text: str):
     except Exception:
         pass
 
+# Extra history fields for files uploaded from a prepared copy: {uploaded path: {"filepath": original, ...}}
+UPLOAD_NOTES = {}
+
 def log_upload(filepath, filename, url, category):
     """Log successful upload to recent uploads file."""
     try:
@@ -278,6 +307,7 @@ def log_upload(filepath, filename, url, category):
             'category': category,
             'timestamp': dt.datetime.now().isoformat()
         }
+        upload_info.update(UPLOAD_NOTES.get(filepath, {}))
         recent.append(upload_info)
 
         # Keep only last 100 uploads
@@ -502,6 +532,10 @@ def detect_package_structure(local_path: str) -> tuple:
 
 def check_file_exists_remote(cfg, token, remote_path):
     """Check if a file already exists in the repo. Returns True if exists, False otherwise."""
+    if cfg.get("shards"):
+        # A path that was already uploaded lives on the shard it was routed to
+        import ghu_shards
+        cfg = ghu_shards.routed_cfg(cfg, remote_path) or cfg
     owner = cfg["owner"]
     repo = cfg["repo"]
     branch = cfg.get("branch", "main")
@@ -668,10 +702,7 @@ def build_repo_path(cfg, local_path, token=None, custom_name=None):
     # All uploads go under Uploads/ folder
     if organize_by_artist and artist_name:
         # Everything goes into Uploads/Audio/{Artist}/ folder
-        if base:
-            return f"{base}/{uploads_root}/Audio/{artist_name}/{fname}", cat
-        else:
-            return f"{uploads_root}/Audio/{artist_name}/{fname}", cat
+        return f"{repo_folder_for(cfg, cat, artist_name=artist_name)}/{fname}", cat
     elif cat == "Scripts":
         # Handle script language subfolders and package structures
         ext = os.path.splitext(local_path)[1].lower()
@@ -701,26 +732,37 @@ def build_repo_path(cfg, local_path, token=None, custom_name=None):
     elif cat == "Images" and cfg.get("use_image_subfolders", True):
         # Original image subfolder organization (Covers, Logos, Artists)
         image_type = get_image_type(original_basename)
-        if image_type:
-            subfolder_map = {
-                "cover": "Covers",
-                "logo": "Logos", 
-                "artist": "Artists"
-            }
-            subfolder = subfolder_map.get(image_type)
-            if subfolder:
-                if base:
-                    return f"{base}/{uploads_root}/{cat}/{subfolder}/{fname}", cat
-                else:
-                    return f"{uploads_root}/{cat}/{subfolder}/{fname}", cat
+        return place_in_folder(cfg, repo_folder_for(cfg, cat, image_type=image_type), fname, cat), cat
     
     # Standard path building - all under Uploads/
-    if base:
-        return f"{base}/{uploads_root}/{cat}/{fname}", cat
-    else:
-        return f"{uploads_root}/{cat}/{fname}", cat
+    return place_in_folder(cfg, repo_folder_for(cfg, cat), fname, cat), cat
+
+def place_in_folder(cfg, folder, fname, cat):
+    """Path of a file inside one of build_repo_path's folders (in a prefix subfolder with `fanout`)."""
+    if not cfg.get("fanout"):
+        return f"{folder}/{fname}"
+    import ghu_fanout
+    return ghu_fanout.place(cfg, folder, fname, cat)
+
+def repo_folder_for(cfg, cat, image_type=None, artist_name=None):
+    """Folder build_repo_path files a (non-script) upload into, given what it knows about it.
 
-def upload_contents_api(cfg, token, local_path, remote_path, category):
+    Args:
+        cat: Category from category_for_path
+        image_type: 'cover', 'logo', 'artist' or None (see get_image_type)
+        artist_name: Artist folder name when organize_by_artist applies
+    """
+    base = cfg.get("repo_path_prefix", "")
+    root = f"{base}/Uploads" if base else "Uploads"
+    if cfg.get("organize_by_artist", False) and artist_name:
+        return f"{root}/Audio/{artist_name}"
+    if cat == "Images" and cfg.get("use_image_subfolders", True):
+        subfolder = {"cover": "Covers", "logo": "Logos", "artist": "Artists"}.get(image_type)
+        if subfolder:
+            return f"{root}/{cat}/{subfolder}"
+    return f"{root}/{cat}"
+
+def upload_contents_api(cfg, token, local_path, remote_path, category, sha=None):
     owner = cfg["owner"]
     repo = cfg["repo"]
     branch = cfg.get("branch", "main")
@@ -741,12 +783,270 @@ def upload_contents_api(cfg, token, local_path, remote_path, category):
     msg = f"Upload ({category}) {os.path.basename(local_path)} @ {now}"
 
     payload = {"message": msg, "content": b64, "branch": branch}
+    if sha:
+        # Replacing an existing file requires its current blob SHA
+        payload["sha"] = sha
     resp = api_request("PUT", url, token, data=payload)
     content = resp.get("content") if resp else None
     if not content:
         raise RuntimeError("GitHub API returned no content object.")
     return content.get("download_url")
 
+def encode_repo_path(remote_path):
+    """URL-encode each path component separately (keeps the '/' separators)."""
+    return "/".join(urllib.parse.quote(part, safe="") for part in remote_path.split("/"))
+
+def raw_url_for(cfg, remote_path):
+    """Build the raw.githubusercontent.com URL for a path on the configured branch."""
+    owner = cfg["owner"]
+    repo = cfg["repo"]
+    branch = cfg.get("branch", "main")
+    return f"https://raw.githubusercontent.com/{owner}/{repo}/{branch}/{encode_repo_path(remote_path)}"
+
+def get_branch_head(cfg, token):
+    """Return (commit_sha, tree_sha) for the head of the configured branch."""
+    owner = cfg["owner"]
+    repo = cfg["repo"]
+    branch = cfg.get("branch", "main")
+    ref = api_request("GET", f"https://api.github.com/repos/{owner}/{repo}/git/ref/heads/{branch}", token)
+    commit_sha = ref["object"]["sha"]
+    commit = api_request("GET", f"https://api.github.com/repos/{owner}/{repo}/git/commits/{commit_sha}", token)
+    return commit_sha, commit["tree"]["sha"]
+
+def get_file_text(cfg, token, remote_path, ref=None, strict=False):
+    """Fetch a text file from the branch (or a commit) via the Contents API. Returns None if missing.
+
+    With strict=True, errors other than a missing file are raised instead of reading as missing.
+    """
+    owner = cfg["owner"]
+    repo = cfg["repo"]
+    ref = ref or cfg.get("branch", "main")
+    url = f"https://api.github.com/repos/{owner}/{repo}/contents/{encode_repo_path(remote_path)}?ref={ref}"
+    try:
+        resp = api_request("GET", url, token)
+    except Exception as e:
+        if strict and "-> 404" not in str(e):
+            raise
+        return None
+    if not resp or resp.get("type") != "file":
+        return None
+    if not resp.get("content") and resp.get("size"):
+        # The Contents API leaves out the content of files over 1 MB
+        return get_blob(cfg, token, resp["sha"]).decode("utf-8", errors="replace")
+    return base64.b64decode(resp.get("content", "")).decode("utf-8", errors="replace")
+
+def create_blob(cfg, token, data: bytes) -> str:
+    """Create a git blob from raw bytes via the Git Data API. Returns the blob SHA."""
+    owner = cfg["owner"]
+    repo = cfg["repo"]
+    url = f"https://api.github.com/repos/{owner}/{repo}/git/blobs"
+    payload = {"content": base64.b64encode(data).decode("ascii"), "encoding": "base64"}
+    return api_request("POST", url, token, data=payload)["sha"]
+
+def get_blob(cfg, token, sha) -> bytes:
+    """Fetch a git blob's raw bytes via the Git Data API."""
+    owner = cfg["owner"]
+    repo = cfg["repo"]
+    resp = api_request("GET", f"https://api.github.com/repos/{owner}/{repo}/git/blobs/{sha}", token)
+    return base64.b64decode(resp.get("content", ""))
+
+def merged_content(entry, text):
+    """New text of a file after a merge entry: "lines" appends lines not there yet (.gitattributes),
+    "json" sets or (with None) removes keys of a JSON object (fan-out indexes)."""
+    if entry["merge"] == "lines":
+        lines = text.splitlines() if text else []
+        known = set(lines)
+        for line in entry["lines"]:
+            if line not in known:
+                lines.append(line)
+                known.add(line)
+        return "\n".join(lines) + "\n"
+    try:
+        data = json.loads(text) if text else {}
+    except ValueError:
+        data = {}
+    for key, value in entry["set"].items():
+        if value is None:
+            data.pop(key, None)
+        else:
+            data[key] = value
+    return json.dumps(dict(sorted(data.items())), indent=0, ensure_ascii=False) + "\n"
+
+def combine_merge_entries(old, new):
+    """One merge entry with the changes of both (runs sharing a commit can touch the same file)."""
+    if old.get("merge") != new.get("merge"):
+        return new
+    if new["merge"] == "lines":
+        return {**new, "lines": old["lines"] + [line for line in new["lines"] if line not in old["lines"]]}
+    return {**new, "set": {**old["set"], **new["set"]}}
+
+def commit_tree_entries(cfg, token, entries, message):
+    """Commit a list of tree entries on top of the branch head as a single commit.
+
+    Args:
+        entries: Git Data API tree entries, e.g. {"path", "mode", "type", "sha"}
+                 or {"path", "mode", "type", "content"} for small text files.
+                 An entry with "sha": None deletes that path.
+                 An entry with "merge" (see merged_content) is applied to the file as it is in the
+                 commit this one builds on, so concurrent runs don't drop each other's changes.
+        message: Commit message
+
+    Returns:
+        The new commit SHA
+    """
+    owner = cfg["owner"]
+    repo = cfg["repo"]
+    branch = cfg.get("branch", "main")
+    api = f"https://api.github.com/repos/{owner}/{repo}/git"
+
+    if cfg.get("coordinate_commits", False):
+        # Other ghu processes wait instead of racing us for the branch head
+        from ghu_coordinator import branch_lock
+        lock = branch_lock(cfg)
+    else:
+        lock = contextlib.nullcontext()
+    with lock:
+        parent_sha, base_tree = get_branch_head(cfg, token)
+        entries = [{"path": e["path"], "mode": e["mode"], "type": e["type"],
+                    "content": merged_content(e, get_file_text(cfg, token, e["path"], ref=parent_sha, strict=True))}
+                   if e.get("merge") else e for e in entries]
+        tree = api_request("POST", f"{api}/trees", token, data={"base_tree": base_tree, "tree": entries})
+        commit = api_request("POST", f"{api}/commits", token, data={
+            "message": message,
+            "tree": tree["sha"],
+            "parents": [parent_sha],
+        })
+        api_request("PATCH", f"{api}/refs/heads/{branch}", token, data={"sha": commit["sha"]})
+    return commit["sha"]
+
+def fetch_remote_tree(cfg, token, prefix="", tree_sha=None):
+    """List every blob under a repo directory on the branch head (or the given root tree).
+
+    Returns:
+        dict mapping full repo path -> blob SHA (empty if the prefix doesn't exist)
+    """
+    owner = cfg["owner"]
+    repo = cfg["repo"]
+    api = f"https://api.github.com/repos/{owner}/{repo}/git/trees"
+
+    if tree_sha is None:
+        _, tree_sha = get_branch_head(cfg, token)
+    # Descend to the prefix so the recursive listing only covers that subtree
+    parts = [p for p in prefix.strip("/").split("/") if p]
+    for part in parts:
+        tree = api_request("GET", f"{api}/{tree_sha}", token)
+        match = [e for e in tree.get("tree", []) if e["path"] == part and e["type"] == "tree"]
+        if not match:
+            return {}
+        tree_sha = match[0]["sha"]
+
+    base = "/".join(parts)
+    blobs = {}
+    pending = [(tree_sha, base)]
+    while pending:
+        sha, path = pending.pop()
+        tree = api_request("GET", f"{api}/{sha}?recursive=1", token)
+        entries = tree.get("tree", [])
+        if tree.get("truncated"):
+            # Too large for one recursive listing: take this level only and walk subtrees
+            entries = api_request("GET", f"{api}/{sha}", token).get("tree", [])
+            for e in entries:
+                if e["type"] == "tree":
+                    pending.append((e["sha"], f"{path}/{e['path']}" if path else e["path"]))
+        for e in entries:
+            if e["type"] == "blob":
+                blobs[f"{path}/{e['path']}" if path else e["path"]] = e["sha"]
+    return blobs
+
+def load_tree_index(cfg, token, refresh=True):
+    """Return {repo path: blob SHA} for everything under Uploads/, cached per branch head.
+
+    The listing is only re-fetched when the branch has moved since the cached copy.
+    With refresh=False only the cached copy is used, without any API calls; None if there is none.
+    """
+    base = cfg.get("repo_path_prefix", "")
+    prefix = f"{base}/Uploads" if base else "Uploads"
+    key = f"{cfg['owner']}/{cfg['repo']}@{cfg.get('branch', 'main')}:{prefix}"
+    try:
+        with open(TREE_INDEX_FILE, "r") as f:
+            cached = json.load(f)
+    except Exception:
+        cached = {}
+    entry = cached.get(key)
+    import ghu_metrics
+    if not refresh:
+        ghu_metrics.cache_lookup("tree-index", bool(entry))
+        return entry["paths"] if entry else None
+
+    commit_sha, tree_sha = get_branch_head(cfg, token)
+    ghu_metrics.cache_lookup("tree-index", bool(entry and entry.get("commit") == commit_sha))
+    if entry and entry.get("commit") == commit_sha:
+        return entry["paths"]
+    paths = fetch_remote_tree(cfg, token, prefix, tree_sha=tree_sha)
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        cached[key] = {"commit": commit_sha, "paths": paths}
+        with open(TREE_INDEX_FILE, "w") as f:
+            json.dump(cached, f)
+    except Exception:
+        pass
+    return paths
+
+def upload_git_data_files(cfg, token, items):
+    """Upload files as Git Data API blobs (in parallel) and commit them all in one commit.
+
+    Args:
+        items: list of (local_path, remote_path, category) tuples
+
+    Returns:
+        (urls, errors) dicts keyed by remote_path
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    workers = max(1, int(cfg.get("gitdata_workers", 8)))
+
+    def make_blob(item):
+        with open(item[0], "rb") as f:
+            return create_blob(cfg, token, f.read())
+
+    urls = {}
+    errors = {}
+    entries = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [(item, pool.submit(make_blob, item)) for item in items]
+        for (local_path, remote_path, _), fut in futures:
+            try:
+                entries.append({"path": remote_path, "mode": "100644", "type": "blob", "sha": fut.result()})
+            except Exception as e:
+                errors[remote_path] = str(e)
+    if not entries:
+        return urls, errors
+    extra = []
+    if cfg.get("fanout"):
+        # Fan-out index entries go into the same commit as the files they list
+        import ghu_fanout
+        extra = ghu_fanout.entries_for_uploads(cfg, [i for i in items if i[1] not in errors])
+
+    now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if len(entries) == 1:
+        local_path, _, category = next(i for i in items if i[1] == entries[0]["path"])
+        msg = f"Upload ({category}) {os.path.basename(local_path)} @ {now}"
+    else:
+        msg = f"Upload {len(entries)} files @ {now}"
+    try:
+        if cfg.get("coordinate_commits", False):
+            # Shared with any other ghu runs committing at the same time
+            from ghu_coordinator import submit
+            submit(cfg, token, entries + extra, msg)
+        else:
+            commit_tree_entries(cfg, token, entries + extra, msg)
+    except Exception as e:
+        for entry in entries:
+            errors[entry["path"]] = f"Commit failed: {e}"
+        return urls, errors
+    for entry in entries:
+        urls[entry["path"]] = raw_url_for(cfg, entry["path"])
+    return urls, errors
+
 def get_or_create_release(cfg, token):
     owner = cfg["owner"]
     repo = cfg["repo"]
@@ -798,13 +1098,40 @@ def upload_release_asset(cfg, token, local_path, category):
         "-H", "X-GitHub-Api-Version: 2022-11-28",
         "-H", f"Content-Type: {ctype}",
         "--data-binary", f"@{local_path}",
+        "-w", "\n%{http_code}",
         url
     ]
-    out = subprocess.check_output(cmd)
+    import ghu_metrics
+    import ghu_sched
+    ghu_sched.wait_turn()
+    started = time.perf_counter()
+    with open(local_path, "rb") as f:
+        src = ghu_sched.stream(f, os.path.getsize(local_path))
+        if src is f:
+            cmd[1:1] = ghu_sched.curl_limit_args()
+            out = subprocess.check_output(cmd)
+            out, _, status = out.rpartition(b"\n")
+            ghu_metrics.record_response("POST", url, int(status or 0), time.perf_counter() - started)
+        else:
+            # Rate-limited class: stream through the bandwidth bucket so the rate follows higher-priority
+            # runs starting and finishing mid-transfer (curl's --limit-rate is fixed at start)
+            h = {"Accept": "application/vnd.github+json", "Authorization": f"Bearer {token}",
+                 "X-GitHub-Api-Version": "2022-11-28", "User-Agent": "ghuploader",
+                 "Content-Type": ctype, "Content-Length": str(os.path.getsize(local_path))}
+            req = urllib.request.Request(url, data=src, headers=h, method="POST")
+            try:
+                with urllib.request.urlopen(req) as r:
+                    out = r.read()
+                    ghu_metrics.record_response("POST", url, r.status, time.perf_counter() - started, r.headers)
+                    ghu_sched.note_rate_limit(r.headers)
+            except urllib.error.HTTPError as err:
+                msg = err.read().decode("utf-8", errors="replace")
+                ghu_metrics.record_response("POST", url, err.code, time.perf_counter() - started, err.headers)
+                raise RuntimeError(f"POST {url} -> {err.code}\n{msg}") from None
     resp = json.loads(out.decode("utf-8"))
     return resp.get("browser_download_url")
 
-def format_links(cfg, local_path, url, remote_path=None):
+def format_links(cfg, local_path, url, remote_path=None, peaks_url=None):
     # For images and audio: use processed remote filename (better readability)
     # For other files: use original local filename (preserves original name)
     cat = category_for_path(local_path)
@@ -833,18 +1160,85 @@ def format_links(cfg, local_path, url, remote_path=None):
     if mode in ("markdown", "both"):
         lines.append(md)
         if extra_audio and os.path.splitext(display_fname)[1].lower() in AUDIO_EXT:
-            lines.append(f'<audio controls src="{url}"></audio>')
+            # Player pages can draw the waveform from the precomputed peaks instead of decoding the track
+            peaks_attr = f' data-peaks="{peaks_url}"' if peaks_url else ""
+            lines.append(f'<audio controls src="{url}"{peaks_attr}></audio>')
     if mode in ("url", "both"):
         lines.append(url)
     return "\n".join(lines)
 
+def record_deferred_uploads(cfg, backend, pending, urls, backend_errors, out_blocks, errors, verbose=False):
+    """Fill output slots and history for uploads that a batching backend finished after the main loop."""
+    import ghu_metrics
+    for slot, p, remote_path, cat in pending:
+        if slot is None:
+            # Companion file (waveform peaks) committed along with the upload before it
+            continue
+        url = urls.get(remote_path)
+        if not url:
+            msg = f"Error uploading {os.path.basename(p)}: {backend_errors.get(remote_path, 'upload failed')}"
+            eprint(msg)
+            errors.append(msg)
+            ghu_metrics.upload_failed(backend)
+            continue
+        ghu_metrics.uploaded(backend, os.path.getsize(p))
+        peaks_url = None
+        if cat == "Audio" and cfg.get("audio_peaks", False):
+            import ghu_peaks
+            peaks_url = urls.get(ghu_peaks.peaks_path(remote_path))
+            if peaks_url:
+                UPLOAD_NOTES.setdefault(p, {})["peaks"] = peaks_url
+        out_blocks[slot] = format_links(cfg, p, url, remote_path, peaks_url)
+        log_upload(p, os.path.basename(remote_path), url, cat)
+        if verbose:
+            eprint(f"  ✓ Uploaded: {url}")
+
+def run_batches(cfg, token, upload_fn, pending):
+    """Run a batching backend over queued uploads, once per shard (in parallel) when `shards` is set."""
+    items = [(p, rp, cat) for _, p, rp, cat in pending]
+    if cfg.get("shards"):
+        import ghu_shards
+        return ghu_shards.run_sharded(cfg, token, upload_fn, items)
+    return upload_fn(cfg, token, items)
+
+# Subcommands: `ghu <name> ...` runs main(argv) of the named helper module ("module:function" for another entry point)
+SUBCOMMANDS = {
+    "sync": "ghu_sync",
+    "gallery": "ghu_gallery",
+    "plan": "ghu_plan",
+    "reorganize": "ghu_reorganize",
+    "metrics": "ghu_metrics",
+    "library": "ghu_library",
+    "shards": "ghu_shards",
+    "fanout": "ghu_fanout",
+    "sched": "ghu_sched",
+    "dupes": "ghu_dupes",
+    "faststart": "ghu_faststart",
+    "peaks": "ghu_peaks",
+    "bundle": "ghu_bundle",
+    "get": "ghu_bundle:get_main",
+}
+
 def main(argv):
+    if len(argv) > 1 and argv[1] in SUBCOMMANDS:
+        import importlib
+        if "GHU_PRIORITY" not in os.environ:
+            # Maintenance commands (sync, gallery, reorganize, ...) must not hold up queued or interactive uploads
+            import ghu_sched
+            ghu_sched.set_priority("background")
+        module, _, func = SUBCOMMANDS[argv[1]].partition(":")
+        return getattr(importlib.import_module(module), func or "main")(argv[2:])
+
     # Parse arguments
     parser = argparse.ArgumentParser(description='Upload files to GitHub and get markdown/URL links')
-    parser.add_argument('files', nargs='+', help='File paths or URLs to upload')
+    parser.add_argument('files', nargs='*', help='File paths or URLs to upload')
     parser.add_argument('-n', '--name', dest='custom_name', help='Custom filename for single file upload')
     parser.add_argument('--names', nargs='+', dest='custom_names', help='Custom filenames for multiple files (must match number of files)')
     parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
+    parser.add_argument('--git-push', action='store_true', help='Commit all repo uploads with one git push instead of per-file API calls')
+    parser.add_argument('--manifest', help='Upload exactly as planned by `ghu plan` (JSON or TSV manifest)')
+    parser.add_argument('--priority', choices=['interactive', 'queue', 'background'],
+                        help='Scheduling class (default: $GHU_PRIORITY or interactive)')
     
     # Parse known args (allow unknown args for backward compatibility)
     args, unknown = parser.parse_known_args()
@@ -859,7 +1253,23 @@ def main(argv):
         all_files = args.files
         custom_names = [args.custom_name] if args.custom_name else (args.custom_names if args.custom_names else None)
         verbose = args.verbose
+
+    # (remote path, category, existing blob sha) per file when executing a manifest
+    planned = None
+    if args.manifest:
+        if all_files:
+            eprint("Pass either files or --manifest, not both.")
+            sys.exit(2)
+        from ghu_plan import read_manifest
+        entries = [e for e in read_manifest(args.manifest) if e["action"] in ("upload", "update")]
+        all_files = [e["local"] for e in entries]
+        planned = [(e["remote"], e["category"], e.get("sha") or None) for e in entries]
+        custom_names = None
     
+    if args.priority:
+        import ghu_sched
+        ghu_sched.set_priority(args.priority)
+
     cfg = load_config()
     token = get_token(cfg)
 
@@ -872,9 +1282,25 @@ def main(argv):
     if not verbose:
         verbose = bool(cfg.get("verbose", False))
     continue_on_error = bool(cfg.get("continue_on_error", True))
+    use_lfs = bool(cfg.get("lfs_enabled", False))
+    lfs_pending = []  # (out_blocks slot, local path, remote path, category)
+    git_push_min_files = int(cfg.get("git_push_min_files", 0))
+    use_git_push = args.git_push or (git_push_min_files > 0 and len(all_files) >= git_push_min_files)
+    git_pending = []  # same layout as lfs_pending
+    gitdata_pending = []  # same layout as lfs_pending
+    deferred = {"gitpush": git_pending, "lfs": lfs_pending, "gitdata": gitdata_pending}
+    coordinate = bool(cfg.get("coordinate_commits", False))
+    sharded = bool(cfg.get("shards"))
+    # Per-file backend choice from measured costs instead of the static size threshold
+    import ghu_metrics
+    import ghu_router
+    use_router = bool(cfg.get("router_enabled", False))
+    router_stats = ghu_router.load_stats() if use_router else None
     out_blocks = []
     errors = []
     temp_files = []  # Track temp files for cleanup
+    uploaded = []  # (local path, remote path, category) of files now in the repo tree
+    near_dupes = cfg.get("near_duplicates", "off")  # "off", "warn" or "skip"
 
     for i, p in enumerate(all_files, 1):
         original_path = p
@@ -914,29 +1340,90 @@ def main(argv):
             errors.append(msg)
             continue
 
+        backend = None
         try:
             category = category_for_path(p)
+            if category == "Video" and cfg.get("video_faststart", False):
+                # Upload a copy with the moov atom up front so shared links start playing immediately
+                import ghu_faststart
+                remuxed = ghu_faststart.prepare(p, verbose)
+                if remuxed:
+                    UPLOAD_NOTES[remuxed] = {"filepath": p, "faststart": True}
+                    p = remuxed
             size_mb = os.path.getsize(p) / (1024 * 1024)
+            plan = planned[i-1] if planned else None
 
             if verbose:
                 eprint(f"[{i}/{len(all_files)}] Uploading {os.path.basename(p)} ({size_mb:.1f} MB) as {category}...")
 
-            if size_mb <= max_contents_mb:
-                remote_path, cat = build_repo_path(cfg, p, token, custom_name=custom_name)
+            if os.path.getsize(p) > 2 * 1024 * 1024 * 1024:
+                raise RuntimeError(f"File too large (>2 GiB): {p}")
+            if category == "Images" and near_dupes != "off" and not plan:
+                import ghu_dupes
+                match = ghu_dupes.find_near(cfg, p, token)
+                if match:
+                    dist, existing = match
+                    existing_url = ghu_dupes.url_for(cfg, existing)
+                    if near_dupes == "skip":
+                        eprint(f"Skip {os.path.basename(p)}: near-duplicate of {existing} (distance {dist})")
+                        out_blocks.append(format_links(cfg, p, existing_url, existing))
+                        continue
+                    eprint(f"Warning: {os.path.basename(p)} looks like {existing} (distance {dist}): {existing_url}")
+            if use_git_push and size_mb <= max_contents_mb:
+                backend = "gitpush"
+            elif use_router:
+                backend, _ = ghu_router.choose_backend(cfg, p, os.path.getsize(p), len(all_files), router_stats, verbose)
+                if not backend:
+                    raise RuntimeError("No upload backend available for this file (check router_backends).")
+            elif size_mb <= max_contents_mb:
+                backend = "contents"
+            else:
+                backend = "lfs" if use_lfs else "release"
+            fanned = False
+            if backend == "contents" and cfg.get("fanout"):
+                import ghu_fanout
+                fanned = ghu_fanout.enabled(cfg, category)
+            if backend == "contents" and (coordinate or sharded or fanned):
+                # One PUT per file would be its own branch update; blobs plus a shared commit instead
+                # (sharded: one commit per shard; fan-out: the commit also carries the folder index)
+                backend = "gitdata"
+            peaks_file = None
+            if category == "Audio" and cfg.get("audio_peaks", False) and backend in ("contents", "gitdata", "gitpush"):
+                import ghu_peaks
+                peaks_file = ghu_peaks.prepare(cfg, p, verbose)
+                if peaks_file and backend == "contents":
+                    # A Contents API PUT commits one file; blobs let the track and its peaks share a commit
+                    backend = "gitdata"
+
+            if backend != "release":
+                remote_path, cat = plan[:2] if plan else build_repo_path(cfg, p, token, custom_name=custom_name)
                 if verbose:
                     eprint(f"  → Repo path: {remote_path}")
-                url = upload_contents_api(cfg, token, p, remote_path, cat)
+            if backend in deferred:
+                # Batching backends run after the loop: one commit (and one push/batch request) per run
+                if verbose:
+                    eprint(f"  → Queued for {backend}")
+                deferred[backend].append((len(out_blocks), p, remote_path, cat))
+                if peaks_file:
+                    companion = ghu_peaks.peaks_path(remote_path)
+                    if sharded:
+                        import ghu_shards
+                        ghu_shards.route_with(cfg, companion, remote_path, p)
+                    deferred[backend].append((None, peaks_file, companion, cat))
+                out_blocks.append(None)
+                continue
+
+            started = time.perf_counter()
+            if backend == "contents":
+                url = upload_contents_api(cfg, token, p, remote_path, cat, sha=plan[2] if plan else None)
                 if not url:
                     raise RuntimeError("No download_url returned for contents upload.")
                 # Pass remote_path so format_links uses the processed filename
                 out_blocks.append(format_links(cfg, p, url, remote_path))
                 # Log successful upload
                 log_upload(p, os.path.basename(remote_path), url, cat)
-                if verbose:
-                    eprint(f"  ✓ Uploaded: {url}")
+                uploaded.append((p, remote_path, cat))
             else:
-                if os.path.getsize(p) > 2 * 1024 * 1024 * 1024:
-                    raise RuntimeError(f"File too large (>2 GiB): {p}")
                 if verbose:
                     eprint(f"  → Using release asset (large file)...")
                 url = upload_release_asset(cfg, token, p, category)
@@ -944,17 +1431,21 @@ def main(argv):
                     raise RuntimeError("No browser_download_url returned for release upload.")
                 # For release assets, build a remote_path for display purposes (even though file is in release)
                 # This ensures audio files show the processed filename in markdown
-                remote_path_for_display, _ = build_repo_path(cfg, p, token, custom_name=custom_name)
+                remote_path_for_display = plan[0] if plan else build_repo_path(cfg, p, token, custom_name=custom_name)[0]
                 out_blocks.append(format_links(cfg, p, url, remote_path_for_display))
                 # Log successful upload
                 log_upload(p, os.path.basename(remote_path_for_display), url, category)
-                if verbose:
-                    eprint(f"  ✓ Uploaded: {url}")
+            ghu_router.record(cfg, backend, os.path.getsize(p), time.perf_counter() - started)
+            ghu_metrics.uploaded(backend, os.path.getsize(p))
+            if verbose:
+                eprint(f"  ✓ Uploaded: {url}")
 
         except Exception as e:
             msg = f"Error uploading {os.path.basename(p)}: {e}"
             eprint(msg)
             errors.append(msg)
+            if backend:
+                ghu_metrics.upload_failed(backend)
             if not continue_on_error:
                 # Cleanup temp files before exiting
                 for tf in temp_files:
@@ -965,6 +1456,41 @@ def main(argv):
                         pass
                 sys.exit(1)
 
+    if git_pending:
+        import ghu_gitpush
+        if verbose:
+            eprint(f"Pushing {len(git_pending)} file(s) in one git commit...")
+        urls, backend_errors = run_batches(cfg, token, ghu_gitpush.push_files, git_pending)
+        record_deferred_uploads(cfg, "gitpush", git_pending, urls, backend_errors, out_blocks, errors, verbose)
+        uploaded.extend((p, rp, cat) for _, p, rp, cat in git_pending if rp in urls)
+
+    if gitdata_pending:
+        if verbose:
+            eprint(f"Uploading {len(gitdata_pending)} file(s) as blobs in one commit...")
+        started = time.perf_counter()
+        urls, backend_errors = run_batches(cfg, token, upload_git_data_files, gitdata_pending)
+        ghu_router.record(cfg, "gitdata", sum(os.path.getsize(p) for _, p, _, _ in gitdata_pending),
+                          time.perf_counter() - started, requests=len(gitdata_pending))
+        record_deferred_uploads(cfg, "gitdata", gitdata_pending, urls, backend_errors, out_blocks, errors, verbose)
+        uploaded.extend((p, rp, cat) for _, p, rp, cat in gitdata_pending if rp in urls)
+
+    if lfs_pending:
+        import ghu_lfs
+        if verbose:
+            eprint(f"Uploading {len(lfs_pending)} file(s) via Git LFS...")
+        started = time.perf_counter()
+        urls, backend_errors = run_batches(cfg, token, ghu_lfs.upload_lfs_files, lfs_pending)
+        ghu_router.record(cfg, "lfs", sum(os.path.getsize(p) for _, p, _, _ in lfs_pending),
+                          time.perf_counter() - started, requests=len(lfs_pending))
+        record_deferred_uploads(cfg, "lfs", lfs_pending, urls, backend_errors, out_blocks, errors, verbose)
+        uploaded.extend((p, rp, cat) for _, p, rp, cat in lfs_pending if rp in urls)
+
+    if uploaded and near_dupes != "off":
+        import ghu_dupes
+        ghu_dupes.add_uploaded(cfg, uploaded)
+
+    out_blocks = [b for b in out_blocks if b is not None]
+
     # Cleanup temp files
     for tf in temp_files:
         try:
@@ -989,4 +1515,6 @@ def main(argv):
         eprint(f"\n⚠ Completed with {len(errors)} error(s), {len(out_blocks)} successful upload(s)")
 
 if __name__ == "__main__":
+    # Let helper modules (ghu_*.py) import this script as `ghuploader` without loading a second copy
+    sys.modules.setdefault("ghuploader", sys.modules[__name__])
     main(sys.argv)
\ No newline at end of file
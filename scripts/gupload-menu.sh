@@ -131,6 +131,51 @@ check_fzf() {
     return 0
 }
 
+# Local music-library catalog (ghu library); prints nothing if library_path isn't configured
+library_cmd() {
+    python3 "$PYTHON_SCRIPT" library "$@" 2>/dev/null
+}
+
+# Resolve an artist's local folder from the catalog, falling back to searching the library
+find_artist_path() {
+    local artist_name="$1"
+    local artist_path
+    artist_path=$(library_cmd path "$artist_name" | head -1)
+    if [[ -z "$artist_path" ]]; then
+        artist_path=$(find /Volumes/Eksternal/Audio -type d -name "$artist_name" -maxdepth 4 2>/dev/null | head -1)
+    fi
+    echo "$artist_path"
+}
+
+# Pick an artist from the catalog with fzf; prints the artist folder
+pick_library_artist() {
+    check_fzf || return 1
+    local artist_name
+    artist_name=$(library_cmd artists | fzf --height 40% --border --prompt="Artist> ") || return 1
+    [[ -n "$artist_name" ]] && library_cmd path "$artist_name" | head -1
+}
+
+# List an artist folder's files NUL-separated (kind: tracks|files), from the catalog when it covers the folder
+list_artist_files() {
+    local artist_path="${1%/}"
+    local kind="$2"
+    local found=0
+    local file
+    while IFS= read -r -d '' file; do
+        if [[ "$file" == "$artist_path/"* ]]; then
+            printf '%s\0' "$file"
+            found=1
+        fi
+    done < <(library_cmd "$kind" "$(basename "$artist_path")" -0)
+    if [[ $found -eq 0 ]]; then
+        if [[ "$kind" == "tracks" ]]; then
+            find "$artist_path" -type f \( -name "*.mp3" -o -name "*.flac" -o -name "*.m4a" -o -name "*.wav" -o -name "*.aac" \) -print0 2>/dev/null
+        else
+            find "$artist_path" -type f -print0 2>/dev/null
+        fi
+    fi
+}
+
 get_config_value() {
     local key="$1"
     python3 -c "import json, sys, os; config = json.load(open('$CONFIG')) if os.path.exists('$CONFIG') else {}; print(config.get('$key', ''))" 2>/dev/null || echo ""
@@ -615,7 +660,7 @@ add_files_to_artist_menu() {
         echo -e "${BOLD}Add Files to: $artist_name${NC}\n"
         
         # Try to find artist path locally
-        local artist_path=$(find /Volumes/Eksternal/Audio -type d -name "$artist_name" -maxdepth 4 2>/dev/null | head -1)
+        local artist_path=$(find_artist_path "$artist_name")
         
         if [[ -z "$artist_path" ]]; then
             echo -e "${YELLOW}Artist path not found locally.${NC}"
@@ -682,7 +727,7 @@ upload_artist_audio() {
     local audio_files=()
     while IFS= read -r -d '' file; do
         audio_files+=("$file")
-    done < <(find "$artist_path" -type f \( -name "*.mp3" -o -name "*.flac" -o -name "*.m4a" -o -name "*.wav" -o -name "*.aac" \) -print0 2>/dev/null)
+    done < <(list_artist_files "$artist_path" tracks)
     
     if [[ ${#audio_files[@]} -eq 0 ]]; then
         echo -e "${YELLOW}No audio files found.${NC}\n"
@@ -723,8 +768,8 @@ upload_artist_files() {
         local files=()
         while IFS= read -r -d '' file; do
             files+=("$file")
-        done < <(find "$artist_path" -type f -print0 2>/dev/null | \
-            fzf --multi --height 40% --border \
+        done < <(list_artist_files "$artist_path" files | \
+            fzf --read0 --multi --height 40% --border \
                 --bind="ctrl-/:toggle-preview" \
                 --preview="file {} 2>/dev/null && ls -lh {} 2>/dev/null" \
                 --preview-window=down:3 \
@@ -804,8 +849,16 @@ upload_artist_assets() {
         return
     fi
     
-    echo -e "${BLUE}Enter artist path (e.g., /Volumes/Eksternal/Audio/Metal/C/Cold Steel):${NC}"
-    read -e artist_path
+    local artist_path=""
+    if check_fzf && [[ -n "$(library_cmd artists | head -1)" ]]; then
+        echo -e "${BLUE}Pick an artist from your library (Esc to enter a path)...${NC}\n"
+        artist_path=$(pick_library_artist) || artist_path=""
+    fi
+    
+    if [[ -z "$artist_path" ]]; then
+        echo -e "${BLUE}Enter artist path (e.g., /Volumes/Eksternal/Audio/Metal/C/Cold Steel):${NC}"
+        read -e artist_path
+    fi
     
     if [[ -z "$artist_path" ]] || [[ "$artist_path" == "q" ]]; then
         return 0
@@ -958,7 +1011,7 @@ upload_audio_files_artist() {
     local idx=$((choice - 1))
     if [[ $idx -ge 0 ]] && [[ $idx -lt ${#artists[@]} ]]; then
         local artist_name="${artists[$idx]}"
-        local artist_path=$(find /Volumes/Eksternal/Audio -type d -name "$artist_name" -maxdepth 4 2>/dev/null | head -1)
+        local artist_path=$(find_artist_path "$artist_name")
         
         if [[ -z "$artist_path" ]]; then
             read -e -p "Enter artist path: " artist_path
@@ -1961,6 +2014,8 @@ advanced_tools_submenu() {
 
 # Batch URL Upload
 batch_url_upload() {
+    # Bulk upload: yields to one-off uploads started meanwhile
+    local -x GHU_PRIORITY=queue
     print_header
     echo -e "${BOLD}Batch URL Upload${NC}\n"
     echo -e "${DIM}Upload multiple URLs at once${NC}\n"
@@ -2143,6 +2198,24 @@ except Exception as e:
 PYTHON
 )
 
+    # Images: also look for the same picture under another name, size or quality
+    local similar_url=""
+    case "${filename##*.}" in
+        png|PNG|jpg|JPG|jpeg|JPEG|webp|WEBP|tif|tiff|bmp|heic|HEIC|avif)
+            local similar
+            similar=$("$GHU" dupes check "$file_path" 2>/dev/null || true)
+            if [[ -n "$similar" ]]; then
+                echo -e "${YELLOW}Visually similar uploads:${NC}\n"
+                while IFS=$'\t' read -r _ dist url; do
+                    echo -e "  distance $dist  ${BLUE}$url${NC}"
+                    [[ -z "$similar_url" ]] && similar_url="$url"
+                done <<< "$similar"
+                echo
+                found="$found true"
+            fi
+            ;;
+    esac
+
     if [[ "$found" == *"true"* ]]; then
         echo -e "${BOLD}Options:${NC}"
         echo -e "  ${GREEN}1)${NC}  Upload anyway (will create duplicate)"
@@ -2159,6 +2232,7 @@ PYTHON
             2)
                 # Copy first match URL to clipboard
                 local url=$(python3 -c "import json; items = json.load(open('$RECENT_FILE')); matches = [i for i in items if i.get('filename') == '$filename']; print(matches[-1]['url'] if matches else '')")
+                [[ -z "$url" ]] && url="$similar_url"
                 if [[ -n "$url" ]]; then
                     echo "$url" | pbcopy
                     echo -e "${GREEN}✓ URL copied to clipboard!${NC}"
@@ -3535,6 +3609,8 @@ EOF
 # Process upload queue with progress indicators
 process_upload_queue() {
     local queue_file="$1"
+    # Bulk upload: yields to one-off uploads started meanwhile
+    local -x GHU_PRIORITY=queue
 
     local total=$(python3 -c "import json; q=json.load(open('$queue_file')); print(len([x for x in q if x.get('status')=='pending']))" 2>/dev/null || echo "0")
 
@@ -3722,6 +3798,9 @@ EOF
 
 # Main menu loop
 main() {
+    # Refresh the library catalog in the background so artist pickers stay current
+    ( library_cmd scan >/dev/null 2>&1 & )
+
     while true; do
         print_header
         print_menu
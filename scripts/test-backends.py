@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""End-to-end check of the git-push and LFS backends against a temporary bare repo and a local LFS server
+
+Usage:
+  python3 scripts/test-backends.py [--keep]
+
+Needs only git and Python: nothing is sent to GitHub. The LFS part covers the batch request, the
+object PUT and the verify call; committing the pointer files goes through the GitHub API and is
+not exercised here.
+"""
+import argparse
+import hashlib
+import http.server
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+# Keep config, caches and metrics of this run out of the real ~/.config/ghuploader
+WORK = tempfile.mkdtemp(prefix="gupload_backends_")
+os.environ["HOME"] = WORK
+os.environ.pop("GHU_PRIORITY", None)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ghu_gitpush  # noqa: E402
+import ghu_lfs  # noqa: E402
+from ghuploader import git_blob_sha  # noqa: E402
+
+failures = []
+
+def check(ok, what):
+    print(f"{'✓' if ok else '✗'} {what}")
+    if not ok:
+        failures.append(what)
+
+def make_files(folder, names):
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for name in names:
+        path = os.path.join(folder, name)
+        with open(path, "wb") as f:
+            f.write(f"{name}\n".encode("utf-8") + os.urandom(2048))
+        paths.append(path)
+    return paths
+
+def remote_tree(remote, branch):
+    out = subprocess.run(["git", "--git-dir", remote, "ls-tree", "-r", branch], check=True,
+                         capture_output=True, text=True).stdout
+    tree = {}
+    for line in out.splitlines():
+        meta, path = line.split("\t", 1)
+        tree[path] = meta.split()[2]
+    return tree
+
+def test_gitpush():
+    print("=== git-push backend ===")
+    remote = os.path.join(WORK, "remote.git")
+    subprocess.run(["git", "init", "--bare", "--quiet", "--initial-branch=main", remote], check=True)
+    cfg = {"owner": "test", "repo": "backends", "branch": "main", "git_remote_url": remote,
+           "git_author_name": "Backend Test", "git_author_email": "test@example.com"}
+
+    first = make_files(os.path.join(WORK, "push1"), ["a.jpg", "b.mp3"])
+    items = [(p, f"Uploads/Images/{os.path.basename(p)}", "Images") for p in first]
+    urls, errors = ghu_gitpush.push_files(cfg, None, items)
+    check(not errors and len(urls) == 2, f"push into an empty repo ({errors or 'no errors'})")
+    tree = remote_tree(remote, "main")
+    check(all(tree.get(r) == git_blob_sha(p) for p, r, _ in items), "pushed blobs match the local files")
+
+    second = make_files(os.path.join(WORK, "push2"), ["c.png"])
+    urls, errors = ghu_gitpush.push_files(cfg, None, [(second[0], "Uploads/Images/c.png", "Images")])
+    tree = remote_tree(remote, "main")
+    check(not errors and len(tree) == 3, "second push builds on the first commit")
+
+    # Runs on two branches and a second run on main share the one local clone at the same time
+    runs = [("main", "d.jpg"), ("other", "e.jpg"), ("main", "f.jpg")]
+    results = [None] * len(runs)
+
+    def run(i):
+        branch, name = runs[i]
+        path = make_files(os.path.join(WORK, f"run{i}"), [name])[0]
+        results[i] = ghu_gitpush.push_files({**cfg, "branch": branch}, None,
+                                            [(path, f"Uploads/Images/{name}", "Images")])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(runs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    check(all(r and not r[1] for r in results), "concurrent pushes through the shared clone all succeed")
+    main_tree, other_tree = remote_tree(remote, "main"), remote_tree(remote, "other")
+    check({"Uploads/Images/d.jpg", "Uploads/Images/f.jpg"} <= set(main_tree) and len(main_tree) == 5,
+          "main has every file pushed to it")
+    check(set(other_tree) == {"Uploads/Images/e.jpg"}, "the other branch only has its own file")
+
+def test_fanout_index():
+    print("=== fan-out index (git-push) ===")
+    import ghu_fanout
+    remote = os.path.join(WORK, "fanout.git")
+    subprocess.run(["git", "init", "--bare", "--quiet", "--initial-branch=main", remote], check=True)
+    cfg = {"owner": "test", "repo": "fanout", "branch": "main", "git_remote_url": remote, "fanout": "hash",
+           "git_cache_dir": os.path.join(WORK, "fanout-cache.git")}
+    folder = "Uploads/Images/Covers"
+    # Two names in the same prefix folder, pushed by separate runs: the second must keep the first
+    first = "cover-0.jpg"
+    bucket = ghu_fanout.bucket_dirs(cfg, first)
+    second = next(f"cover-{i}.jpg" for i in range(1, 10000) if ghu_fanout.bucket_dirs(cfg, f"cover-{i}.jpg") == bucket)
+    for name in (first, second):
+        path = make_files(os.path.join(WORK, "fanout"), [name])[0]
+        remote_path = ghu_fanout.place(cfg, folder, name, "Images")
+        _, errors = ghu_gitpush.push_files(cfg, None, [(path, remote_path, "Images")])
+        check(not errors, f"push {remote_path} ({errors or 'no errors'})")
+    index_path = ghu_fanout.index_path(cfg, folder, first)
+    tree = remote_tree(remote, "main")
+    check(len(tree) == 3 and index_path in tree, "files and their prefix-folder index are in one tree")
+    index = json.loads(subprocess.run(["git", "--git-dir", remote, "cat-file", "blob", tree.get(index_path, "")],
+                                      capture_output=True, text=True).stdout or "{}")
+    check(set(index) == {first, second}, "the index keeps names from both pushes")
+    log = subprocess.run(["git", "--git-dir", remote, "rev-list", "--count", "main"],
+                         capture_output=True, text=True).stdout.strip()
+    check(log == "2", "no separate index commits")
+
+class LFSStub(http.server.BaseHTTPRequestHandler):
+    """Minimal LFS batch API (basic transfer adapter) keeping objects in memory."""
+    objects = {}
+    verified = set()
+
+    def reply(self, status, data=None):
+        body = json.dumps(data).encode("utf-8") if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", ghu_lfs.LFS_MEDIA_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        req = json.loads(self.rfile.read(int(self.headers["Content-Length"])) or b"{}")
+        base = f"http://{self.headers['Host']}"
+        if self.path == "/objects/batch":
+            out = []
+            for obj in req.get("objects", []):
+                entry = {"oid": obj["oid"], "size": obj["size"]}
+                if obj["oid"] not in self.objects:
+                    entry["actions"] = {"upload": {"href": f"{base}/objects/{obj['oid']}"},
+                                        "verify": {"href": f"{base}/verify"}}
+                out.append(entry)
+            self.reply(200, {"transfer": "basic", "objects": out})
+        elif self.path == "/verify":
+            data = self.objects.get(req.get("oid"))
+            ok = data is not None and len(data) == req.get("size")
+            if ok:
+                self.verified.add(req["oid"])
+            self.reply(200 if ok else 404, {})
+        else:
+            self.reply(404, {"message": "not found"})
+
+    def do_PUT(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        oid = self.path.rsplit("/", 1)[-1]
+        if hashlib.sha256(data).hexdigest() != oid:
+            self.reply(422, {"message": "oid mismatch"})
+            return
+        self.objects[oid] = data
+        self.reply(200)
+
+    def log_message(self, *args):
+        pass
+
+def test_lfs():
+    print("=== LFS backend ===")
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), LFSStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        cfg = {"owner": "test", "repo": "backends", "lfs_url": f"http://127.0.0.1:{server.server_port}/"}
+        endpoint = ghu_lfs.lfs_endpoint(cfg)
+        headers = ghu_lfs.lfs_auth_headers(cfg, "token")
+        paths = make_files(os.path.join(WORK, "lfs"), ["big1.flac", "big2.flac"])
+        # Larger than the scheduler's streaming threshold, so the body goes through ThrottledReader too
+        with open(paths[1], "ab") as f:
+            f.write(os.urandom(512 * 1024))
+        by_oid = {ghu_lfs.sha256_file(p): p for p in paths}
+
+        objects = ghu_lfs.batch_upload_request(endpoint, headers, list(by_oid))
+        check(len(objects) == 2 and all("upload" in o.get("actions", {}) for o in objects),
+              "batch request asks for both objects")
+        for obj in objects:
+            ghu_lfs.transfer_object(obj, by_oid[(obj["oid"], obj["size"])])
+        check(set(LFSStub.objects) == {oid for oid, _ in by_oid}, "objects stored under their SHA-256")
+        check(LFSStub.verified == set(LFSStub.objects), "every upload verified")
+
+        again = ghu_lfs.batch_upload_request(endpoint, headers, list(by_oid))
+        check(all(not o.get("actions") for o in again), "objects the server has are not sent again")
+        pointer = ghu_lfs.pointer_text(*next(iter(by_oid)))
+        check(pointer.startswith("version https://git-lfs.github.com/spec/v1\noid sha256:"), "pointer file format")
+    finally:
+        server.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the git-push and LFS backends locally")
+    parser.add_argument("--keep", action="store_true", help=f"Keep the work folder ({WORK})")
+    args = parser.parse_args()
+    try:
+        test_gitpush()
+        test_fanout_index()
+        test_lfs()
+    finally:
+        if args.keep:
+            print(f"Work folder: {WORK}")
+        else:
+            shutil.rmtree(WORK, ignore_errors=True)
+    print()
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("All checks passed")
+
+if __name__ == "__main__":
+    main()
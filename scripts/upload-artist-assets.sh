@@ -167,8 +167,8 @@ fi
 
 echo -e "\n${BLUE}Uploading files...${NC}\n"
 
-# Upload all files
-"$GHU" "${FILES[@]}"
+# Upload all files (as a queue job unless the caller chose a class)
+GHU_PRIORITY="${GHU_PRIORITY:-queue}" "$GHU" "${FILES[@]}"
 
 EXIT_CODE=$?
 